@@ -12,7 +12,7 @@
 import logging_config
 import modules.exceptions as exceptions
 import settings
-from modules import image_storage, initialize_data, models, utilities
+from modules import image_storage, initialize_data, leaderboard_cache, models, utilities
 
 logger = logging.getLogger('polybot.' + __name__)
 # https://discord.com/channels/336642139381301249/1042604006226280468/1042645381143613532
@@ -24,6 +24,9 @@ def configure_runtime_arguments(args: List[str] = None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--add_default_data', action='store_true')
     parser.add_argument('--recalc_elo', action='store_true')
+    parser.add_argument('--dry_run', action='store_true', help='With --recalc_elo, write a diff report instead of changing ELO')
+    parser.add_argument('--resume', action='store_true', help='With --recalc_elo, continue from the latest ELO checkpoint')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes used by --recalc_elo, eg. the number of CPUs')
     parser.add_argument('--game_export', action='store_true')
     parser.add_argument('--skip_tasks', action='store_true')
     # Ignore extra args from uvicorn.
@@ -40,10 +43,18 @@ def main(args: List[str] = None):
     if args.add_default_data:
         initialize_data.initialize_data()
         exit(0)
+    if args.recalc_elo and args.dry_run:
+        from modules import elo_replay
+        print('Recalculating all ELO (dry run)')
+        start = timer()
+        filename = 'elo_recalc_diff.csv.gz'
+        changes = elo_replay.dry_run_all(filename=filename)
+        print(f'Dry run complete - {changes} values would change, see {filename}. Took {timer() - start} seconds.')
+        exit(0)
     if args.recalc_elo:
         print('Recalculating all ELO')
         start = timer()
-        models.Game.recalculate_all_elo()
+        models.Game.recalculate_all_elo(resume=args.resume, processes=args.processes)
         end = timer()
         print(f'Recalculation complete - took {end - start} seconds.')
         exit(0)
@@ -53,8 +64,20 @@ def main(args: List[str] = None):
         utilities.export_game_data()
         print(f'Recalculation complete - took {timer() - start} seconds.')
         exit(0)
+    with models.db:
+        interrupted = models.EloCheckpoint.interrupted_run()
+    if interrupted:
+        # Game results were written up to this checkpoint but ratings were not, so they disagree until the run finishes
+        message = (f'An ELO recalculation stopped after game {interrupted.game_id} ({interrupted.completed_ts}) without writing '
+                   f'ratings. Finish it with --recalc_elo --resume (or redo it with --recalc_elo) before starting the bot.')
+        logger.error(message)
+        print(message)
+        exit(1)
+
     logger.info('Resetting Discord ID ban list')
     with models.db:
+        previously_banned = {member_id for member_id, in models.DiscordMember.select(models.DiscordMember.id).where(
+            models.DiscordMember.is_banned == 1).tuples()}
         models.DiscordMember.update(is_banned=False).execute()
         if settings.discord_id_ban_list:
             query = models.DiscordMember.update(is_banned=True).where(
@@ -68,6 +91,18 @@ def main(args: List[str] = None):
             )
             logger.info(f'{query.execute()} polytopia IDs are banned')
 
+        # Stored leaderboards leave banned members off, so re-read the members whose ban changed on every board
+        banned = {member_id for member_id, in models.DiscordMember.select(models.DiscordMember.id).where(
+            models.DiscordMember.is_banned == 1).tuples()}
+        changed = list(banned ^ previously_banned)
+        if changed:
+            models.Leaderboard.refresh(
+                players=models.Player.select().where(models.Player.discord_member.in_(changed)),
+                discord_members=models.DiscordMember.select().where(models.DiscordMember.id.in_(changed)),
+            )
+            leaderboard_cache.invalidate()
+            logger.info(f'Leaderboards refreshed for {len(changed)} members whose ban status changed')
+
 class MyBot(commands.Bot):
     intents = discord.Intents.default()
     intents.members = True
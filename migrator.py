@@ -3,7 +3,6 @@
 from playhouse.postgres_ext import *
 import logging
 from logging.handlers import RotatingFileHandler
-import modules.models as models
 
 # http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
 handler = RotatingFileHandler(filename='discord.log', encoding='utf-8', maxBytes=500 * 1024, backupCount=1)
@@ -23,8 +22,10 @@
 
 logger = logging.getLogger('polybot.' + __name__)
 
-# db = PostgresqlExtDatabase(settings.psql_db, user=settings.psql_user, autoconnect=True)
-db = models.db
+# models.py creates missing tables and indexes when it is imported, so migrations that touch indexed columns run before that
+db = PostgresqlExtDatabase(settings.psql_db, user=settings.psql_user, password=settings.psql_password,
+                           host=settings.psql_host, port=settings.psql_port, autoconnect=True)
+# db = models.db
 migrator = PostgresqlMigrator(db)
 db.connect(reuse_if_open=True)
 
@@ -88,7 +89,17 @@
 # league_season = SmallIntegerField(default=None, null=True)
 # league_playoff = BooleanField(default=False)
 # house_name = TextField(unique=True, default='')
-map_type = TextField(null=False, default='')
+
+# Pending migrations as (table, column, field)
+new_columns = (
+    ('game', 'map_type', TextField(null=False, default='')),
+    ('player', 'completed_games', SmallIntegerField(default=0)),
+    ('player', 'completed_games_moonrise', SmallIntegerField(default=0)),
+    ('discordmember', 'completed_games', SmallIntegerField(default=0)),
+    ('discordmember', 'completed_games_moonrise', SmallIntegerField(default=0)),
+    ('squad', 'member_ids', ArrayField(IntegerField, null=True)),
+    ('gamelog', 'game_id', IntegerField(null=True, default=None)),
+)
 
 migrate(
     # migrator.add_column('discordmember', 'elo_max', elo_max),
@@ -137,8 +148,72 @@
     # migrator.add_column('game', 'league_playoff', league_playoff),
     # migrator.add_column('game', 'league_season', league_season),
 
-    migrator.add_column('game', 'map_type', map_type),
+    # Pending columns, skipped if they already exist so the whole migrator can be run again
+    *[migrator.add_column(table, column, field) for table, column, field in new_columns
+      if column not in {c.name for c in db.get_columns(table)}],
+)
 
+# Backfills that only need the new columns. Each one only fills in rows that are still empty
+with db.atomic():
+    # squad.member_ids from squadmember. If several squads have the same players only the oldest gets the signature,
+    # since it has a unique index
+    cursor = db.execute_sql('''
+        UPDATE squad SET member_ids = oldest.ids FROM (
+            SELECT DISTINCT ON (ids) squad_id, ids FROM (
+                SELECT squad_id, array_agg(player_id ORDER BY player_id) AS ids FROM squadmember GROUP BY squad_id
+            ) AS signatures ORDER BY ids, squad_id
+        ) AS oldest
+        WHERE squad.id = oldest.squad_id AND squad.member_ids IS NULL
+            AND NOT EXISTS (SELECT 1 FROM squad AS signed WHERE signed.member_ids = oldest.ids)
+    ''')
+    print(f'{cursor.rowcount} squad signatures backfilled')
+
+    # gamelog.game_id from the __game_id__ prefix that GameLog.write() puts on game entries
+    cursor = db.execute_sql('''
+        UPDATE gamelog SET game_id = substring(message FROM '^__([0-9]+)__')::integer
+        WHERE game_id IS NULL AND message ~ '^__[0-9]+__'
+    ''')
+    print(f'{cursor.rowcount} gamelog game_ids backfilled')
+
+# Indexes on existing tables. models.py would also create most of them on import, but without CONCURRENTLY that blocks
+# writes to the table while each is built. Same names as models.py uses, so the import then finds them in place.
+# CONCURRENTLY can't run in a transaction, so these are outside db.atomic()
+new_indexes = (
+    ('game_guild_id_is_completed_is_confirmed_completed_ts', 'game', 'btree', 'guild_id, is_completed, is_confirmed, completed_ts'),
+    ('lineup_player_id_game_id', 'lineup', 'btree', 'player_id, game_id'),
+    ('gameside_team_id_game_id', 'gameside', 'btree', 'team_id, game_id'),
+    ('gamelog_guild_id_message_ts', 'gamelog', 'btree', 'guild_id, message_ts'),
+    ('gamelog_game_id_message_ts', 'gamelog', 'btree', 'game_id, message_ts'),
+    ('squad_member_ids', 'squad', 'gin', 'member_ids'),
+    ('squad_member_ids_unique', 'squad', 'btree', 'member_ids'),
 )
+for index_name, table, method, columns in new_indexes:
+    unique = 'UNIQUE ' if index_name.endswith('_unique') else ''
+    db.execute_sql(f'CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS "{index_name}" ON "{table}" USING {method} ({columns})')
+    print(f'{index_name} index created')
+
+# Trigram indexes for the ILIKE '%word%' matches of GameLog.search() keywords and Game.search() titles, if the server has
+# pg_trgm. Not declared in models.py so that installs without the extension still start
+trigram_indexes = (('gamelog_message_trgm', 'gamelog', 'message'), ('game_name_trgm', 'game', 'name'), ('game_notes_trgm', 'game', 'notes'))
+if db.execute_sql("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'").fetchone():
+    db.execute_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index_name, table, column in trigram_indexes:
+        db.execute_sql(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table} USING gin ({column} gin_trgm_ops)')
+        print(f'{index_name} index created')
+else:
+    print(f'pg_trgm is not available - skipped {", ".join(name for name, _, _ in trigram_indexes)}')
+
+import modules.models as models  # noqa: E402 creates the new tables (elo_ledger, leaderboard, stats rollups...) and any other missing indexes
+from modules import elo_replay  # noqa: E402
+
+# Backfills that go through the models, now that every column they read is in place
+# completed_games counters from existing games. Only rows that are out of step are written
+print(f'{elo_replay.check_completed_games(fix=True)} completed_games counters filled in')
+
+# elo_ledger from the existing Lineup/GameSide ELO columns. Only while it is empty - once games are declared with the
+# ledger in place it is the source of truth for recalculate_since()
+if not models.EloLedger.select().exists():
+    with models.db.atomic():
+        print(f'{elo_replay.backfill_ledger()} elo_ledger rows backfilled')
 
 print('done')
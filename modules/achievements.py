@@ -19,9 +19,8 @@
 async def set_champion_role():
 
     # global_champion = models.DiscordMember.select().order_by(-models.DiscordMember.elo).limit(1).get()
-    global_champion = models.DiscordMember.leaderboard(date_cutoff=settings.date_cutoff, guild_id=None, max_flag=False).limit(1).get()
-    if global_champion.elo_field == 1000:
-        global_champion = None
+    global_leaders = models.Leaderboard.get_board(date_cutoff=settings.date_cutoff).top(1)
+    global_champion = global_leaders[0] if global_leaders and global_leaders[0].board_elo != 1000 else None
 
     for guild in settings.bot.guilds:
         log_message = ''
@@ -32,9 +31,10 @@ async def set_champion_role():
             continue
 
         # local_champion = models.Player.select().where(models.Player.guild_id == guild.id).order_by(-models.Player.elo).limit(1).get()
-        local_champion = models.Player.leaderboard(date_cutoff=settings.date_cutoff, guild_id=guild.id, max_flag=False).limit(1).get()
-        if local_champion.elo_field == 1000:
+        local_leaders = models.Leaderboard.get_board(date_cutoff=settings.date_cutoff, guild_id=guild.id).top(1)
+        if not local_leaders or local_leaders[0].board_elo == 1000:
             continue
+        local_champion = local_leaders[0]
 
         local_champion_member = guild.get_member(local_champion.discord_member.discord_id)
         global_champion_member = guild.get_member(global_champion.discord_id) if global_champion else None
@@ -303,7 +303,7 @@ async def maybe_warn_game_channel_purge(self, game, guild, game_size: int, today
         if game.date < delete_cutoff or game.date > warning_cutoff:
             return
 
-        if models.GameLog.search(keywords=f'_{game.id}_ {PURGE_WARNING_MARKER}', guild_id=guild.id, limit=1).exists():
+        if models.GameLog.search(keywords=PURGE_WARNING_MARKER, game_id=game.id, guild_id=guild.id, limit=1).exists():
             return
 
         rank_str = 'ranked' if game.is_ranked else 'unranked'
@@ -522,6 +522,8 @@ async def unstart(self, ctx, game: PolyGame = None):
         tomorrow = (datetime.datetime.now() + datetime.timedelta(hours=24))
         game.expiration = tomorrow if game.expiration < tomorrow else game.expiration
         game.save()
+        models.PlayerStats.invalidate(models.Lineup.select(models.Lineup.player).where(models.Lineup.game == game))
+        models.SeasonStandings.invalidate([game.league_season])
         models.GameLog.write(game_id=game, guild_id=ctx.guild.id, message=f'{models.GameLog.member_string(ctx.author)} changed in-progress game to an open game. (`{ctx.prefix}unstart`)')
 
         await ctx.send(f'Game {game.id} is now an open game and no longer in progress.\nNotifying players: {" ".join(game.mentions())}')
@@ -1089,10 +1091,17 @@ async def recalc_games_from(self, ctx, *, arg: str = None):
         """*Owner*: Recalculate games from a specific timestamp
 
         Give a game ID, and the bot will *recalculate_elo_since* all games completed after that game was completed.
+        Add `dry` to upload a report of the ELO changes instead of saving them.
+
+        **Examples**
+        `[p]recalc_games_from 40000`
+        `[p]recalc_games_from 40000 dry`
         """
 
         import functools
-        game = models.Game.get_or_none(id=arg)
+        args = arg.split() if arg else []
+        dry_run = len(args) > 1 and args[1].upper() == 'DRY'
+        game = models.Game.get_or_none(id=args[0]) if args and args[0].isdigit() else None
         if not game:
             return await ctx.send(f'no game found for id {arg}')
 
@@ -1101,11 +1110,26 @@ async def recalc_games_from(self, ctx, *, arg: str = None):
             return await ctx.send(f'Game {game.id} is not completed. Choose a completed game.')
 
         await ctx.send('This may take a while...')
+        if dry_run:
+            import os
+            import tempfile
+            from modules import elo_replay
+            fd, filename = tempfile.mkstemp(prefix=f'elo_recalc_diff_{game.id}_', suffix='.csv.gz')
+            os.close(fd)
+            try:
+                async with ctx.typing():
+                    changes = await asyncio.get_running_loop().run_in_executor(None, functools.partial(elo_replay.dry_run_since, timestamp=game.completed_ts, filename=filename))
+                    await ctx.send(f'Dry run from {game.completed_ts} onward: {changes} values would change. Nothing was saved.',
+                                   file=discord.File(filename, filename=f'elo_recalc_diff_{game.id}.csv.gz'))
+            finally:
+                os.remove(filename)
+            return
+
         settings.recalculation_mode = True
         async with ctx.typing():
-            await asyncio.get_running_loop().run_in_executor(None, functools.partial(models.Game.recalculate_elo_since, timestamp=game.completed_ts))
+            rows_updated = await asyncio.get_running_loop().run_in_executor(None, functools.partial(models.Game.recalculate_elo_since, timestamp=game.completed_ts))
             # Allows bot to remain responsive while this large operation is running.
-            await ctx.send(f'DB has been refreshed from {game.completed_ts} onward')
+            await ctx.send(f'DB has been refreshed from {game.completed_ts} onward. {rows_updated} rows were updated.')
             settings.recalculation_mode = False
 
     @commands.command(aliases=['migrate'])
@@ -1150,6 +1174,7 @@ async def migrate_player(self, ctx, from_string: str, to_string: str):
                             # cycle through new incomplete games and switch to the old player
                             l.player = old_gm
                             l.save()
+                        models.PlayerStats.invalidate([gm.id, old_gm.id])
                     else:
                         # New account in this guild but old account not
                         # associate its player in this guild with the old account
@@ -0,0 +1,74 @@
+"""Pure ELO arithmetic shared by the replay engine.
+
+Every function here mirrors the rounding of the model methods it is named
+after (GameSide.calc_win_chance, GameSide.adjusted_elo,
+Game.get_side_win_chances, Lineup/Team/Squad.change_elo_after_game) so that
+an in-memory replay produces exactly the values declare_winner() would.
+This module has no database dependency.
+"""
+
+from typing import List, Sequence
+
+
+def calc_win_chance(my_side_elo: int, opponent_elo: int) -> float:
+    return round(1 / (1 + (10 ** ((opponent_elo - my_side_elo) / 400.0))), 3)
+
+
+def adjusted_elo(lineup_size: int, missing_players: int, own_elo: int, opponent_elos: int, calc_version: int = 1) -> int:
+    # See GameSide.adjusted_elo() - a 200 (v1) or 100 (v2) handicap "fills up" the missing players of an undersized side
+    handicap = 200 if calc_version == 1 else 100
+    handicap_elo = handicap * 2 + max(own_elo - opponent_elos - handicap, 0)
+    missing_player_elo = own_elo - handicap_elo
+    return int(round((own_elo * lineup_size + missing_player_elo * missing_players) / (lineup_size + missing_players)))
+
+
+def side_win_chances(largest_team: int, lineup_sizes: Sequence[int], side_elos: Sequence[int], calc_version: int = 1) -> List[float]:
+    # See Game.get_side_win_chances()
+    n = len(lineup_sizes)
+    sum_raw_elo = sum(side_elos)
+
+    adjusted_side_elo = []
+    for size, elo in zip(lineup_sizes, side_elos):
+        avg_opponent_elos = int(round((sum_raw_elo - elo) / (n - 1)))
+        adjusted_side_elo.append(adjusted_elo(size, largest_team - size, elo, avg_opponent_elos, calc_version))
+
+    max_elo = max(adjusted_side_elo)
+    second_elo = sorted(adjusted_side_elo)[-2]
+
+    win_chance_unnorm = []
+    for own_elo in adjusted_side_elo:
+        target_elo = second_elo if own_elo == max_elo else max_elo
+        win_chance_unnorm.append(calc_win_chance(own_elo, target_elo))
+    normalization_factor = sum(win_chance_unnorm)
+
+    return [round(chance / normalization_factor, 3) for chance in win_chance_unnorm]
+
+
+def average_elo(elo_list: Sequence[int]) -> int:
+    return int(round(sum(elo_list) / len(elo_list)))
+
+
+def player_max_delta(num_games: int) -> int:
+    if num_games < 6:
+        return 75
+    if num_games < 11:
+        return 50
+    return 32
+
+
+def squad_max_delta(num_games: int) -> int:
+    return 50 if num_games < 6 else 32
+
+
+def elo_delta(max_elo_delta: int, chance_of_winning: float, is_winner: bool) -> int:
+    if is_winner:
+        return int(round((max_elo_delta * (1 - chance_of_winning)), 0))
+    return int(round((max_elo_delta * (0 - chance_of_winning)), 0))
+
+
+def player_elo_delta(elo: int, num_games: int, chance_of_winning: float, is_winner: bool) -> int:
+    # See Lineup.change_elo_after_game() - low-ELO players get up to a 60% boost on the size of their change
+    delta = elo_delta(player_max_delta(num_games), chance_of_winning, is_winner)
+    elo_boost = .60 * ((1200 - max(min(elo, 1200), 900)) / 300)
+    return delta + int(abs(delta) * elo_boost)
+
@@ -0,0 +1,1034 @@
+"""In-memory replay of ranked game history.
+
+Game.recalculate_all_elo() used to reset every rating and then call
+Game.load_full_game() + Game.declare_winner() once per game, which costs a
+few dozen queries per game (completed_game_count() alone runs one COUNT per
+player per ELO flavour). This module loads the whole history in a handful of
+bulk queries, replays it against in-memory ratings and game counters using
+the arithmetic in modules.elo_math, and writes the results back in batches.
+The values written match the declare_winner() path row for row.
+"""
+
+import concurrent.futures
+import datetime
+import itertools
+import logging
+import multiprocessing
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from peewee import JOIN, Case, Tuple, Value, chunked, fn
+
+import settings
+from modules import elo_math, leaderboard_cache
+from modules.models import (DiscordMember, DiscordMemberStats, EloCheckpoint, EloLedger, Game, GameSide, Leaderboard, Lineup, Player,
+                            PlayerStats, SeasonStandings, Squad, Team, db)
+from modules.write_buffer import update_rows
+
+logger = logging.getLogger('polybot.' + __name__)
+elo_logger = logging.getLogger('polybot.elo')
+
+WRITE_BATCH_SIZE = 500
+CHECKPOINT_GAMES = 2000  # recalculate_all() saves a checkpoint at each month boundary, or after this many games within a month
+
+# The independent rating chains replay_game() updates. Each only reads and writes its own ratings and counters
+PARTS = ('players', 'members', 'teams', 'squads')
+
+RATING_FIELDS = ('elo', 'elo_max', 'elo_alltime', 'elo_max_alltime', 'elo_moonrise', 'elo_max_moonrise')
+TEAM_FIELDS = ('elo', 'elo_alltime')
+LINEUP_FIELDS = (
+    'elo_change_player', 'elo_change_discordmember',
+    'elo_change_player_alltime', 'elo_change_discordmember_alltime',
+    'elo_change_player_moonrise', 'elo_change_discordmember_moonrise',
+    'elo_after_game', 'elo_after_game_global',
+    'elo_after_game_alltime', 'elo_after_game_global_alltime',
+    'elo_after_game_moonrise', 'elo_after_game_global_moonrise',
+)
+GAMESIDE_FIELDS = GameSide.elo_fields
+
+# (elo_field, max_field, player change field, member change field, player after-game field, member after-game field)
+# keyed the same way as the branches of Lineup.change_elo_after_game()
+FLAVOUR_FIELDS = {
+    'moonrise': ('elo_moonrise', 'elo_max_moonrise', 'elo_change_player_moonrise', 'elo_change_discordmember_moonrise',
+                 'elo_after_game_moonrise', 'elo_after_game_global_moonrise'),
+    'alltime': ('elo_alltime', 'elo_max_alltime', 'elo_change_player_alltime', 'elo_change_discordmember_alltime',
+                'elo_after_game_alltime', 'elo_after_game_global_alltime'),
+    'local': ('elo', 'elo_max', 'elo_change_player', 'elo_change_discordmember',
+              'elo_after_game', 'elo_after_game_global'),
+}
+
+
+@dataclass
+class ReplayLineup:
+    id: int
+    player_id: int
+    member_id: int
+    is_bot: bool
+    values: Dict[str, Optional[int]]
+
+
+@dataclass
+class ReplaySide:
+    id: int
+    team_id: Optional[int]
+    squad_id: Optional[int]
+    values: Dict[str, Optional[int]]
+    lineups: List[ReplayLineup] = field(default_factory=list)
+
+
+@dataclass
+class ReplayGame:
+    id: int
+    date: datetime.date
+    guild_id: int
+    size: List[int]
+    winner_id: int
+    completed_ts: datetime.datetime
+    sides: List[ReplaySide] = field(default_factory=list)
+
+    def is_post_moonrise(self):
+        return bool(self.date >= settings.moonrise_reset_date)
+
+
+class EloState:
+    # Current ratings and ranked completed-game counters, standing in for the database during a replay.
+    # Counters are [all games, games dated on or after the moonrise reset] to match completed_game_count(moonrise=...)
+
+    def __init__(self, default_elo: int = 1000, bot_elo: int = 0):
+        self.default_elo = default_elo
+        self.bot_elo = bot_elo
+        self.players = {}
+        self.members = {}
+        self.teams = {}
+        self.squads = {}
+        self.player_games = defaultdict(lambda: [0, 0])
+        self.member_games = defaultdict(lambda: [0, 0])
+        self.squad_games = defaultdict(int)
+        # {(entity_type, entity_id, flavour, game id): (elo_before, elo_after, elo_delta)}, as EloLedger.record() would write them
+        self.ledger = {}
+
+    def rating(self, table: dict, record_id: int, is_bot: bool = False):
+        try:
+            return table[record_id]
+        except KeyError:
+            elo = self.bot_elo if is_bot else self.default_elo
+            table[record_id] = record = dict.fromkeys(RATING_FIELDS, elo)
+            return record
+
+    def team(self, team_id: int):
+        try:
+            return self.teams[team_id]
+        except KeyError:
+            self.teams[team_id] = record = dict.fromkeys(TEAM_FIELDS, self.default_elo)
+            return record
+
+    def squad(self, squad_id: int):
+        return self.squads.setdefault(squad_id, self.default_elo)
+
+    def as_json(self) -> dict:
+        # Compact form for EloCheckpoint.state: a list of [id, *values] rows per table
+        return {
+            'players': [[record_id, *(r[f] for f in RATING_FIELDS)] for record_id, r in self.players.items()],
+            'members': [[record_id, *(r[f] for f in RATING_FIELDS)] for record_id, r in self.members.items()],
+            'teams': [[team_id, *(r[f] for f in TEAM_FIELDS)] for team_id, r in self.teams.items()],
+            'squads': list(self.squads.items()),
+            'player_games': [[record_id, *counts] for record_id, counts in self.player_games.items()],
+            'member_games': [[record_id, *counts] for record_id, counts in self.member_games.items()],
+            'squad_games': list(self.squad_games.items()),
+        }
+
+    def merge(self, tables: dict):
+        # Apply a {table attribute: {id: value}} snapshot from replay_chain()
+        for table, values in tables.items():
+            getattr(self, table).update(values)
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'EloState':
+        state = cls()
+        state.players = {record_id: dict(zip(RATING_FIELDS, values)) for record_id, *values in data['players']}
+        state.members = {record_id: dict(zip(RATING_FIELDS, values)) for record_id, *values in data['members']}
+        state.teams = {team_id: dict(zip(TEAM_FIELDS, values)) for team_id, *values in data['teams']}
+        state.squads = dict(data['squads'])
+        state.player_games.update({record_id: counts for record_id, *counts in data['player_games']})
+        state.member_games.update({record_id: counts for record_id, *counts in data['member_games']})
+        state.squad_games.update(dict(data['squad_games']))
+        return state
+
+
+def replayable_games():
+    # Matches the set of games recalculate_all_elo() resets and re-declares
+    return (
+        (Game.is_ranked == 1) & (Game.winner.is_null(False)) & (Game.completed_ts.is_null(False)) &
+        ((Game.is_confirmed == 1) | (Game.is_completed == 0))
+    )
+
+
+def load_games(where) -> List[ReplayGame]:
+    # Three queries: games, their sides and their lineups, assembled in completed_ts order
+    games, by_id = [], {}
+    game_rows = Game.select(
+        Game.id, Game.date, Game.guild_id, Game.size, Game.winner, Game.completed_ts
+    ).where(where).order_by(Game.completed_ts, Game.id).tuples()
+
+    for game_id, date, guild_id, size, winner_id, completed_ts in game_rows:
+        game = ReplayGame(id=game_id, date=date, guild_id=guild_id, size=list(size), winner_id=winner_id, completed_ts=completed_ts)
+        games.append(game)
+        by_id[game_id] = game
+
+    if not games:
+        return games
+
+    game_subq = Game.select(Game.id).where(where)
+    sides = {}
+    side_rows = GameSide.select(
+        GameSide.id, GameSide.game, GameSide.team, GameSide.squad, *[getattr(GameSide, f) for f in GAMESIDE_FIELDS]
+    ).where(GameSide.game.in_(game_subq)).order_by(GameSide.position, GameSide.id).tuples()
+
+    for side_id, game_id, team_id, squad_id, *values in side_rows:
+        side = ReplaySide(id=side_id, team_id=team_id, squad_id=squad_id, values=dict(zip(GAMESIDE_FIELDS, values)))
+        sides[side_id] = side
+        by_id[game_id].sides.append(side)
+
+    bot_ids = [settings.bot_id, settings.bot_id_beta]
+    lineup_rows = Lineup.select(
+        Lineup.id, Lineup.gameside, Lineup.player, Player.discord_member, DiscordMember.discord_id, *[getattr(Lineup, f) for f in LINEUP_FIELDS]
+    ).join(Player).join(DiscordMember).where(Lineup.game.in_(game_subq)).order_by(Lineup.id).tuples()
+
+    for lineup_id, side_id, player_id, member_id, discord_id, *values in lineup_rows:
+        sides[side_id].lineups.append(
+            ReplayLineup(id=lineup_id, player_id=player_id, member_id=member_id, is_bot=discord_id in bot_ids, values=dict(zip(LINEUP_FIELDS, values)))
+        )
+
+    return games
+
+
+def counted_games():
+    # Games that count towards Player/DiscordMember.completed_games
+    return (Game.is_completed == 1) & (Game.is_confirmed == 1) & (Game.is_ranked == 1)
+
+
+def pending_games():
+    # Completed ranked games awaiting confirmation. They are not on the completed_games counters, since declare_winner()
+    # has not applied their ELO yet, but count towards the max_elo_delta thresholds as they did in completed_game_count()
+    return (Game.is_completed == 1) & (Game.is_confirmed == 0) & (Game.is_ranked == 1)
+
+
+def completed_game_queries(where=None, games=None):
+    # (player query, member query) yielding (id, games, moonrise games) rows grouped from Lineup. games defaults to counted_games()
+    moonrise_case = Case(None, [(Game.date >= settings.moonrise_reset_date, 1)], 0)
+    games = counted_games() if games is None else games
+    where = games if where is None else games & where
+
+    player_query = Lineup.select(
+        Lineup.player.alias('record_id'), fn.COUNT(Lineup.id).alias('games'), fn.SUM(moonrise_case).alias('moonrise_games')
+    ).join(Game).where(where).group_by(Lineup.player)
+    member_query = Lineup.select(
+        Player.discord_member.alias('record_id'), fn.COUNT(Lineup.id).alias('games'), fn.SUM(moonrise_case).alias('moonrise_games')
+    ).join(Game).join_from(Lineup, Player).where(
+        where & (Game.guild_id.in_(settings.servers_included_in_global_lb()))
+    ).group_by(Player.discord_member)
+    return player_query, member_query
+
+
+def pending_game_counts(game: Game) -> dict:
+    # {Player: {id: [games, moonrise games]}, DiscordMember: {...}} of the pending_games() of the players in `game`,
+    # for declare_winner() to add to their completed_games counters
+    player_ids = [lineup.player_id for lineup in game.lineup]
+    member_ids = Player.select(Player.discord_member).where(Player.id.in_(player_ids))
+    player_query, member_query = completed_game_queries(games=pending_games())
+    return {
+        Player: {record_id: [count, int(moonrise_count)] for record_id, count, moonrise_count in player_query.where(Lineup.player.in_(player_ids)).tuples()},
+        DiscordMember: {record_id: [count, int(moonrise_count)]
+                        for record_id, count, moonrise_count in member_query.where(Player.discord_member.in_(member_ids)).tuples()},
+    }
+
+
+def load_completed_game_counts(state: EloState, replay_filter):
+    # Seed the counters with the completed games that are not part of the replay, including pending_games()
+    not_replayed = Game.id.not_in(Game.select(Game.id).where(replay_filter))
+    player_query, member_query = completed_game_queries(not_replayed, games=counted_games() | pending_games())
+
+    for player_id, count, moonrise_count in player_query.tuples():
+        state.player_games[player_id] = [count, int(moonrise_count)]
+    for member_id, count, moonrise_count in member_query.tuples():
+        state.member_games[member_id] = [count, int(moonrise_count)]
+
+    squad_base = (Game.is_completed == 1) & (Game.is_ranked == 1) & not_replayed
+    squad_rows = GameSide.select(GameSide.squad, fn.COUNT(GameSide.id)).join(Game).where(squad_base & GameSide.squad.is_null(False)).group_by(GameSide.squad).tuples()
+    for squad_id, count in squad_rows:
+        state.squad_games[squad_id] = count
+
+
+def replay_game(game: ReplayGame, state: EloState, global_guilds, parts=PARTS) -> bool:
+    # In-memory equivalent of Game.declare_winner(confirm=True) for a ranked game.
+    # Mutates state and the ReplaySide/ReplayLineup values. Returns False if the game is skipped the way declare_winner() skips it.
+    # `parts` limits the replay to some of the independent rating chains - see replay_parallel()
+
+    if min(game.size) <= 0:
+        logger.error(f'Cannot replay game {game.id}: Side with 0 players detected.')
+        return False
+
+    sides = game.sides
+    largest_side = max(game.size)
+    lineup_sizes = [len(s.lineups) for s in sides]
+    post_moonrise = game.is_post_moonrise()
+    local_flavour = 'moonrise' if post_moonrise else 'local'
+    local_field = 'elo_moonrise' if post_moonrise else 'elo'
+    replay_players = 'players' in parts
+    replay_members = 'members' in parts and game.guild_id in global_guilds
+    replay_teams = 'teams' in parts and min(game.size) > 1 and game.date >= datetime.datetime.strptime(settings.team_elo_reset_date, "%m/%d/%Y").date()
+    replay_teams_alltime = 'teams' in parts and min(game.size) > 1
+    replay_squads = 'squads' in parts and min(game.size) > 1
+
+    if game.date >= settings.elo_calc_v2_date:
+        calc_version = 2
+        host_bonus = 50 if game.size[0] == 1 else 0
+    else:
+        calc_version, host_bonus = 1, 0
+
+    def chances(elos, host_bonus=0):
+        if host_bonus:
+            elos = [elos[0] + host_bonus] + elos[1:]
+        return elo_math.side_win_chances(largest_side, lineup_sizes, elos, calc_version)
+
+    def side_average(table, key, elo_field):
+        return [elo_math.average_elo([table[getattr(l, key)][elo_field] for l in s.lineups]) for s in sides]
+
+    def change(lineup, record, flavour, chance, is_winner, by_discord_member, num_games):
+        elo_field, max_field, player_change, member_change, player_after, member_after = FLAVOUR_FIELDS[flavour]
+        delta = elo_math.player_elo_delta(record[elo_field], num_games, chance, is_winner)
+        if lineup.is_bot:
+            return
+        new_elo = int(record[elo_field] + delta)
+        entity = ('discordmember', lineup.member_id) if by_discord_member else ('player', lineup.player_id)
+        state.ledger[(*entity, elo_field, game.id)] = (record[elo_field], new_elo, delta)
+        record[elo_field] = new_elo
+        if new_elo > record[max_field]:
+            record[max_field] = new_elo
+        lineup.values[member_change if by_discord_member else player_change] = delta
+        lineup.values[member_after if by_discord_member else player_after] = new_elo
+
+    # declare_winner() works on model instances loaded when the game starts, so snapshot ratings the same way
+    if replay_players:
+        player_start = {l.player_id: dict(state.rating(state.players, l.player_id, l.is_bot)) for s in sides for l in s.lineups}
+        side_win_chances = chances(side_average(player_start, 'player_id', local_field), host_bonus)
+        side_win_chances_alltime = chances(side_average(player_start, 'player_id', 'elo_alltime'), host_bonus)
+        for i, side in enumerate(sides):
+            is_winner = side.id == game.winner_id
+            for lineup in side.lineups:
+                player = dict(player_start[lineup.player_id])
+                player_games = state.player_games[lineup.player_id]
+                change(lineup, player, 'alltime', side_win_chances_alltime[i], is_winner, False, player_games[0])
+                change(lineup, player, local_flavour, side_win_chances[i], is_winner, False, player_games[1 if post_moonrise else 0])
+                state.players[lineup.player_id] = player
+
+    if replay_members:
+        member_start = {l.member_id: dict(state.rating(state.members, l.member_id, l.is_bot)) for s in sides for l in s.lineups}
+        side_win_chances_discord = chances(side_average(member_start, 'member_id', local_field), host_bonus)
+        side_win_chances_discord_alltime = chances(side_average(member_start, 'member_id', 'elo_alltime'), host_bonus)
+        for i, side in enumerate(sides):
+            is_winner = side.id == game.winner_id
+            for lineup in side.lineups:
+                member = dict(member_start[lineup.member_id])
+                member_games = state.member_games[lineup.member_id]
+                change(lineup, member, 'alltime', side_win_chances_discord_alltime[i], is_winner, True, member_games[0])
+                change(lineup, member, local_flavour, side_win_chances_discord[i], is_winner, True, member_games[1 if post_moonrise else 0])
+                state.members[lineup.member_id] = member
+
+    if (replay_teams or replay_teams_alltime) and all(s.team_id for s in sides):
+        team_start = {s.team_id: dict(state.team(s.team_id)) for s in sides}
+        team_win_chances = chances([team_start[s.team_id]['elo'] for s in sides]) if replay_teams else None
+        team_win_chances_alltime = chances([team_start[s.team_id]['elo_alltime'] for s in sides])
+        for i, side in enumerate(sides):
+            is_winner = side.id == game.winner_id
+            team = dict(team_start[side.team_id])
+            if team_win_chances:
+                delta = elo_math.elo_delta(32, team_win_chances[i], is_winner)
+                state.ledger[('team', side.team_id, 'elo', game.id)] = (team['elo'], int(team['elo'] + delta), delta)
+                team['elo'] = int(team['elo'] + delta)
+                side.values['elo_change_team'] = delta
+                side.values['team_elo_after_game'] = team['elo']
+            delta = elo_math.elo_delta(32, team_win_chances_alltime[i], is_winner)
+            state.ledger[('team', side.team_id, 'elo_alltime', game.id)] = (team['elo_alltime'], int(team['elo_alltime'] + delta), delta)
+            team['elo_alltime'] = int(team['elo_alltime'] + delta)
+            side.values['elo_change_team_alltime'] = delta
+            side.values['team_elo_after_game_alltime'] = team['elo_alltime']
+            state.teams[side.team_id] = team
+
+    if replay_squads and all(s.squad_id for s in sides):
+        squad_win_chances = chances([state.squad(s.squad_id) for s in sides])
+        for i, side in enumerate(sides):
+            is_winner = side.id == game.winner_id
+            delta = elo_math.elo_delta(elo_math.squad_max_delta(state.squad_games[side.squad_id]), squad_win_chances[i], is_winner)
+            state.ledger[('squad', side.squad_id, 'elo', game.id)] = (state.squads[side.squad_id], int(state.squads[side.squad_id] + delta), delta)
+            state.squads[side.squad_id] = int(state.squads[side.squad_id] + delta)
+            side.values['elo_change_squad'] = delta
+
+    # The game now counts as completed for the following games
+    for side in sides:
+        if side.squad_id and 'squads' in parts:
+            state.squad_games[side.squad_id] += 1
+        for lineup in side.lineups:
+            if replay_players:
+                state.player_games[lineup.player_id][0] += 1
+                if post_moonrise:
+                    state.player_games[lineup.player_id][1] += 1
+            if replay_members:
+                state.member_games[lineup.member_id][0] += 1
+                if post_moonrise:
+                    state.member_games[lineup.member_id][1] += 1
+
+    return True
+
+
+def check_completed_games(fix: bool = False) -> int:
+    # Consistency check for Player/DiscordMember.completed_games(_moonrise) against a count from Lineup.
+    # Returns the number of rows that were out of step, correcting them if fix=True
+    player_query, member_query = completed_game_queries()
+    mismatched = 0
+
+    for model, counts_query in ((Player, player_query), (DiscordMember, member_query)):
+        counts = counts_query.alias('counts')
+        games, moonrise_games = fn.COALESCE(counts.c.games, 0), fn.COALESCE(counts.c.moonrise_games, 0)
+        rows = model.select(model.id, games, moonrise_games).join(
+            counts, JOIN.LEFT_OUTER, on=(counts.c.record_id == model.id)
+        ).where((model.completed_games != games) | (model.completed_games_moonrise != moonrise_games)).tuples()
+        wrong = {record_id: {'completed_games': count, 'completed_games_moonrise': int(moonrise_count)} for record_id, count, moonrise_count in rows}
+
+        if wrong:
+            logger.warning(f'check_completed_games: {len(wrong)} {model.__name__} rows have out of date completed_games counters')
+            if fix:
+                update_rows(model, wrong, ('completed_games', 'completed_games_moonrise'))
+        mismatched += len(wrong)
+
+    return mismatched
+
+
+def replay(games: List[ReplayGame], state: EloState):
+    # Returns the list of game ids that were declared, in order
+    global_guilds = settings.servers_included_in_global_lb()
+    declared = []
+    for game in games:
+        if replay_game(game, state, global_guilds):
+            declared.append(game.id)
+    return declared
+
+
+# Parallel replay. Local Player ratings only depend on games from the player's guild, DiscordMember ratings only on games
+# from servers_included_in_global_lb(), and Team and Squad ratings only on their own games. Each of those chains is
+# replayed in a worker process and the results are merged back into the parent's games and state. Workers only replay in
+# memory and never query the database. They are forked, because a spawned worker would import modules.models again, which
+# connects and creates tables - so where the platform doesn't fork by default the chains are replayed one after another.
+
+LINEUP_PART_FIELDS = {
+    'players': tuple(f for f in LINEUP_FIELDS if 'discordmember' not in f and 'global' not in f),
+    'members': tuple(f for f in LINEUP_FIELDS if 'discordmember' in f or 'global' in f),
+}
+SIDE_PART_FIELDS = {
+    'teams': ('elo_change_team', 'elo_change_team_alltime', 'team_elo_after_game', 'team_elo_after_game_alltime'),
+    'squads': ('elo_change_squad',),
+}
+STATE_PART_TABLES = {'players': ('players', 'player_games'), 'members': ('members', 'member_games'), 'teams': ('teams',), 'squads': ('squads', 'squad_games')}
+
+_worker_replay = None  # (games, state, boundaries) in a worker process of replay_parallel(), see start_replay_worker()
+
+
+def replay_chains(games: List[ReplayGame]):
+    # (parts, guild_id, game count) for each independent chain, largest first. A guild_id of None means every game
+    global_guilds = settings.servers_included_in_global_lb()
+    chains = [(('players',), guild_id, count) for guild_id, count in Counter(g.guild_id for g in games).items()]
+    chains.append((('members',), None, sum(1 for g in games if g.guild_id in global_guilds)))
+    chains.append((('teams', 'squads'), None, len(games)))
+    return sorted(chains, key=lambda chain: chain[2], reverse=True)
+
+
+def chain_ids(game: ReplayGame, parts):
+    # (state table, id) pairs a game can change for the given parts
+    for side in game.sides:
+        if 'teams' in parts and side.team_id:
+            yield 'teams', side.team_id
+        if 'squads' in parts and side.squad_id:
+            yield 'squads', side.squad_id
+            yield 'squad_games', side.squad_id
+        for lineup in side.lineups:
+            if 'players' in parts:
+                yield 'players', lineup.player_id
+                yield 'player_games', lineup.player_id
+            if 'members' in parts:
+                yield 'members', lineup.member_id
+                yield 'member_games', lineup.member_id
+
+
+def start_replay_worker(games: List[ReplayGame], state: EloState, boundaries: set):
+    # Runs first in each worker process of replay_parallel(), with the games and starting state every chain replays
+    global _worker_replay
+    _worker_replay = (games, state, boundaries)
+
+
+def replay_chain(chain) -> dict:
+    # Runs in a worker process: replays one chain over the games given to start_replay_worker()
+    parts, guild_id, _ = chain
+    games, state, boundaries = _worker_replay
+    global_guilds = settings.servers_included_in_global_lb()
+    if guild_id is not None:
+        chain_games = [g for g in games if g.guild_id == guild_id]
+    elif parts == ('members',):
+        chain_games = [g for g in games if g.guild_id in global_guilds]
+    else:
+        chain_games = games
+    in_chain = {g.id for g in chain_games}
+
+    touched = defaultdict(set)
+    declared, snapshots = [], []
+    for index, game in enumerate(games):
+        if game.id in in_chain:
+            if replay_game(game, state, global_guilds, parts):
+                declared.append(game.id)
+            for table, record_id in chain_ids(game, parts):
+                touched[table].add(record_id)
+        if index in boundaries:
+            snapshot = {}
+            for table, ids in touched.items():
+                values = getattr(state, table)
+                snapshot[table] = {record_id: (values[record_id].copy() if isinstance(values[record_id], (dict, list)) else values[record_id])
+                                   for record_id in ids if record_id in values}
+            snapshots.append(snapshot)
+
+    lineup_fields = [f for part in parts for f in LINEUP_PART_FIELDS.get(part, ())]
+    side_fields = [f for part in parts for f in SIDE_PART_FIELDS.get(part, ())]
+    return {
+        'declared': declared,
+        'lineups': {l.id: {f: l.values[f] for f in lineup_fields} for g in chain_games for s in g.sides for l in s.lineups} if lineup_fields else {},
+        'sides': {s.id: {f: s.values[f] for f in side_fields} for g in chain_games for s in g.sides} if side_fields else {},
+        'ledger': state.ledger,
+        'snapshots': snapshots,
+    }
+
+
+def replay_parallel(games: List[ReplayGame], state: EloState, processes: int, boundaries: List[int]):
+    # Replays the chains in up to `processes` workers. Lineup and side values are merged into `games`.
+    # Returns (declared game ids, ledger, snapshots), where snapshots[i] is a list of per-chain state snapshots
+    # as of games[boundaries[i]], to be applied with EloState.merge() in order.
+    chains = replay_chains(games)
+    if not db.in_transaction():
+        db.close()  # the workers have no use for a copy of an open connection. The next query here reconnects.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(processes, len(chains)), mp_context=multiprocessing.get_context(),
+                                                initializer=start_replay_worker, initargs=(games, state, set(boundaries))) as pool:
+        results = list(pool.map(replay_chain, chains))
+
+    lineups = {l.id: l for g in games for s in g.sides for l in s.lineups}
+    sides = {s.id: s for g in games for s in g.sides}
+    ledger, declared = {}, set()
+    for chain, result in zip(chains, results):
+        for lineup_id, values in result['lineups'].items():
+            lineups[lineup_id].values.update(values)
+        for side_id, values in result['sides'].items():
+            sides[side_id].values.update(values)
+        ledger.update(result['ledger'])
+        if chain[1] is None and 'teams' in chain[0]:
+            declared = set(result['declared'])  # every chain skips the same games, and this one sees them all
+
+    snapshots = [[result['snapshots'][i] for result in results] for i in range(len(boundaries))]
+    return declared, ledger, snapshots
+
+
+def replay_segments(games: List[ReplayGame], state: EloState, processes: int = 1):
+    # Yields (segment, declared game ids) for each checkpoint segment, with `state` holding the ratings as of the end of
+    # the segment and state.ledger the segment's ledger rows
+    segments = list(checkpoint_segments(games))
+    if processes > 1 and multiprocessing.get_start_method() != 'fork':
+        elo_logger.warning(f'replay_segments: processes={processes} needs workers started by fork, not {multiprocessing.get_start_method()} - replaying sequentially')
+        processes = 1
+    if processes <= 1 or not games:
+        for segment in segments:
+            state.ledger = {}
+            yield segment, replay(segment, state)
+        return
+
+    started = datetime.datetime.now()
+    boundaries = list(itertools.accumulate(len(segment) for segment in segments))
+    declared, ledger, snapshots = replay_parallel(games, state, processes, [end - 1 for end in boundaries])
+    elo_logger.info(f'replay_segments replayed {len(games)} games across {processes} processes in {datetime.datetime.now() - started}')
+
+    ledger_by_game = defaultdict(dict)
+    for key, values in ledger.items():
+        ledger_by_game[key[3]][key] = values
+    for segment, segment_snapshots in zip(segments, snapshots):
+        for snapshot in segment_snapshots:
+            state.merge(snapshot)
+        state.ledger = {key: values for game in segment for key, values in ledger_by_game[game.id].items()}
+        yield segment, [game.id for game in segment if game.id in declared]
+
+
+def write_ratings(state: EloState):
+    update_rows(Player, state.players, RATING_FIELDS)
+    update_rows(DiscordMember, state.members, RATING_FIELDS)
+    update_rows(Team, state.teams, TEAM_FIELDS)
+    update_rows(Squad, {squad_id: {'elo': elo} for squad_id, elo in state.squads.items()}, ('elo',))
+
+
+def write_games(games: List[ReplayGame], state: EloState, declared):
+    # Per-game results of a replay: side and lineup values, ledger rows and the completed/confirmed flags
+    sides = {s.id: s.values for g in games for s in g.sides}
+    lineups = {l.id: l.values for g in games for s in g.sides for l in s.lineups}
+    update_rows(GameSide, sides, GAMESIDE_FIELDS)
+    update_rows(Lineup, lineups, LINEUP_FIELDS)
+
+    game_ids = [g.id for g in games]
+    for batch in chunked(game_ids, WRITE_BATCH_SIZE):
+        EloLedger.delete().where(EloLedger.game.in_(batch)).execute()
+    write_ledger(state.ledger, games)
+
+    declared = set(declared)
+    skipped = [game_id for game_id in game_ids if game_id not in declared]
+    for batch in chunked(list(declared), WRITE_BATCH_SIZE):
+        Game.update(is_completed=1, is_confirmed=1).where(Game.id.in_(batch)).execute()
+    if skipped:
+        Game.update(is_completed=0, is_confirmed=0).where(Game.id.in_(skipped)).execute()
+    return skipped
+
+
+LEDGER_FIELDS = (EloLedger.entity_type, EloLedger.entity_id, EloLedger.flavour, EloLedger.game, EloLedger.completed_ts,
+                 EloLedger.elo_before, EloLedger.elo_after, EloLedger.elo_delta)
+
+
+def write_ledger(ledger: dict, games: List[ReplayGame]) -> int:
+    completed_ts = {g.id: g.completed_ts for g in games}
+    rows = [(entity_type, entity_id, flavour, game_id, completed_ts[game_id], *values)
+            for (entity_type, entity_id, flavour, game_id), values in ledger.items()]
+    for batch in chunked(rows, WRITE_BATCH_SIZE):
+        EloLedger.insert_many(batch, fields=LEDGER_FIELDS).as_rowcount().execute()
+    return len(rows)
+
+
+def sync_ledger(ledger: dict, games: List[ReplayGame]) -> int:
+    # Bring the ledger rows of the replayed games in line with `ledger`, touching only rows that differ.
+    # Returns the number of rows deleted plus inserted.
+    existing, stale = {}, []
+    query = EloLedger.select(EloLedger.id, EloLedger.entity_type, EloLedger.entity_id, EloLedger.flavour, EloLedger.game,
+                             EloLedger.elo_before, EloLedger.elo_after, EloLedger.elo_delta).where(EloLedger.game.in_([g.id for g in games]))
+    for row_id, entity_type, entity_id, flavour, game_id, *values in query.tuples():
+        key = (entity_type, entity_id, flavour, game_id)
+        if ledger.get(key) == tuple(values):
+            existing[key] = row_id
+        else:
+            stale.append(row_id)
+
+    for batch in chunked(stale, WRITE_BATCH_SIZE):
+        EloLedger.delete().where(EloLedger.id.in_(batch)).execute()
+    return len(stale) + write_ledger({key: values for key, values in ledger.items() if key not in existing}, games)
+
+
+def backfill_ledger() -> int:
+    # Builds EloLedger from the elo_change_*/elo_after_game* columns for games declared before the ledger existed.
+    # Squads have no after-game column, so their ratings are a running total of elo_change_squad from the 1000 starting ELO.
+    EloLedger.delete().execute()
+    counted = (Game.is_confirmed == 1) & (Game.is_ranked == 1) & Game.winner.is_null(False) & Game.completed_ts.is_null(False)
+    inserted = 0
+
+    for flavour, player_change, player_after, member_change, member_after in EloLedger.lineup_fields:
+        for entity_type, entity_id, change_field, after_field in (('player', Lineup.player, player_change, player_after),
+                                                                  ('discordmember', Player.discord_member, member_change, member_after)):
+            after, delta = getattr(Lineup, after_field), getattr(Lineup, change_field)
+            query = Lineup.select(Value(entity_type), entity_id, Value(flavour), Lineup.game, Game.completed_ts, after - delta, after, delta).join(Game).join_from(
+                Lineup, Player).where(counted & after.is_null(False))
+            inserted += EloLedger.insert_from(query, LEDGER_FIELDS).as_rowcount().execute()
+
+    for flavour, change_field, after_field in (('elo', GameSide.elo_change_team, GameSide.team_elo_after_game),
+                                               ('elo_alltime', GameSide.elo_change_team_alltime, GameSide.team_elo_after_game_alltime)):
+        # one row per team and game - the last side, as with the team's saved rating
+        query = GameSide.select(Value('team'), GameSide.team, Value(flavour), GameSide.game, Game.completed_ts, after_field - change_field, after_field, change_field).join(
+            Game).where(counted & after_field.is_null(False)).order_by(GameSide.team, GameSide.game, GameSide.position.desc()).distinct(GameSide.team, GameSide.game)
+        inserted += EloLedger.insert_from(query, LEDGER_FIELDS).as_rowcount().execute()
+
+    # declare_winner() only changes squad ELO when every side of the game has a squad
+    squadless_side = GameSide.select(GameSide.game).where(GameSide.squad.is_null(True))
+    running_total = fn.SUM(GameSide.elo_change_squad).over(partition_by=[GameSide.squad], order_by=[Game.completed_ts, Game.id])
+    query = GameSide.select(Value('squad'), GameSide.squad, Value('elo'), GameSide.game, Game.completed_ts, 1000 + running_total - GameSide.elo_change_squad,
+                            1000 + running_total, GameSide.elo_change_squad).join(Game).where(counted & Game.id.not_in(squadless_side))
+    inserted += EloLedger.insert_from(query, LEDGER_FIELDS).as_rowcount().execute()
+    return inserted
+
+
+def replay_all():
+    # Replays every game recalculate_all_elo() would, from freshly reset ratings. Nothing is written.
+    # Returns (replay_filter, games, state, declared game ids, original lineup values)
+    replay_filter = replayable_games()
+    games = load_games(replay_filter)
+    original_lineups = {l.id: dict(l.values) for g in games for s in g.sides for l in s.lineups}
+    state = EloState()
+    load_completed_game_counts(state, replay_filter)
+    declared = replay(games, state)
+    return replay_filter, games, state, declared, original_lineups
+
+
+def checkpoint_segments(games: List[ReplayGame]):
+    # Split the replay at each month boundary of completed_ts, and every CHECKPOINT_GAMES games within a month
+    segment = []
+    for game in games:
+        if segment:
+            last = segment[-1].completed_ts
+            if (game.completed_ts.year, game.completed_ts.month) != (last.year, last.month) or len(segment) >= CHECKPOINT_GAMES:
+                yield segment
+                segment = []
+        segment.append(game)
+    if segment:
+        yield segment
+
+
+def checkpoint_key(checkpoint):
+    return Tuple(checkpoint.completed_ts, checkpoint.game_id)
+
+
+def latest_checkpoint(replay_filter, before: datetime.datetime = None):
+    # The latest checkpoint (taken before `before`, if given) whose game count still matches the games it was taken over.
+    # Checkpoints that no longer match are deleted.
+    query = EloCheckpoint.select(EloCheckpoint.id, EloCheckpoint.completed_ts, EloCheckpoint.game_id, EloCheckpoint.game_count).order_by(
+        EloCheckpoint.completed_ts.desc(), EloCheckpoint.game_id.desc())
+    if before:
+        query = query.where(EloCheckpoint.completed_ts < before)
+
+    stale = []
+    for checkpoint in query:
+        game_count = Game.select().where(replay_filter & (Tuple(Game.completed_ts, Game.id) <= checkpoint_key(checkpoint))).count()
+        if game_count == checkpoint.game_count:
+            break
+        stale.append(checkpoint.id)
+    else:
+        checkpoint = None
+
+    if stale:
+        logger.warning(f'latest_checkpoint: deleting {len(stale)} checkpoints that no longer match the game history')
+        EloCheckpoint.delete().where(EloCheckpoint.id.in_(stale)).execute()
+    return EloCheckpoint.get_by_id(checkpoint.id) if checkpoint else None
+
+
+def recalculate_all(resume: bool = False, before: datetime.datetime = None, processes: int = 1):
+    # Replacement for the reset + declare_winner() loop in Game.recalculate_all_elo().
+    # The replay runs a month at a time. Each month's game results are committed together with an EloCheckpoint of the
+    # ratings so far, and the ratings themselves are written in one transaction at the end, which also marks the run's
+    # checkpoints complete. Until then EloCheckpoint.interrupted_run() reports the run and the bot won't start.
+    # With resume=True the replay starts from the latest checkpoint (before `before`, if given) instead of from the first
+    # game - so an interrupted run picks up where it stopped. processes > 1 replays the independent rating chains in
+    # parallel, see replay_parallel(). Returns the number of games declared by this run.
+    started = datetime.datetime.now()
+    replay_filter = replayable_games()
+    checkpoint = latest_checkpoint(replay_filter, before=before) if resume else None
+    interrupted = EloCheckpoint.interrupted_run()
+    if interrupted and not checkpoint:
+        elo_logger.warning(f'recalculate_all: an earlier run stopped after game {interrupted.game_id} - replaying every game again')
+
+    if checkpoint:
+        state = EloState.from_json(checkpoint.state)
+        skipped, game_count = list(checkpoint.state['skipped']), checkpoint.game_count
+        after_checkpoint = Tuple(EloCheckpoint.completed_ts, EloCheckpoint.game_id) > checkpoint_key(checkpoint)
+        EloCheckpoint.delete().where(after_checkpoint).execute()
+        games = load_games(replay_filter & (Tuple(Game.completed_ts, Game.id) > checkpoint_key(checkpoint)))
+        elo_logger.info(f'recalculate_all resuming after game {checkpoint.game_id} at {checkpoint.completed_ts}, {len(games)} games to replay')
+    else:
+        EloCheckpoint.delete().execute()
+        state, skipped, game_count = EloState(), [], 0
+        load_completed_game_counts(state, replay_filter)
+        games = load_games(replay_filter)
+
+    declared_count = 0
+    for segment, declared in replay_segments(games, state, processes=processes):
+        declared_count += len(declared)
+        game_count += len(segment)
+        with db.atomic():
+            skipped.extend(write_games(segment, state, declared))
+            EloCheckpoint.create(completed_ts=segment[-1].completed_ts, game_id=segment[-1].id, game_count=game_count,
+                                 state=dict(state.as_json(), skipped=skipped))
+    elo_logger.info(f'recalculate_all replayed {declared_count} of {len(games)} games in {datetime.datetime.now() - started}')
+
+    with db.atomic():
+        Player.update(elo=1000, elo_max=1000, elo_alltime=1000, elo_max_alltime=1000, elo_moonrise=1000, elo_max_moonrise=1000).execute()
+        Team.update(elo=1000, elo_alltime=1000).execute()
+        DiscordMember.update(elo=1000, elo_max=1000, elo_alltime=1000, elo_max_alltime=1000, elo_moonrise=1000, elo_max_moonrise=1000).execute()
+        Squad.update(elo=1000).execute()
+
+        bot_members = DiscordMember.select().where(
+            DiscordMember.discord_id.in_([settings.bot_id, settings.bot_id_beta])
+        )
+        Player.update(elo=0, elo_max=0, elo_alltime=0, elo_max_alltime=0, elo_moonrise=0, elo_max_moonrise=0).where(Player.discord_member_id.in_(bot_members)).execute()
+        DiscordMember.update(elo=0, elo_max=0, elo_alltime=0, elo_max_alltime=0, elo_moonrise=0, elo_max_moonrise=0).where(DiscordMember.id.in_(bot_members)).execute()
+
+        write_ratings(state)
+        # Ledger rows of games that are no longer replayed, such as games since made unranked
+        EloLedger.delete().where(EloLedger.game.not_in(Game.select(Game.id).where(replay_filter))).execute()
+        check_completed_games(fix=True)
+        EloCheckpoint.update(is_complete=True).where(EloCheckpoint.is_complete == 0).execute()
+        Leaderboard.invalidate()
+        DiscordMemberStats.invalidate()
+        PlayerStats.invalidate()
+        SeasonStandings.invalidate()
+        leaderboard_cache.invalidate()
+
+    elo_logger.info(f'recalculate_all complete in {datetime.datetime.now() - started}')
+    return declared_count
+
+
+# (rating field, change field summed when reversing, player after-game field, member after-game field)
+REVERSIBLE_FIELDS = (
+    ('elo', 'elo_change_player', 'elo_change_discordmember', 'elo_after_game', 'elo_after_game_global'),
+    ('elo_alltime', 'elo_change_player_alltime', 'elo_change_discordmember_alltime', 'elo_after_game_alltime', 'elo_after_game_global_alltime'),
+    ('elo_moonrise', 'elo_change_player_moonrise', 'elo_change_discordmember_moonrise', 'elo_after_game_moonrise', 'elo_after_game_global_moonrise'),
+)
+TEAM_REVERSIBLE_FIELDS = (
+    ('elo', 'elo_change_team', 'team_elo_after_game'),
+    ('elo_alltime', 'elo_change_team_alltime', 'team_elo_after_game_alltime'),
+)
+
+
+def load_starting_state(state: EloState, timestamp: datetime.datetime, replay_filter):
+    # Ratings as they stood just before `timestamp`. Each rating comes from the entity's last elo_after_game* snapshot
+    # in a game completed before then. Squads have no snapshot column, and entities without an earlier snapshot fall back
+    # to their current rating minus the changes about to be replayed - the same arithmetic as reverse_elo_changes().
+    # Teams always use that arithmetic: when one team fills several sides of a game, declare_winner() keeps only the last
+    # side's change but reverse_elo_changes() takes back every side's, so the snapshot isn't what a reversal leaves.
+    # Max ELO fields are kept as they are, since reverse_elo_changes() never lowers them either.
+    # Returns the current database values of every loaded entity so the caller can write only what changed.
+
+    replay_games = Game.select(Game.id).where(replay_filter)
+    involved_lineups = Lineup.select(Lineup.player).where(Lineup.game.in_(replay_games))
+    involved_players = Player.select(Player.id).where(Player.id.in_(involved_lineups))
+    involved_members = Player.select(Player.discord_member).where(Player.id.in_(involved_lineups))
+    involved_teams = GameSide.select(GameSide.team).where(GameSide.game.in_(replay_games) & GameSide.team.is_null(False))
+    involved_squads = GameSide.select(GameSide.squad).where(GameSide.game.in_(replay_games) & GameSide.squad.is_null(False))
+
+    current = {'players': {}, 'members': {}, 'teams': {}, 'squads': {}}
+    for model, key, table, involved in ((Player, 'players', state.players, involved_players), (DiscordMember, 'members', state.members, involved_members)):
+        for record_id, *values in model.select(model.id, *[getattr(model, f) for f in RATING_FIELDS]).where(model.id.in_(involved)).tuples():
+            current[key][record_id] = dict(zip(RATING_FIELDS, values))
+            table[record_id] = dict(current[key][record_id])
+    for team_id, *values in Team.select(Team.id, Team.elo, Team.elo_alltime).where(Team.id.in_(involved_teams)).tuples():
+        current['teams'][team_id] = dict(zip(TEAM_FIELDS, values))
+        state.teams[team_id] = dict(current['teams'][team_id])
+    for squad_id, elo in Squad.select(Squad.id, Squad.elo).where(Squad.id.in_(involved_squads)).tuples():
+        current['squads'][squad_id] = state.squads[squad_id] = elo
+
+    # Fallback: current rating minus the changes from the games being replayed
+    in_replay = Game.id.in_(replay_games)
+    player_sums = Lineup.select(Lineup.player, *[fn.SUM(getattr(Lineup, f[1])) for f in REVERSIBLE_FIELDS]).join(Game).where(in_replay).group_by(Lineup.player)
+    member_sums = Lineup.select(Player.discord_member, *[fn.SUM(getattr(Lineup, f[2])) for f in REVERSIBLE_FIELDS]).join(Game).join_from(Lineup, Player).where(in_replay).group_by(Player.discord_member)
+    for query, table in ((player_sums, state.players), (member_sums, state.members)):
+        for record_id, *sums in query.tuples():
+            for (elo_field, *_), total in zip(REVERSIBLE_FIELDS, sums):
+                table[record_id][elo_field] -= int(total)
+
+    team_sums = GameSide.select(GameSide.team, fn.SUM(GameSide.elo_change_team), fn.SUM(GameSide.elo_change_team_alltime)).join(Game).where(
+        in_replay & GameSide.team.is_null(False)).group_by(GameSide.team)
+    for team_id, elo_total, alltime_total in team_sums.tuples():
+        state.teams[team_id]['elo'] -= int(elo_total)
+        state.teams[team_id]['elo_alltime'] -= int(alltime_total)
+
+    squad_sums = GameSide.select(GameSide.squad, fn.SUM(GameSide.elo_change_squad)).join(Game).where(
+        in_replay & GameSide.squad.is_null(False)).group_by(GameSide.squad)
+    for squad_id, total in squad_sums.tuples():
+        state.squads[squad_id] -= int(total)
+
+    # Snapshots from the ledger, where an earlier game has one
+    involved = (
+        ((EloLedger.entity_type == 'player') & EloLedger.entity_id.in_(involved_players)) |
+        ((EloLedger.entity_type == 'discordmember') & EloLedger.entity_id.in_(involved_members)) |
+        ((EloLedger.entity_type == 'squad') & EloLedger.entity_id.in_(involved_squads))
+    )
+    snapshots = EloLedger.select(EloLedger.entity_type, EloLedger.entity_id, EloLedger.flavour, EloLedger.elo_after).where(
+        (EloLedger.completed_ts < timestamp) & involved
+    ).order_by(
+        EloLedger.entity_type, EloLedger.entity_id, EloLedger.flavour, EloLedger.completed_ts.desc(), EloLedger.game.desc()
+    ).distinct(EloLedger.entity_type, EloLedger.entity_id, EloLedger.flavour)
+
+    tables = {'player': state.players, 'discordmember': state.members}
+    for entity_type, entity_id, flavour, elo in snapshots.tuples():
+        if entity_type == 'squad':
+            state.squads[entity_id] = elo
+        else:
+            tables[entity_type][entity_id][flavour] = elo
+
+    return current
+
+
+def reset_game_values(games: List[ReplayGame]):
+    # Apply what reverse_elo_changes() does to each lineup and side before the games are declared again.
+    # Returns the original values, keyed by id.
+    original_lineups, original_sides = {}, {}
+    for game in games:
+        for side in game.sides:
+            original_sides[side.id] = dict(side.values)
+            if side.values['elo_change_squad'] and side.squad_id:
+                side.values['elo_change_squad'] = 0
+            if side.values['elo_change_team'] and side.team_id:
+                side.values['elo_change_team'] = 0
+            if side.values['elo_change_team_alltime'] and side.team_id:
+                side.values['elo_change_team_alltime'] = 0
+            side.values['team_elo_after_game'] = None
+            side.values['team_elo_after_game_alltime'] = None
+
+            for lineup in side.lineups:
+                original_lineups[lineup.id] = dict(lineup.values)
+                for field_name in LINEUP_FIELDS:
+                    lineup.values[field_name] = 0 if field_name.startswith('elo_change') else None
+    return original_lineups, original_sides
+
+
+def changed_rows(final: dict, original: dict) -> dict:
+    return {record_id: values for record_id, values in final.items() if values != original.get(record_id)}
+
+
+def replay_since(timestamp: datetime.datetime):
+    # Replays the games recalculate_elo_since() would, from the ratings as they stood before timestamp. Nothing is written.
+    # Returns None if there is nothing to replay, otherwise a dict of
+    # {table name: (final rows, current rows, fields)} plus the ids of games declare_winner() would skip
+    replay_filter = (
+        (Game.is_completed == 1) & (Game.is_confirmed == 1) & (Game.completed_ts >= timestamp) & (Game.winner.is_null(False)) & (Game.is_ranked == 1)
+    )
+
+    games = load_games(replay_filter)
+    if not games:
+        return None
+
+    state = EloState()
+    current = load_starting_state(state, timestamp, replay_filter)
+    load_completed_game_counts(state, replay_filter)
+    original_lineups, original_sides = reset_game_values(games)
+    declared = set(replay(games, state))
+
+    tables = {
+        'player': (state.players, current['players'], RATING_FIELDS),
+        'discordmember': (state.members, current['members'], RATING_FIELDS),
+        'team': (state.teams, current['teams'], TEAM_FIELDS),
+        'squad': ({squad_id: {'elo': elo} for squad_id, elo in state.squads.items()},
+                  {squad_id: {'elo': elo} for squad_id, elo in current['squads'].items()}, ('elo',)),
+        'gameside': ({s.id: s.values for g in games for s in g.sides}, original_sides, GAMESIDE_FIELDS),
+        'lineup': ({l.id: l.values for g in games for s in g.sides for l in s.lineups}, original_lineups, LINEUP_FIELDS),
+    }
+    skipped = [g.id for g in games if g.id not in declared]
+    return tables, skipped, len(declared), state.ledger, games
+
+
+def recalculate_since(timestamp: datetime.datetime) -> int:
+    # Replacement for the reverse + declare_winner() loop in Game.recalculate_elo_since().
+    # Only rows whose values differ from the database are written. Returns the number of rows updated.
+    started = datetime.datetime.now()
+    replayed = replay_since(timestamp)
+    if not replayed:
+        return 0
+    tables, skipped, declared_count, ledger, games = replayed
+
+    models = {'player': Player, 'discordmember': DiscordMember, 'team': Team, 'squad': Squad, 'gameside': GameSide, 'lineup': Lineup}
+    with db.atomic():
+        touched, changed = 0, {}
+        for table, (final, current, fields) in tables.items():
+            changed[table] = changed_rows(final, current)
+            touched += update_rows(models[table], changed[table], fields)
+        touched += sync_ledger(ledger, games)
+        if touched:
+            EloCheckpoint.invalidate(timestamp)
+        if skipped:
+            # declare_winner() leaves these reversed and incomplete
+            touched += Game.update(is_completed=0, is_confirmed=0).where(Game.id.in_(skipped)).execute()
+            touched += check_completed_games(fix=True)
+
+        # Skipped games leave their players' W/L records as well
+        skipped_players = Lineup.select(Lineup.player).where(Lineup.game.in_(skipped))
+        DiscordMemberStats.invalidate(Player.select(Player.discord_member).where(Player.id.in_(skipped_players)))
+        PlayerStats.invalidate(skipped_players)
+        SeasonStandings.invalidate([season for season, in Game.select(Game.league_season).where(Game.id.in_(skipped)).distinct().tuples()])
+
+    Leaderboard.refresh(
+        players=Player.select().where(Player.id.in_(list(changed['player'])) | Player.id.in_(skipped_players)),
+        discord_members=DiscordMember.select(DiscordMember.id).where(DiscordMember.id.in_(list(changed['discordmember']))),
+    )
+    leaderboard_cache.invalidate()
+
+    elo_logger.info(f'recalculate_since {timestamp} replayed {declared_count} games and updated {touched} rows in {datetime.datetime.now() - started}')
+    return touched
+
+
+# Dry runs. The report lists every value a recalculation would change as (table, id, field, before, after) rows:
+# ELO and max ELO for players, discord members, teams and squads, and the ELO deltas recorded on each lineup.
+
+REPORT_HEADER = ('table', 'id', 'field', 'before', 'after')
+LINEUP_DELTA_FIELDS = tuple(f for f in LINEUP_FIELDS if f.startswith('elo_change'))
+
+
+def value_changes(table: str, final: dict, current: dict, fields):
+    for record_id, after in final.items():
+        before = current.get(record_id)
+        if before is None or after == before:
+            continue
+        for field_name in fields:
+            if after[field_name] != before[field_name]:
+                yield (table, record_id, field_name, before[field_name], after[field_name])
+
+
+def write_diff_report(changes, filename: str) -> int:
+    # Writes a gzip CSV, or JSON if filename ends in .json or .json.gz. Returns the number of changed values
+    import csv
+    import gzip
+    import json
+
+    changes = list(changes)
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, mode='wt', encoding='utf-8') as report_file:
+        if filename.endswith(('.json', '.json.gz')):
+            json.dump({'changes': [dict(zip(REPORT_HEADER, change)) for change in changes]}, report_file)
+        else:
+            writer = csv.writer(report_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(REPORT_HEADER)
+            writer.writerows(changes)
+
+    elo_logger.info(f'write_diff_report: {len(changes)} changed values written to {filename}')
+    return len(changes)
+
+
+def dry_run_all(filename: str = 'elo_recalc_diff.csv.gz') -> int:
+    # What recalculate_all() would change, without writing to the database. Returns the number of changed values
+    _, games, state, _, original_lineups = replay_all()
+    bot_ids = [settings.bot_id, settings.bot_id_beta]
+
+    def current_ratings(query):
+        current, final = {}, {}
+        for record_id, is_bot, *values in query.tuples():
+            current[record_id] = dict(zip(RATING_FIELDS, values))
+            final[record_id] = dict.fromkeys(RATING_FIELDS, 0 if is_bot else 1000)
+        return current, final
+
+    rating_fields = [getattr(Player, f) for f in RATING_FIELDS]
+    current_players, final_players = current_ratings(Player.select(Player.id, DiscordMember.discord_id.in_(bot_ids), *rating_fields).join(DiscordMember))
+    rating_fields = [getattr(DiscordMember, f) for f in RATING_FIELDS]
+    current_members, final_members = current_ratings(DiscordMember.select(DiscordMember.id, DiscordMember.discord_id.in_(bot_ids), *rating_fields))
+    final_players.update(state.players)
+    final_members.update(state.members)
+
+    current_teams = {team_id: dict(zip(TEAM_FIELDS, values)) for team_id, *values in Team.select(Team.id, Team.elo, Team.elo_alltime).tuples()}
+    final_teams = {team_id: state.teams.get(team_id, dict.fromkeys(TEAM_FIELDS, 1000)) for team_id in current_teams}
+    current_squads = {squad_id: {'elo': elo} for squad_id, elo in Squad.select(Squad.id, Squad.elo).tuples()}
+    final_squads = {squad_id: {'elo': state.squads.get(squad_id, 1000)} for squad_id in current_squads}
+    final_lineups = {l.id: l.values for g in games for s in g.sides for l in s.lineups}
+
+    changes = itertools.chain(
+        value_changes('player', final_players, current_players, RATING_FIELDS),
+        value_changes('discordmember', final_members, current_members, RATING_FIELDS),
+        value_changes('team', final_teams, current_teams, TEAM_FIELDS),
+        value_changes('squad', final_squads, current_squads, ('elo',)),
+        value_changes('lineup', final_lineups, original_lineups, LINEUP_DELTA_FIELDS),
+    )
+    return write_diff_report(changes, filename)
+
+
+def dry_run_since(timestamp: datetime.datetime, filename: str = 'elo_recalc_diff.csv.gz') -> int:
+    # What recalculate_since() would change, without writing to the database. Returns the number of changed values
+    replayed = replay_since(timestamp)
+    if not replayed:
+        return write_diff_report([], filename)
+    tables = replayed[0]
+
+    changes = []
+    for table, (final, current, fields) in tables.items():
+        if table == 'gameside':
+            continue
+        changes.extend(value_changes(table, final, current, LINEUP_DELTA_FIELDS if table == 'lineup' else fields))
+    return write_diff_report(changes, filename)
@@ -0,0 +1,81 @@
+"""Game search results that ``utilities.paginate()`` loads one page at a time.
+
+A ``GamePages`` counts its query once and then only loads the games on the
+page being shown, using ``Game.load_game_list()`` so summarizing a page
+takes a fixed number of queries. Pages are found by keyset rather than
+OFFSET: the next page carries on from the sort keys of the last game shown,
+the previous page from the first, and the last page is read from the end of
+the list in reverse, so paging stays as quick at game 5000 as at game 10.
+"""
+
+import logging
+from typing import Dict, List, Tuple
+
+from peewee import Tuple as Row
+
+from modules import utilities
+from modules.models import Game
+
+logger = logging.getLogger('polybot.' + __name__)
+
+
+class GamePages:
+
+    def __init__(self, query, keys: List, descending: bool = True, player_discord_id: int = None):
+        # query is a Game query, such as Game.search(). keys are its sort keys (eg. Game.search_ordering()), which must
+        # be non-null and end with a unique column. The list runs from the largest keys down unless descending is False.
+        self.query = query
+        self.keys = keys
+        self.descending = descending
+        self.player_discord_id = player_discord_id
+        self.rows: Dict[int, Tuple[tuple, Tuple[str, str]]] = {}  # {list index: (sort keys, summarize_game_list entry)}
+        self.count = query.order_by().count()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> Tuple[str, str]:
+        if index < 0 or index >= self.count:
+            raise IndexError(index)
+        if index not in self.rows:
+            self.fetch(index, index + 1)
+        return self.rows[index][1]
+
+    def fetch(self, start: int, end: int):
+        # Loads entries start..end-1 that aren't loaded already. utilities.paginate() calls this off the event loop
+        # before showing each page, so going to the next, previous, first or last page is always one keyset read
+        missing = [index for index in range(max(start, 0), min(end, self.count)) if index not in self.rows]
+        if not missing:
+            return
+        first, last = missing[0], missing[-1]
+        utilities.connect()
+
+        if first - 1 in self.rows:
+            self.load(first, self.read(self.rows[first - 1][0], forward=True, limit=last - first + 1))
+        elif last + 1 in self.rows:
+            self.load(first, self.read(self.rows[last + 1][0], forward=False, limit=last - first + 1)[::-1])
+        elif first == 0:
+            self.load(first, self.read(None, forward=True, limit=last + 1))
+        elif last == self.count - 1:
+            self.load(first, self.read(None, forward=False, limit=last - first + 1)[::-1])
+        else:
+            logger.debug(f'GamePages reading entries {first}-{last} by offset')
+            self.load(first, self.read(None, forward=True, limit=last - first + 1, offset=first))
+
+    def read(self, after: tuple, forward: bool, limit: int, offset: int = 0) -> List[Game]:
+        # Up to limit games following the sort keys after (or from the start of the list if None), in list order when
+        # forward or in reverse list order when not. offset is only for jumps to a page with no loaded neighbour
+        largest_first = forward == self.descending
+        query = self.query.select_extend(*[key.alias(f'page_key_{i}') for i, key in enumerate(self.keys)])
+        if after is not None:
+            query = query.where((Row(*self.keys) < Row(*after)) if largest_first else (Row(*self.keys) > Row(*after)))
+        query = query.order_by(*[key.desc() if largest_first else key.asc() for key in self.keys]).limit(limit)
+        if offset:
+            query = query.offset(offset)
+        return Game.load_game_list(query)
+
+    def load(self, start: int, games: List[Game]):
+        summaries = utilities.summarize_game_list(games, player_discord_id=self.player_discord_id)
+        for index, (game, summary) in enumerate(zip(games, summaries), start):
+            keys = tuple(getattr(game, f'page_key_{i}') for i in range(len(self.keys)))
+            self.rows[index] = (keys, summary)
@@ -5,10 +5,13 @@
 import modules.exceptions as exceptions
 import modules.achievements as achievements
 from modules import channels
+from modules import game_pages
 from modules import image_storage
+from modules import leaderboard_cache
+from modules import team_leaderboard
 import peewee
 import modules.models as models
-from modules.models import Game, db, Player, Team, DiscordMember, Squad, GameSide, Tribe, Lineup
+from modules.models import Game, db, Player, Team, DiscordMember, Squad, GameSide, Tribe, Lineup, EloLedger, Leaderboard
 from modules.league import auto_grad_novas, populate_league_team_channels, get_team_leadership
 import modules.league as league
 from itertools import groupby
@@ -18,8 +21,6 @@
 import re
 from matplotlib import pyplot as plt
 import io
-import pandas as pd
-import scipy.signal as signal
 
 logger = logging.getLogger('polybot.' + __name__)
 elo_logger = logging.getLogger('polybot.elo')
@@ -183,6 +184,7 @@ async def on_member_remove(self, member):
             for l in pending_lineups:
                 models.GameLog.write(game_id=l.game.id, guild_id=member.guild.id, message=f'{models.GameLog.member_string(member)} left the game while leaving the server.')
 
+            models.PlayerStats.invalidate([leaving_player.id])
             q = Lineup.delete().where(models.Lineup.id.in_(pending_lineups))
 
             logger.info(f'Existing ELO player {member.display_name} {member.id} left guild {member.guild.name} - deleted Lineup records for {q.execute()} pending games.')
@@ -221,6 +223,8 @@ async def on_member_update(self, before, after):
                 return
             player.is_banned = True
             player.save()
+            Leaderboard.refresh(players=[player])
+            leaderboard_cache.invalidate(guild_id=after.guild.id)
             logger.info(f'ELO Ban added for player {player.id} {player.name}')
             models.GameLog.write(game_id=0, guild_id=after.guild.id, message=f'{models.GameLog.member_string(after)} had *ELO Banned* role applied.')
 
@@ -232,6 +236,8 @@ async def on_member_update(self, before, after):
                 return
             player.is_banned = False
             player.save()
+            Leaderboard.refresh(players=[player])
+            leaderboard_cache.invalidate(guild_id=after.guild.id)
             logger.info(f'ELO Ban removed for player {player.id} {player.name}')
             models.GameLog.write(game_id=0, guild_id=after.guild.id, message=f'{models.GameLog.member_string(after)} had *ELO Banned* role removed.')
 
@@ -283,6 +289,8 @@ async def lb(self, ctx, *, filters: str = ''):
         Ranks leaderboard by a player's maximum ELO ever achieved
         **allplayers**
         Includes players who have not played recently. By default the leaderboard drops players who have not played in 365 days.
+        **YYYY-MM-DD**
+        Shows the leaderboard as it stood at the end of that date, for example at the end of a season.
 
         Examples:
         `[p]lb` - Default local leaderboard
@@ -290,6 +298,7 @@ async def lb(self, ctx, *, filters: str = ''):
         `[p]lb max` - Local leaderboard for maximum historic ELO
         `[p]lb allplayers` - Local leaderboard including inactive players
         `[p]lb global max` - Leaderboard of maximum historic *global* ELO
+        `[p]lb 2021-06-30` - Local leaderboard as it stood on June 30th, 2021
 
         `[p]lbrecent` - Most active players of the last 30 days
         `[p]lbactivealltime` - Most active players of all time
@@ -307,9 +316,7 @@ async def lb(self, ctx, *, filters: str = ''):
         `[p]lb global alltime allplayers max` - Global leaderboard, including inactive players, ranked by maximum hstoric Alltime ELO
         """
 
-        leaderboard = []
         max_flag, global_flag, version = False, False, None
-        target_model = Player
         lb_title = 'Individual Leaderboard'
         date_cutoff = settings.date_cutoff
 
@@ -319,7 +326,6 @@ async def lb(self, ctx, *, filters: str = ''):
         if 'GLOBAL' in filters.upper():
             global_flag = True
             lb_title = 'Global Leaderboard'
-            target_model = DiscordMember
 
         if 'ALLPLAYERS' in filters.upper():
             lb_title += ' - Including Inactive Players'
@@ -333,21 +339,48 @@ async def lb(self, ctx, *, filters: str = ''):
             version = 'ALLTIME'  # leaderboard ranked by player.elo_alltime
             lb_title += ' - Alltime (not reset)'
 
+        as_of = None
+        date_match = re.search(r'\b(\d{4}-\d{1,2}-\d{1,2})\b', filters)
+        if date_match:
+            try:
+                as_of = datetime.datetime.strptime(date_match[1], '%Y-%m-%d').date()
+            except ValueError:
+                return await ctx.send(f'Could not read "**{date_match[1]}**" as a date. Use the format `{ctx.prefix}{ctx.invoked_with} 2021-06-30`.')
+            lb_title += f' - As of {as_of}'
+
+        def process_historical_leaderboard():
+            utilities.connect()
+            active_days = None if date_cutoff == datetime.date.min else (datetime.datetime.today() - settings.date_cutoff).days
+            rows = list(Leaderboard.as_of(
+                timestamp=datetime.datetime.combine(as_of + datetime.timedelta(days=1), datetime.time.min),
+                guild_id=None if global_flag else ctx.guild.id, max_flag=max_flag, version=version, active_days=active_days
+            ).limit(2000))
+            leaderboard = [(f'{row.rank:>3}. {row.team_emoji or ""}{row.name}', f'`ELO {row.board_elo}`') for row in rows]
+            return leaderboard, rows[0].total if rows else 0
+
         def process_leaderboard():
             utilities.connect()
-            leaderboard_query = target_model.leaderboard(date_cutoff=date_cutoff, guild_id=ctx.guild.id, max_flag=max_flag, version=version)
+            board = Leaderboard.get_board(date_cutoff=date_cutoff, guild_id=None if global_flag else ctx.guild.id, max_flag=max_flag, version=version)
 
-            for counter, player in enumerate(leaderboard_query[:2000]):
-                wins, losses = player.get_record(version=version)
+            leaderboard = []
+            for entry in board.entries(limit=2000):
+                player = entry.discord_member if global_flag else entry.player
                 emoji_str = player.team.emoji if not global_flag and player.team else ''
 
                 leaderboard.append(
-                    (f'{(counter + 1):>3}. {emoji_str}{player.name}', f'`ELO {player.elo_field}\u00A0\u00A0\u00A0\u00A0W {wins} / L {losses}`')
+                    (f'{entry.rank:>3}. {emoji_str}{player.name}', f'`ELO {entry.elo}\u00A0\u00A0\u00A0\u00A0W {entry.wins} / L {entry.losses}`')
                 )
-            return leaderboard, leaderboard_query.count()
+            return leaderboard, board.size
 
-        async with ctx.typing():
-            leaderboard, leaderboard_size = await asyncio.get_running_loop().run_in_executor(None, process_leaderboard)
+        cache_key = ('lb', None if global_flag else ctx.guild.id, max_flag, version, date_cutoff, as_of)
+        cached = leaderboard_cache.cache.get(cache_key)
+        if cached:
+            leaderboard, leaderboard_size = cached
+        else:
+            async with ctx.typing():
+                leaderboard, leaderboard_size = await asyncio.get_running_loop().run_in_executor(
+                    None, leaderboard_cache.get_or_build, cache_key, process_historical_leaderboard if as_of else process_leaderboard
+                )
 
         # if ctx.guild.id != settings.server_ids['polychampions']:
         #     await ctx.send('Powered by PolyChampions. League server with a team focus and competitive players.\n'
@@ -378,14 +411,12 @@ async def lbrecent(self, ctx):
             ).group_by(DiscordMember.id).order_by(-peewee.SQL('count'))
 
             for counter, discord_member in enumerate(query[:1000]):
-                wins, losses = discord_member.get_record()
                 leaderboard.append(
                     (f'{(counter + 1):>3}. {discord_member.name}', f'`ELO {discord_member.elo_moonrise}\u00A0\u00A0\u00A0\u00A0Games Played {discord_member.count}`')
                 )
             title = '**Most active players of all time**'
         else:
             for counter, player in enumerate(query[:500]):
-                wins, losses = player.get_record()
                 emoji_str = player.team.emoji if player.team else ''
                 leaderboard.append(
                     (f'{(counter + 1):>3}. {emoji_str}{player.name}', f'`ELO {player.elo_moonrise}\u00A0\u00A0\u00A0\u00A0Recent Games {player.count}`')
@@ -415,11 +446,8 @@ async def lbteam(self, ctx, *, arg: str = None):
         alltime = False  # Removed option to show pre-reset ELO during refactor May 2024
         
         tier_number, tier_name, tier_string = None, None, ''
-        archived_arg = (Team.is_archived == 0)
         footer_message = ''
-
-        if 'old' in args:
-            archived_arg = (True)
+        include_archived = 'old' in args
 
         remaining_args = [arg for arg in args if arg not in ['old']]
 
@@ -430,65 +458,53 @@ async def lbteam(self, ctx, *, arg: str = None):
             except exceptions.NoMatches as e:
                 return await ctx.send(f'Could not match "**{remaining_args[0]}**" to the name or number of a League tier. See `{ctx.prefix}help {ctx.invoked_with}` for usage examples.')
 
+        guild_check = settings.server_ids['polychampions'] if ctx.guild.id == settings.server_ids['test'] else ctx.guild.id
+
+        cache_key = ('lbteam', guild_check, tier_number, include_archived)
+        cached = leaderboard_cache.cache.get(cache_key)
+        if cached:
+            embed_dict, graph = cached
+            return await ctx.send(embed=discord.Embed.from_dict(embed_dict), file=discord.File(io.BytesIO(graph), filename='graph.png'))
+        cache_generation = leaderboard_cache.cache.generation
+
+        def load_standings():
+            utilities.connect()
+            return team_leaderboard.build(guild_id=guild_check, league_tier=tier_number, include_archived=include_archived, alltime=alltime)
+
         embed = discord.Embed(title=f'**Team Leaderboard{tier_string}**')
         fig, ax = plt.subplots(figsize=(12, 8))
         plt.style.use('default')
         fig.suptitle('Team ELO History', fontsize=16)
         fig.autofmt_xdate()
 
-        guild_check = settings.server_ids['polychampions'] if ctx.guild.id == settings.server_ids['test'] else ctx.guild.id
-
-        if tier_number:
-            query = Team.select().where(
-                (Team.is_hidden == 0) & (archived_arg) & 
-                (Team.guild_id == guild_check) & (Team.league_tier == tier_number)
-            ).order_by(-Team.elo)
-        else:
-            query = Team.select().where(
-                (Team.is_hidden == 0) & (archived_arg) &
-                (Team.guild_id == guild_check) & (Team.league_tier.is_null(False))
-            ).order_by(-Team.elo)
-
         async with ctx.typing():
-            for counter, team in enumerate(query):
-                if counter > 24:
-                    footer_message = f'Only first 25 teams shown. You can specify a tier, example: {ctx.prefix}lb platinum'
-                    continue
-                team_role = discord.utils.get(ctx.guild.roles, name=team.name)
+            standings, team_count = await asyncio.get_running_loop().run_in_executor(None, load_standings)
+            if team_count > team_leaderboard.MAX_TEAMS:
+                footer_message = f'Only first {team_leaderboard.MAX_TEAMS} teams shown. You can specify a tier, example: {ctx.prefix}lb platinum'
+
+            roles_by_name = {}
+            for role in ctx.guild.roles:
+                roles_by_name.setdefault(role.name, role)
+            member_counts = team_leaderboard.member_counts(ctx.guild, settings.guild_setting(ctx.guild.id, 'inactive_role'))
+
+            for counter, standing in enumerate(standings):
+                team = standing.team
+                team_role = roles_by_name.get(team.name)
                 if not team_role:
                     logger.error(f'Could not find matching role for team {team.name}')
                     continue
-                member_count = 0
-                mia_role = discord.utils.get(ctx.guild.roles, name=settings.guild_setting(ctx.guild.id, 'inactive_role'))
-                for team_member in team_role.members:
-                    if mia_role and mia_role in team_member.roles:
-                        continue
-                    member_count += 1
+                member_count = member_counts.get(team_role.id, 0)
                 team_name_str = f'**{team.name}**   ({member_count})'  # Show team name with number of members without MIA role
-                wins, losses = team.get_record(alltime=alltime)
-
-                elo = team.elo_alltime if alltime else team.elo
-                embed.add_field(name=f'{team.emoji} {(counter + 1):>3}. {team_name_str}\n`ELO: {elo:<5} W {wins} / L {losses}`', value='\u200b', inline=False)
-
-                team_elo_history_query = (GameSide
-                        .select(Game.completed_ts, (GameSide.team_elo_after_game_alltime if alltime else GameSide.team_elo_after_game).alias('elo'))
-                        .join(Game)
-                        .where((GameSide.team_id == team.id) & ((GameSide.team_elo_after_game_alltime if alltime else GameSide.team_elo_after_game).is_null(False)))
-                        .order_by(Game.completed_ts))
-
-                if team_elo_history_query:
-                    team_elo_history = pd.DataFrame(team_elo_history_query.dicts())
-                    team_elo_history_resampled = team_elo_history.set_index('completed_ts').resample('D').mean().interpolate().reset_index()
-                    filter_length = max(int(len(team_elo_history_resampled.index) / 3), 1)
-                    filter_length = filter_length if filter_length % 2 != 0 else filter_length - 1
-                    poly_order = 2 if filter_length > 2 else 0
-
-                    plt.plot(team_elo_history['completed_ts'],
-                                team_elo_history['elo'],
+
+                embed.add_field(name=f'{team.emoji} {(counter + 1):>3}. {team_name_str}\n`ELO: {standing.elo:<5} W {standing.wins} / L {standing.losses}`', value='\u200b', inline=False)
+
+                if standing.history:
+                    plt.plot(standing.history.completed_ts,
+                                standing.history.elo,
                                 'o', markersize=3, alpha=.05, color=str(team_role.color))
 
-                    plt.plot(team_elo_history_resampled['completed_ts'],
-                                signal.savgol_filter(team_elo_history_resampled['elo'].values, filter_length, poly_order),
+                    plt.plot(standing.history.days,
+                                standing.history.smoothed,
                                 '-', linewidth=2, label=team.name, color=str(team_role.color))
 
         ax.yaxis.grid()
@@ -505,12 +521,13 @@ async def lbteam(self, ctx, *, arg: str = None):
         embed.set_image(url='attachment://graph.png')
 
         with open('graph.png', 'rb') as f:
-            file = io.BytesIO(f.read())
+            graph = f.read()
 
-        image = discord.File(file, filename='graph.png')
+        image = discord.File(io.BytesIO(graph), filename='graph.png')
 
         if footer_message:
             embed.set_footer(text=footer_message)
+        leaderboard_cache.cache.put(cache_key, (embed.to_dict(), graph), generation=cache_generation)
         await ctx.send(embed=embed, file=image)
 
     @settings.in_bot_channel_strict()
@@ -528,7 +545,6 @@ async def lbsquad(self, ctx, *, filters: str = ''):
         `[p]lbsquad alltime` - Alltime leaderboard.
         """
 
-        leaderboard = []
         lb_title = 'Squad Leaderboard'
         date_cutoff = settings.date_cutoff
 
@@ -539,6 +555,7 @@ async def lbsquad(self, ctx, *, filters: str = ''):
         def process_leaderboard():
             utilities.connect()
             squads = Squad.leaderboard(date_cutoff=date_cutoff, guild_id=ctx.guild.id)
+            leaderboard = []
             for counter, sq in enumerate(squads[:500]):
                 wins, losses = sq.get_record()
                 squad_members = sq.get_members()
@@ -552,8 +569,15 @@ def process_leaderboard():
                 )
             return leaderboard, squads.count()
 
-        async with ctx.typing():
-            leaderboard, leaderboard_size = await asyncio.get_running_loop().run_in_executor(None, process_leaderboard)
+        cache_key = ('lbsquad', ctx.guild.id, date_cutoff)
+        cached = leaderboard_cache.cache.get(cache_key)
+        if cached:
+            leaderboard, leaderboard_size = cached
+        else:
+            async with ctx.typing():
+                leaderboard, leaderboard_size = await asyncio.get_running_loop().run_in_executor(
+                    None, leaderboard_cache.get_or_build, cache_key, process_leaderboard
+                )
 
         await utilities.paginate(self.bot, ctx, title=f'**{lb_title}**\n{leaderboard_size} ranked squads', message_list=leaderboard, page_start=0, page_end=10, page_size=10)
 
@@ -750,13 +774,20 @@ async def player(self, ctx, *, args=None):
 
         def async_create_player_embed():
             utilities.connect()
-            wins, losses = player.get_record(version='alltime' if alltime_flag else None)
-            rank, lb_length = player.leaderboard_rank(settings.date_cutoff)
+            # Records and counters for every server the member is on, from the PlayerStats rollup
+            stats_by_guild = models.PlayerStats.for_member(player.discord_member)
+            stats = stats_by_guild[player.guild_id]
+            global_server_list = settings.servers_included_in_global_lb()
+            global_stats = models.PlayerStats.combined(s for guild_id, s in stats_by_guild.items() if guild_id in global_server_list)
+
+            wins, losses = stats.record(version='alltime' if alltime_flag else None)
+            standing = player.leaderboard_standing(settings.date_cutoff)
 
-            wins_g, losses_g = player.discord_member.get_record(version='alltime' if alltime_flag else None)
-            rank_g, lb_length_g = player.discord_member.leaderboard_rank(settings.date_cutoff)
+            wins_g, losses_g = global_stats.record(version='alltime' if alltime_flag else None)
+            standing_g = player.discord_member.leaderboard_standing(settings.date_cutoff)
 
-            polychamps_record = player.discord_member.get_polychamps_record()
+            polychamps_stats = stats_by_guild.get(settings.server_ids['polychampions'])
+            polychamps_record = polychamps_stats.tier_records() if polychamps_stats else None
 
             image = None
             air_record = []
@@ -773,10 +804,10 @@ def async_create_player_embed():
                     elo_max = player.elo_max_moonrise
                     g_elo_max = player.discord_member.elo_max_moonrise
 
-                    air_record_g = player.discord_member.get_record(version='air')
+                    air_record_g = global_stats.record(version='air')
 
                     if air_record_g[0] or air_record_g[1]:
-                        air_record_l = player.get_record(version='air')
+                        air_record_l = stats.record(version='air')
                         air_record = [('Global Record', f'W {air_record_g[0]} / L {air_record_g[1]}'),
                                       ('Global ELO', f'{player.discord_member.elo} / {player.discord_member.elo_max} Max'),
                                       ('Local Record', f'W {air_record_l[0]} / L {air_record_l[1]}'),
@@ -787,15 +818,15 @@ def async_create_player_embed():
                     elo_max = player.elo_max
                     g_elo_max = player.discord_member.elo_max
 
-            if rank is None:
+            if standing.rank is None:
                 rank_str = 'Unranked'
             else:
-                rank_str = f'{rank} of {lb_length}'
+                rank_str = f'{standing.rank} of {standing.total} ({standing.percentile:g} pct)'
 
             results_str = f'ELO: {elo}\nW\u00A0{wins}\u00A0/\u00A0L\u00A0{losses}'
 
-            if rank_g:
-                rank_str = f'{rank_str}\n{rank_g} of {lb_length_g} *Global*'
+            if standing_g.rank:
+                rank_str = f'{rank_str}\n{standing_g.rank} of {standing_g.total} ({standing_g.percentile:g} pct) *Global*'
                 results_str = f'{results_str}\n**Global**\nELO: {g_elo}\nW\u00A0{wins_g}\u00A0/\u00A0L\u00A0{losses_g}'
 
             # embed = discord.Embed(title=f'Player card for __{player.name}__')
@@ -839,7 +870,7 @@ def async_create_player_embed():
 
 
             misc_stats = []
-            (winning_streak, losing_streak, v2_count, v3_count, duel_wins, duel_losses, wins_as_host, ranked_games_played) = player.discord_member.advanced_stats()
+            (winning_streak, losing_streak, v2_count, v3_count, duel_wins, duel_losses, wins_as_host, ranked_games_played) = player.discord_member.advanced_stats(cached=True)
             if winning_streak or losing_streak:
                 misc_stats.append(('Longest streaks', f'{winning_streak} wins, {losing_streak} losses'))
             if v2_count:
@@ -855,7 +886,7 @@ def async_create_player_embed():
             if g_elo_max > 1000:
                 misc_stats.append(('Max ELO achieved', f'{g_elo_max} G \u200b - \u200b {elo_max} L'))
 
-            favorite_tribes = player.discord_member.favorite_tribes(limit=3)
+            favorite_tribes = models.PlayerStats.combined(stats_by_guild.values()).favorite_tribes(limit=3)
             if favorite_tribes:
                 tribes_str = ' '.join([f'{t["emoji"] if t["emoji"] else t["name"]}' for t in favorite_tribes])
                 misc_stats.append(('Most-logged tribes', tribes_str))
@@ -871,26 +902,14 @@ def async_create_player_embed():
                 air_record = [stat.replace(".", "\u200b ") for stat in air_record]
                 embed.add_field(name='__Pre-Moonrise Reset Stats__', value='\n'.join(air_record), inline=False)
 
-            global_elo_history_query = (Player
-                .select(Game.completed_ts, Lineup.elo_after_game_global, Lineup.elo_after_game_global_moonrise, Lineup.elo_after_game_global_alltime)
-                .join(Lineup)
-                .join(Game)
-                .where((Player.discord_member_id == player.discord_member_id) & ((Lineup.elo_after_game_global.is_null(False)) | (Lineup.elo_after_game_global_moonrise.is_null(False))))
-                .order_by(Game.completed_ts))
+            elo_flavours = ['elo_alltime'] if alltime_flag else ['elo', 'elo_moonrise']
+            global_elo_history = EloLedger.history('discordmember', player.discord_member_id, elo_flavours).tuples()
+            local_elo_history = EloLedger.history('player', player.id, elo_flavours).tuples()
 
-            global_elo_history_dates = [l.completed_ts for l in global_elo_history_query.objects()]
-
-            # if global_elo_history_dates:
-            local_elo_history_query = (Lineup
-                .select(Game.completed_ts, Lineup.elo_after_game, Lineup.elo_after_game_alltime, Lineup.elo_after_game_moonrise)
-                .join(Game)
-                .where((Lineup.player_id == player.id) & ((Lineup.elo_after_game.is_null(False)) | (Lineup.elo_after_game_moonrise.is_null(False))))
-            )
-
-            local_elo_history_dates = [l.completed_ts for l in local_elo_history_query.objects()]
-            local_elo_history_elos = [l.elo_after_game_alltime for l in local_elo_history_query.objects()] if alltime_flag else [l.elo_after_game or l.elo_after_game_moonrise for l in local_elo_history_query.objects()]
-
-            global_elo_history_elos = [l.elo_after_game_global_alltime for l in global_elo_history_query.objects()] if alltime_flag else [l.elo_after_game_global or l.elo_after_game_global_moonrise for l in global_elo_history_query.objects()]
+            global_elo_history_dates = [completed_ts for completed_ts, _ in global_elo_history]
+            global_elo_history_elos = [elo for _, elo in global_elo_history]
+            local_elo_history_dates = [completed_ts for completed_ts, _ in local_elo_history]
+            local_elo_history_elos = [elo for _, elo in local_elo_history]
 
             try:
                 server_name = settings.guild_setting(guild_id=player.guild_id, setting_name='display_name')
@@ -927,15 +946,14 @@ def async_create_player_embed():
 
                 image = discord.File(file, filename='graph.png')
 
-            games_list = Game.search(player_filter=[player])
-            if not games_list:
+            if not stats.games_total:
                 recent_games_str = 'No games played'
             else:
-                recent_games_count = player.games_played(in_days=30).count()
-                recent_games_str = f'__Most recent games ({len(games_list)} total, {recent_games_count} recently):__'
+                recent_games_count = stats.recent_game_count(in_days=30)
+                recent_games_str = f'__Most recent games ({stats.games_total} total, {recent_games_count} recently):__'
             embed.add_field(value='\u200b', name=recent_games_str, inline=False)
 
-            game_list = utilities.summarize_game_list(games_list[:5])
+            game_list = utilities.summarize_game_list(Game.search(player_filter=[player]).limit(5))
             for game, result in game_list:
                 embed.add_field(name=game, value=result, inline=False)
 
@@ -1026,7 +1044,6 @@ async def team(self, ctx, *, team_string: str = None):
                     if len(p) == 0:
                         member_stats.append((member.name, 0, f'`{member.name[:23]:.<25}{"-":.<8}{"-":.<6}{"-":.<4}`'))
                     else:
-                        wins, losses = p[0].get_record()
                         lb_rank = p[0].leaderboard_rank(date_cutoff=settings.date_cutoff)[0]
                         rank_str = f'#{lb_rank}' if lb_rank else '-'
                         if completed_flag:
@@ -1063,25 +1080,15 @@ async def team(self, ctx, *, team_string: str = None):
         for game, result in game_list:
             embed.add_field(name=game, value=result)
 
-        alltime_team_elo_history_query = (GameSide
-                .select(Game.completed_ts, GameSide.team_elo_after_game_alltime)
-                .join(Game)
-                .where((GameSide.team_id == team.id) & (GameSide.team_elo_after_game_alltime.is_null(False)))
-                .order_by(Game.completed_ts))
-
-        alltime_team_elo_history_dates = [l.completed_ts for l in alltime_team_elo_history_query.objects()]
+        alltime_team_elo_history = EloLedger.history('team', team.id, ['elo_alltime']).tuples()
+        alltime_team_elo_history_dates = [completed_ts for completed_ts, _ in alltime_team_elo_history]
 
         if alltime_team_elo_history_dates:
-            alltime_team_elo_history_elos = [l.team_elo_after_game_alltime for l in alltime_team_elo_history_query.objects()]
-
-            team_elo_history_query = (GameSide
-                .select(Game.completed_ts, GameSide.team_elo_after_game)
-                .join(Game)
-                .where((GameSide.team_id == team.id) & (GameSide.team_elo_after_game.is_null(False)))
-                .order_by(Game.completed_ts))
+            alltime_team_elo_history_elos = [elo for _, elo in alltime_team_elo_history]
 
-            team_elo_history_dates = [l.completed_ts for l in team_elo_history_query.objects()]
-            team_elo_history_elos = [l.team_elo_after_game for l in team_elo_history_query.objects()]
+            team_elo_history = EloLedger.history('team', team.id, ['elo']).tuples()
+            team_elo_history_dates = [completed_ts for completed_ts, _ in team_elo_history]
+            team_elo_history_elos = [elo for _, elo in team_elo_history]
 
             plt.style.use('default')
 
@@ -2132,6 +2139,7 @@ async def settribe(self, ctx, *, args: str = None):
 
             lineup_match.tribe = tribe
             lineup_match.save()
+            models.PlayerStats.invalidate([lineup_match.player_id])
             await ctx.send(f'Player **{lineup_match.player.name}** assigned to tribe *{tribe.name if tribe else "None"}* in game {game.id} {tribe.emoji if tribe else ""}')
             models.GameLog.write(game_id=game.id, guild_id=game.guild_id, message=f'{models.GameLog.member_string(ctx.author)} assigned tribe of player {models.GameLog.member_string(lineup_match.player.discord_member)} to *{tribe.name if tribe else "None"}*')
 
@@ -2230,13 +2238,11 @@ async def game_search(self, ctx, mode: str, arg_list):
             def async_game_search():
                 utilities.connect()
                 query = Game.search(status_filter=status_filter, guild_id=ctx.guild.id)
-                if status_filter == 2:
-                    query = list(query)  # reversing 'Incomplete' queries so oldest is at top
-                    query.reverse()
+                # reversing 'Incomplete' queries so oldest is at top
+                game_list = game_pages.GamePages(query, Game.search_ordering(), descending=status_filter != 2)
                 logger.debug(f'Searching games, status filter: {status_filter}')
-                logger.debug(f'Returned {len(query)} results')
-                list_name = f'All {status_str}s ({len(query)})'
-                game_list = utilities.summarize_game_list(query[:500])
+                logger.debug(f'Returned {len(game_list)} results')
+                list_name = f'All {status_str}s ({len(game_list)})'
                 return game_list, list_name
 
             game_list, list_name = await asyncio.get_running_loop().run_in_executor(None, async_game_search)
@@ -2282,9 +2288,9 @@ def async_game_search():
                 utilities.connect()
                 query = Game.search(status_filter=status_filter, player_filter=player_matches, team_filter=team_matches, title_filter=remaining_args, guild_id=ctx.guild.id, size_filter=team_sizes)
                 logger.debug(f'Searching games, status filter: {status_filter}, player_filter: {player_matches}, team_filter: {team_matches}, title_filter: {remaining_args}')
-                logger.debug(f'Returned {len(query)} results')
-                game_list = utilities.summarize_game_list(query[:500], player_discord_id=player_discord_id)
-                list_name = f'{len(query)} {status_str}{"s" if len(query) != 1 else ""}\n{results_str}'
+                game_list = game_pages.GamePages(query, Game.search_ordering(remaining_args), player_discord_id=player_discord_id)
+                logger.debug(f'Returned {len(game_list)} results')
+                list_name = f'{len(game_list)} {status_str}{"s" if len(game_list) != 1 else ""}\n{results_str}'
                 return game_list, list_name
 
             game_list, list_name = await asyncio.get_running_loop().run_in_executor(None, async_game_search)
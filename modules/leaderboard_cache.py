@@ -0,0 +1,84 @@
+"""In-process cache of rendered leaderboard pages.
+
+``lb``, ``lbsquad`` and ``lbteam`` only change when a game is confirmed,
+unconfirmed or deleted, or when a player gains or loses the ELO Banned role.
+Their rendered output is kept here, keyed by ``(command, guild_id, *filters)``
+with ``guild_id`` None for global boards. The code paths that change results
+call ``invalidate()`` for the guild involved. The TTL covers anything else
+that shows up on a page, such as team role membership or a player renaming
+themselves.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 128
+TTL_SECONDS = 60 * 60
+
+
+class LeaderboardCache:
+    """An LRU cache with a TTL whose entries can be dropped per guild.
+
+    Leaderboards are built in executor threads, so every method takes a lock.
+    An invalidation bumps a generation counter, and a page that was being
+    built when it happened is returned but not stored.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = 0
+        self._entries = OrderedDict()  # {key: (expires, value)}, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation: int = None):
+        """Store value for key, unless the cache was invalidated since generation was read."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, build):
+        """Return the cached value for key, calling build() and storing its result on a miss."""
+        value = self.get(key)
+        if value is None:
+            generation = self.generation
+            value = build()
+            self.put(key, value, generation=generation)
+        return value
+
+    def invalidate(self, guild_id: int = None):
+        """Drop the pages for guild_id and every global page, or all pages if guild_id is None."""
+        with self._lock:
+            self.generation += 1
+            if guild_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[1] in (guild_id, None)]:
+                del self._entries[key]
+
+
+cache = LeaderboardCache()
+get_or_build = cache.get_or_build
+invalidate = cache.invalidate
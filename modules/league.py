@@ -178,7 +178,6 @@ class league(commands.Cog):
     emoji_draft_conclude = '❎'
     emoji_draft_list = [emoji_draft_signup, emoji_draft_close, emoji_draft_conclude]
 
-    season_standings_cache = {}
     last_team_elos = defaultdict(lambda: [])
 
     draft_open_format_str = f'The league is now open for Free Agent signups! {{0}}s can react with a {emoji_draft_signup} below to sign up. {{1}} who have not graduated have until the end of the signup period to meet requirements and sign up. If Free Agents have favorite teams, they may react to the team emojis in <#1489844936202260710> to note those preferences.\n\n{{3}}'
@@ -1050,9 +1049,9 @@ async def season(self, ctx, *, season: str = None):
         else:
             title = f'League Records - All Seasons'
 
-        tiers_list = models.Game.polychamps_tiers_by_season(season=season)  # List of league_tiers that had games in the given season
+        standings = models.SeasonStandings.standings(season=season)  # league_tiers that had games in the given season, with their records
         output = [f'__**{title}**__']
-        for tier in tiers_list:
+        for tier, season_records in standings:
 
             tier_name = settings.tier_lookup(tier)[1]
 
@@ -1062,7 +1061,6 @@ async def season(self, ctx, *, season: str = None):
                 tier_name = "Jr"
 
             output.append(f'\n__**{tier_name} Tier**__\n`Regular \u200b \u200b \u200b \u200b \u200b Post-Season`')
-            season_records = models.Team.polychamps_tier_records(league_tier=tier, league_season=season)
             for sr in season_records:
                 team_str = f'{sr.emoji} {sr.name}\n'
                 line = f'{team_str}`{str(sr.regular_season_wins) + "W":.<3} {str(sr.regular_season_losses) + "L":.<3} {str(sr.regular_season_incomplete) + "I":.<3} - {str(sr.post_season_wins) + "W":.<3} {str(sr.post_season_losses) + "L":.<3} {sr.post_season_incomplete}I`'
@@ -1313,7 +1311,7 @@ async def league_export(self, ctx, *, arg=None):
         if export_logs:
             query = (models.Game
                 .select(models.Game, peewee.fn.ARRAY_AGG(models.GameLog.message).alias('gamelogs'))
-                .join(models.GameLog, peewee.JOIN.LEFT_OUTER, on=(models.GameLog.message ** peewee.fn.CONCAT('__', models.Game.id, '__%')))
+                .join(models.GameLog, peewee.JOIN.LEFT_OUTER, on=(models.GameLog.game_id == models.Game.id))
                 .where(
                     (models.Game.is_confirmed == 1) & (models.Game.guild_id == settings.server_ids['polychampions']) & (models.Game.is_ranked == 1) &
                     ((models.Game.size == [2, 2]) | (models.Game.size == [3, 3]))
@@ -1607,8 +1605,9 @@ async def task_send_polychamps_invite(self):
         utilities.connect()
         dms = models.DiscordMember.members_not_on_polychamps()
         logger.info(f'{len(dms)} discordmember results')
+        records = models.DiscordMember.get_records([dm.id for dm in dms])
         for dm in dms:
-            wins_count, losses_count = dm.wins().count(), dm.losses().count()
+            wins_count, losses_count = records[dm.id]
             logger.debug(f'Evaluating {dm.name} - W:{wins_count} L:{losses_count} ELO_MAX_MOONRISE: {dm.elo_max_moonrise}')
             if wins_count < 5:
                 logger.debug(f'Skipping {dm.name} - insufficient winning games {wins_count}')
@@ -534,6 +534,7 @@ async def opengame(self, ctx, *, args=None):
                     fatal_warning = True
             else:
                 models.Lineup.create(player=host, game=opengame, gameside=first_side)
+                models.PlayerStats.invalidate([host.id])
                 if first_side.position > 1:
                     warning_message = ':warning: You are not joined to side 1, due to the ordering of the role restrictions. Therefore you will not be the game host.'
 
@@ -1037,8 +1038,10 @@ async def start(self, ctx, game: PolyMatch = None, *, name: str = None):
             game.date = datetime.datetime.today()
             game.is_pending = False
             game.save()
+            models.PlayerStats.invalidate(models.Lineup.select(models.Lineup.player).where(models.Lineup.game == game))
 
             game.update_league_fields()
+            models.SeasonStandings.invalidate([game.league_season])
             if game.league_season:
                 league_warning = f'\n:warning: Detected season game information. Status is:\nGame season: `{game.league_season}`, Team tier: `{game.league_tier}`,  Playoff game? `{game.league_playoff}`'
             else:
@@ -1058,7 +1061,7 @@ async def task_dm_game_creators(self):
             full_games = models.Game.search_pending(status_filter=1, ranked_filter=1)
             logger.debug(f'Starting task_dm_game_creators on {len(full_games)} games')
             for game in full_games:
-                last_joiner = models.GameLog.search(keywords=f'_{game.id}_ joined', guild_id=game.guild_id, limit=1).first()
+                last_joiner = models.GameLog.search(keywords='joined', game_id=game.id, guild_id=game.guild_id, limit=1).first()
                 if last_joiner and last_joiner.message_ts > (datetime.datetime.now() + datetime.timedelta(hours=-12)):
                     logger.debug(f'Skipping task_dm_game_creators for game {game.id} - most recent joiner joined too recently.')
                     continue
@@ -710,13 +710,27 @@ async def roleelo(self, ctx: commands.Context, *, arg=None):
                 logger.debug(f'Player {member.name} not registered.')
                 continue
 
-            g_wins, g_losses = dm.get_record()
-            wins, losses = player.get_record()
+        # One rank lookup per leaderboard rather than one per member
+        global_ranks = models.Leaderboard.get_board(date_cutoff=settings.date_cutoff).ranks(
+            [p.discord_member_id for p in player_obj_list])
+        local_ranks = models.Leaderboard.get_board(date_cutoff=settings.date_cutoff, guild_id=ctx.guild.id).ranks(
+            [p.id for p in player_obj_list])
+        records = {}  # W/L memo, shared with the file export below
+        global_records = models.DiscordMember.get_records([p.discord_member_id for p in player_obj_list], memo=records)
+        local_records = models.Player.get_records([p.id for p in player_obj_list], memo=records)
+
+        for player, member in zip(player_obj_list, member_obj_list):
+            dm = player.discord_member
+            g_rank = f'#{global_ranks[dm.id]}' if dm.id in global_ranks else 'unranked'
+            rank = f'#{local_ranks[player.id]}' if player.id in local_ranks else 'unranked'
+
+            g_wins, g_losses = global_records[dm.id]
+            wins, losses = local_records[player.id]
             recent_games = dm.games_played(in_days=14).count()
             all_games = dm.games_played().count()
             message = (f' {dm.mention()} **{player.name}**'
                        f'\n\u00A0\u00A0 \u00A0\u00A0 \u00A0\u00A0 {recent_games} games played in last 14 days, {all_games} all-time'
-                       f'\n\u00A0\u00A0 \u00A0\u00A0 \u00A0\u00A0 ELO:  {dm.elo_moonrise} *global* / {player.elo_moonrise} *local*\n'
+                       f'\n\u00A0\u00A0 \u00A0\u00A0 \u00A0\u00A0 ELO:  {dm.elo_moonrise} ({g_rank}) *global* / {player.elo_moonrise} ({rank}) *local*\n'
                        f'\u00A0\u00A0 \u00A0\u00A0 \u00A0\u00A0 __W {g_wins} / L {g_losses}__ *global* \u00A0\u00A0 - \u00A0\u00A0 __W {wins} / L {losses}__ *local*\n')
 
             player_list.append((message, dm.elo_moonrise, player.elo_moonrise, all_games, recent_games, member, player))
@@ -737,7 +751,7 @@ async def roleelo(self, ctx: commands.Context, *, arg=None):
 
             def async_call_export_func():
 
-                filename = utilities.export_player_data(player_list=player_obj_list, member_list=member_obj_list)
+                filename = utilities.export_player_data(player_list=player_obj_list, member_list=member_obj_list, memo=records)
                 return filename
 
             async with ctx.typing():
@@ -6,16 +6,18 @@
 import os
 import re
 import statistics
-from typing import Any, Dict, List
+from typing import Any, Dict, List, NamedTuple, Optional
 
 import discord
 from discord.ext import commands
 from peewee import *
+from peewee import EnclosedNodeList
 from playhouse.postgres_ext import *
 from psycopg2.errors import DuplicateObject
 
 import settings
-from modules import channels, exceptions, image_storage
+from modules import channels, exceptions, image_storage, leaderboard_cache
+from modules.write_buffer import WriteBuffer
 
 logger = logging.getLogger('polybot.' + __name__)
 elo_logger = logging.getLogger('polybot.elo')
@@ -65,6 +67,37 @@ def moonrise_or_air_date_range(version: str = None):
         return air
 
 
+def win_loss_records(model, entity_ids, version: str = None, memo: dict = None):
+    # {id: (wins, losses)} for Player or DiscordMember ids from one grouped query, counted the same way as wins() and losses().
+    # memo is an optional dict that lives for one command, so asking again for the same players and version is free.
+    date_min, date_max = moonrise_or_air_date_range(version=version)
+    memo = {} if memo is None else memo
+    keys = {entity_id: (model.__name__, date_min, date_max, entity_id) for entity_id in set(entity_ids)}
+    missing = [entity_id for entity_id, key in keys.items() if key not in memo]
+
+    if missing:
+        entity_field = Player.discord_member if model is DiscordMember else Lineup.player
+        query = Lineup.select(
+            entity_field,
+            fn.SUM(Case(None, [(Game.winner == Lineup.gameside, 1)], 0)),
+            fn.SUM(Case(None, [(Game.winner != Lineup.gameside, 1)], 0)),
+        ).join(Game).join_from(Lineup, Player).where(
+            (Game.is_completed == 1) &
+            (Game.is_confirmed == 1) &
+            (Game.is_ranked == 1) &
+            (Game.date >= date_min) & (Game.date <= date_max) &
+            (entity_field.in_(missing))
+        ).group_by(entity_field)
+        if model is DiscordMember:
+            query = query.where(Game.guild_id.in_(settings.servers_included_in_global_lb()))
+
+        found = {entity_id: (wins, losses) for entity_id, wins, losses in query.tuples()}
+        for entity_id in missing:
+            memo[keys[entity_id]] = found.get(entity_id, (0, 0))
+
+    return {entity_id: memo[key] for entity_id, key in keys.items()}
+
+
 def string_to_user_id(input):
     # copied from Utilities - probably a better way to structure this but currently importing utilities creates circular import
 
@@ -225,24 +258,29 @@ def change_elo_after_game(self, chance_of_winning: float, is_winner: bool):
 
     def get_record(self, alltime=True):
 
+        return Team.get_records([self.id], alltime=alltime)[self.id]
+
+    def get_records(team_ids, alltime=True):
+        # {team_id: (wins, losses)} for many teams from one grouped query, counted the same way as get_record()
+
         if alltime:
             date_cutoff = datetime.date.min
         else:
             date_cutoff = datetime.datetime.strptime(settings.team_elo_reset_date, "%m/%d/%Y").date()
 
-        wins = GameSide.select().join(Game).where(
-            (GameSide.size > 1) & (Game.is_completed == 1) & (Game.is_confirmed == 1) &
-            (Game.is_ranked == 1) & (GameSide.team == self) &
-            (GameSide.id == Game.winner) & (Game.date > date_cutoff)
-        ).count()
-
-        losses = GameSide.select().join(Game).where(
+        team_ids = set(team_ids)
+        query = GameSide.select(
+            GameSide.team,
+            fn.SUM(Case(None, [(GameSide.id == Game.winner, 1)], 0)),
+            fn.SUM(Case(None, [(GameSide.id != Game.winner, 1)], 0)),
+        ).join(Game).where(
             (GameSide.size > 1) & (Game.is_completed == 1) & (Game.is_confirmed == 1) &
-            (Game.is_ranked == 1) & (GameSide.team == self) &
-            (GameSide.id != Game.winner) & (Game.date > date_cutoff)
-        ).count()
+            (Game.is_ranked == 1) & (GameSide.team.in_(team_ids)) & (Game.date > date_cutoff)
+        ).group_by(GameSide.team)
 
-        return (wins, losses)
+        records = {team_id: (0, 0) for team_id in team_ids}
+        records.update({team_id: (wins, losses) for team_id, wins, losses in query.tuples()})
+        return records
 
     def polychamps_tier_records(self=None, *, league_season=None, league_tier):
         # Queries the regular/post win/loss/incomplete records of teams that participated in a specific league_tier
@@ -303,27 +341,20 @@ def polychamps_tier_records(self=None, *, league_season=None, league_tier):
         return query
     
     def get_season_record(self, season=None):
+        # (regular W, L, incomplete, post-season W, L, incomplete) over every tier, for one season or all seasons if None
 
         logger.debug(f'in get_season_record season {season}')
 
         if self.guild_id != settings.server_ids['polychampions'] or self.is_hidden:
             return ()
 
-        _, regular_season_games, post_season_games = Game.polychamps_season_games(tier=None, season=season)
+        record = [0] * 6
+        for _, tier_records in SeasonStandings.standings(season=season):
+            for team_record in tier_records:
+                if team_record.team_id == self.id:
+                    record = [a + b for a, b in zip(record, team_record[3:])]
 
-        losses = Game.search(status_filter=4, team_filter=[self])
-        wins = Game.search(status_filter=3, team_filter=[self])
-        incomplete = Game.search(status_filter=2, team_filter=[self])
-
-        win_count_reg = Game.select(Game.id).where(Game.id.in_(wins) & Game.id.in_(regular_season_games)).count()
-        loss_count_reg = Game.select(Game.id).where(Game.id.in_(losses) & Game.id.in_(regular_season_games)).count()
-        incomplete_count_reg = Game.select(Game.id).where(Game.id.in_(incomplete) & Game.id.in_(regular_season_games)).count()
-
-        win_count_post = Game.select(Game.id).where(Game.id.in_(wins) & Game.id.in_(post_season_games)).count()
-        loss_count_post = Game.select(Game.id).where(Game.id.in_(losses) & Game.id.in_(post_season_games)).count()
-        incomplete_count_post = Game.select(Game.id).where(Game.id.in_(incomplete) & Game.id.in_(post_season_games)).count()
-
-        return (win_count_reg, loss_count_reg, incomplete_count_reg, win_count_post, loss_count_post, incomplete_count_post)
+        return tuple(record)
 
     def related_external_severs(guild_id: int):
         # return a list of external server IDs from a given guild_id
@@ -352,6 +383,8 @@ class DiscordMember(BaseModel):
     date_polychamps_invite_sent = DateField(default=None, null=True)
     trophies = BinaryJSONField(null=True, default=None)
     boost_level = SmallIntegerField(default=None, null=True)
+    completed_games = SmallIntegerField(default=0)  # confirmed ranked games in global servers, maintained for max_elo_delta
+    completed_games_moonrise = SmallIntegerField(default=0)
 
     def as_json(self, include_games: bool) -> Dict[str, Any]:
         """Get the user as a dict for returning from the API."""
@@ -388,81 +421,79 @@ def as_json(self, include_games: bool) -> Dict[str, Any]:
     def mention(self):
         return f'<@{self.discord_id}>'
 
-    def advanced_stats(self):
-
-        server_list = settings.servers_included_in_global_lb()
-
-        SubqueryFirstLineup = (Lineup
-                           .select(Lineup.player_id)
-                           .where(Lineup.game == Game.id)
-                           .order_by(Lineup.id)
-                           .limit(1))
-        host_status = Case(
-            None,
-            ((Player.id == SubqueryFirstLineup, True),),
-            False
-        ).alias('host_status')
-            
-        win_status = Case(
-            None,
-            ((GameSide.id == Game.winner_id, True),),
-            False
-        ).alias('win_status')
+    def advanced_stats(self, cached: bool = False):
+        # (longest winning streak, longest losing streak, 1v2 wins, 1v3 wins, 1v1 wins, 1v1 losses, wins as host, ranked games
+        # played) over ranked games on servers included in the global leaderboard. cached reads the DiscordMemberStats row.
+        stats = DiscordMemberStats.for_member(self) if cached else DiscordMemberStats(**self.advanced_stats_row())
+        return stats.as_tuple()
 
-        ranked_games_played_alt = (Game.select(Game, GameSide, Lineup, Player, win_status, host_status).join(
-                GameSide, on=(Game.id == GameSide.game)
-            )
-                .join(Lineup, on=(GameSide.id == Lineup.gameside))
-                .join(Player, on=(Lineup.player == Player.id))
-                .where(
-                    (Player.discord_member == self) & 
-                    (Game.is_completed == 1) &
-                    (Game.is_ranked == 1) &
-                    (Game.is_confirmed == 1) &
-                    (Game.guild_id.in_(server_list))
-                ).order_by(Game.completed_ts)
-                .prefetch(GameSide, Lineup, Player)
-        )
+    def advanced_stats_row(self):
+        # advanced_stats() as a dict, plus the current streak (positive for wins, negative for losses) and the latest
+        # completed_ts, from one query. Streaks are runs of equal results in completed_ts order, found by subtracting a
+        # per-result row number from the overall one (gaps and islands). A streak needs two games to count as the longest.
 
-        winning_streak, losing_streak, longest_winning_streak, longest_losing_streak = 0, 0, 0, 0
-        v2_count, v3_count = 0, 0  # wins of 1v2 or 1v3 games
-        duel_wins, duel_losses = 0, 0  # 1v1 matchup stats
-        wins_as_host = 0
-        last_win, last_loss = False, False
-        for game in ranked_games_played_alt:
-            # logger.debug(f'Game {game.id} completed_ts {game.completed_ts} is a {"win" if game.win_status else "loss"} WS: {winning_streak} LS: {losing_streak} last_win: {last_win} last_loss: {last_loss}')
-            if game.win_status:
-                if game.size == [1, 1]:
-                    duel_wins += 1
-                if game.size == [1, 2] or game.size == [2, 1]:
-                    if game.winner.size == 1:
-                        v2_count += 1
-                elif game.size == [1, 3] or game.size == [3, 1]:
-                    if game.winner.size == 1:
-                        v3_count += 1
-                if game.host_status:
-                    wins_as_host += 1
-                if last_win:
-                    # winning streak is extended
-                    winning_streak += 1
-                    longest_winning_streak = winning_streak if (winning_streak > longest_winning_streak) else longest_winning_streak
-                else:
-                    # winning streak is broken
-                    winning_streak = 1
-                    last_win, last_loss = True, False
-            else:
-                if game.size == [1, 1]:
-                    duel_losses += 1
-                if last_loss:
-                    # losing streak is extended
-                    losing_streak += 1
-                    longest_losing_streak = losing_streak if losing_streak > longest_losing_streak else longest_losing_streak
-                else:
-                    # losing streak is broken
-                    losing_streak = 1
-                    last_win, last_loss = False, True
+        server_list = settings.servers_included_in_global_lb()
 
-        return (longest_winning_streak, longest_losing_streak, v2_count, v3_count, duel_wins, duel_losses, wins_as_host, len(ranked_games_played_alt))
+        FirstLineup = Lineup.alias()
+        host_player = FirstLineup.select(FirstLineup.player_id).where(FirstLineup.game == Game.id).order_by(FirstLineup.id).limit(1)
+        is_win = Case(None, ((GameSide.id == Game.winner_id, True),), False)
+        solo_side = GameSide.size == 1
+        game_order = [Game.completed_ts, Game.id, Lineup.id]
+        position = fn.ROW_NUMBER().over(order_by=game_order)
+
+        results = (Lineup
+                   .select(
+                       is_win.alias('is_win'),
+                       Game.completed_ts,
+                       Case(None, ((Game.size == [1, 1], 1),), 0).alias('duel'),
+                       Case(None, ((((Game.size == [1, 2]) | (Game.size == [2, 1])) & solo_side, 1),), 0).alias('v2'),
+                       Case(None, ((((Game.size == [1, 3]) | (Game.size == [3, 1])) & solo_side, 1),), 0).alias('v3'),
+                       Case(None, ((Lineup.player == host_player, 1),), 0).alias('host'),
+                       position.alias('position'),
+                       (position - fn.ROW_NUMBER().over(partition_by=[is_win], order_by=game_order)).alias('island'),
+                   )
+                   .join(GameSide, on=(Lineup.gameside == GameSide.id))
+                   .join(Game, on=(GameSide.game == Game.id))
+                   .join_from(Lineup, Player, on=(Lineup.player == Player.id))
+                   .where(
+                       (Player.discord_member == self) &
+                       (Game.is_completed == 1) &
+                       (Game.is_ranked == 1) &
+                       (Game.is_confirmed == 1) &
+                       (Game.guild_id.in_(server_list))
+                   )).alias('results')
+
+        # One row per streak
+        islands = Select([results], [
+            results.c.is_win,
+            fn.COUNT(SQL('*')).alias('length'),
+            fn.SUM(results.c.duel).alias('duel'),
+            fn.SUM(results.c.v2).alias('v2'),
+            fn.SUM(results.c.v3).alias('v3'),
+            fn.SUM(results.c.host).alias('host'),
+            fn.MAX(results.c.completed_ts).alias('last_completed_ts'),
+            fn.MAX(results.c.position).alias('last_position'),
+            fn.MAX(fn.MAX(results.c.position)).over().alias('final_position'),
+        ]).group_by(results.c.is_win, results.c.island).alias('islands')
+
+        won, lost = (islands.c.is_win == True), (islands.c.is_win == False)  # noqa: E712
+
+        def total(expression):
+            return fn.COALESCE(fn.SUM(expression), 0).cast('int')
+
+        return Select([islands], [
+            fn.COALESCE(fn.MAX(Case(None, [(won & (islands.c.length > 1), islands.c.length)], 0)), 0).cast('int').alias('longest_winning_streak'),
+            fn.COALESCE(fn.MAX(Case(None, [(lost & (islands.c.length > 1), islands.c.length)], 0)), 0).cast('int').alias('longest_losing_streak'),
+            total(Case(None, [(won, islands.c.v2)], 0)).alias('v2_count'),
+            total(Case(None, [(won, islands.c.v3)], 0)).alias('v3_count'),
+            total(Case(None, [(won, islands.c.duel)], 0)).alias('duel_wins'),
+            total(Case(None, [(lost, islands.c.duel)], 0)).alias('duel_losses'),
+            total(Case(None, [(won, islands.c.host)], 0)).alias('wins_as_host'),
+            total(islands.c.length).alias('ranked_games_played'),
+            total(Case(None, [(islands.c.last_position == islands.c.final_position,
+                               Case(None, [(won, islands.c.length)], 0 - islands.c.length))], 0)).alias('current_streak'),
+            fn.MAX(islands.c.last_completed_ts).alias('last_completed_ts'),
+        ]).bind(db).dicts().get()
 
     def update_name(self, new_name: str):
         self.name = new_name
@@ -504,9 +535,13 @@ def losses(self, version: str = None):
 
         return q
 
-    def get_record(self, version: str = None):
+    def get_record(self, version: str = None, memo: dict = None):
+
+        return win_loss_records(DiscordMember, [self.id], version=version, memo=memo)[self.id]
 
-        return (self.wins(version=version).count(), self.losses(version=version).count())
+    def get_records(member_ids, version: str = None, memo: dict = None):
+        # {discord_member_id: (wins, losses)} for many members at once
+        return win_loss_records(DiscordMember, member_ids, version=version, memo=memo)
 
     def get_polychamps_record(self):
         # Gets a dictionary detailing the win/loss record for a player's polychampions career
@@ -568,45 +603,11 @@ def completed_game_count(self, only_ranked: bool = True, moonrise: bool = False)
         return num_games
 
     def leaderboard_rank(self, date_cutoff):
-        # TODO: This could be replaced with Postgresql Window functions to have the DB calculate the rank.
-        # Advantages: Probably moderately more efficient, and will resolve ties in a sensible way
-        # But no idea how to write the query :/
-        # http://docs.peewee-orm.com/en/latest/peewee/query_examples.html#find-the-top-three-revenue-generating-facilities
-
-        # # Below is a semi-working query using a window function, generated with ChatGPT. query.rank outputs a 
-        # # plausible number. Should be able to get fully working with more conditions on the leaderboard.
-        # #
-
-        # rank_subquery = (Player
-        #              .select(
-        #                  Player.id,
-        #                  Player.name,
-        #                  Player.elo,
-        #                  fn.RANK().over(order_by=[Player.elo.desc()]).alias('rank')
-        #              )
-        #              .alias('ranked_players'))
-
-        # query = (Player
-        #      .select(
-        #          rank_subquery.c.id,
-        #          rank_subquery.c.name,
-        #          rank_subquery.c.elo,
-        #          rank_subquery.c.rank
-        #      )
-        #      .from_(rank_subquery)
-        #      .where(rank_subquery.c.id == self.id)
-        #      .get())
-        
-        query = DiscordMember.leaderboard(date_cutoff=date_cutoff)
+        standing = self.leaderboard_standing(date_cutoff)
+        return (standing.rank, standing.total)
 
-        is_found = False
-        for counter, p in enumerate(query.tuples()):
-            if p[0] == self.id:
-                is_found = True
-                break
-
-        rank = counter + 1 if is_found else None
-        return (rank, query.count())
+    def leaderboard_standing(self, date_cutoff, max_flag: bool = False, version: str = None, neighbours: int = 1):
+        return Leaderboard.get_board(date_cutoff=date_cutoff, max_flag=max_flag, version=version).standing(self.id, neighbours=neighbours)
 
     def leaderboard(date_cutoff, guild_id: int = None, max_flag: bool = False, version: str = None):
         # guild_id is a dummy parameter so DiscordMember.leaderboard and Player.leaderboard can be called in identical ways
@@ -682,6 +683,8 @@ class Player(BaseModel):
     elo_max_moonrise = SmallIntegerField(default=1000)
     trophies = BinaryJSONField(null=True, default=None)
     is_banned = BooleanField(default=False)
+    completed_games = SmallIntegerField(default=0)  # confirmed ranked games, maintained for max_elo_delta
+    completed_games_moonrise = SmallIntegerField(default=0)
 
     def mention(self):
         return self.discord_member.mention()
@@ -932,9 +935,13 @@ def losses(self, version: str = None):
 
         return q
 
-    def get_record(self, version: str = None):
+    def get_record(self, version: str = None, memo: dict = None):
+
+        return win_loss_records(Player, [self.id], version=version, memo=memo)[self.id]
 
-        return (self.wins(version=version).count(), self.losses(version=version).count())
+    def get_records(player_ids, version: str = None, memo: dict = None):
+        # {player_id: (wins, losses)} for many players at once
+        return win_loss_records(Player, player_ids, version=version, memo=memo)
 
     def polychamps_tier_record(self, league_tier: int = None):
         # Returns a tuples of (wins, losses) for this player for season games played at a given league_tier, or all
@@ -1018,21 +1025,12 @@ def polychamps_season_tier(self, league_season: int):
         return None
 
     def leaderboard_rank(self, date_cutoff):
-        # TODO: This could be replaced with Postgresql Window functions to have the DB calculate the rank.
-        # Advantages: Probably moderately more efficient, and will resolve ties in a sensible way
-        # But no idea how to write the query :/
-        # http://docs.peewee-orm.com/en/latest/peewee/query_examples.html#find-the-top-three-revenue-generating-facilities
-
-        query = Player.leaderboard(date_cutoff=date_cutoff, guild_id=self.guild_id)
+        standing = self.leaderboard_standing(date_cutoff)
+        return (standing.rank, standing.total)
 
-        player_found = False
-        for counter, p in enumerate(query.tuples()):
-            if p[0] == self.id:
-                player_found = True
-                break
-
-        rank = counter + 1 if player_found else None
-        return (rank, query.count())
+    def leaderboard_standing(self, date_cutoff, max_flag: bool = False, version: str = None, neighbours: int = 1):
+        board = Leaderboard.get_board(date_cutoff=date_cutoff, guild_id=self.guild_id, max_flag=max_flag, version=version)
+        return board.standing(self.id, neighbours=neighbours)
 
     def leaderboard(date_cutoff, guild_id: int, max_flag: bool = False, version: str = None):
 
@@ -1165,6 +1163,11 @@ class Game(BaseModel):
     league_playoff = BooleanField(default=False)
     map_type = TextField(null=False, default='')
 
+    class Meta:
+        indexes = (
+            (('guild_id', 'is_completed', 'is_confirmed', 'completed_ts'), False),  # Game.search() status listings for a server
+        )
+
     def as_json(self, include_users: bool = False) -> Dict[str, Any]:
         """Get the game as a dict for returning from the API."""
         sides = []
@@ -1429,10 +1432,12 @@ def is_created_by(self, discord_id: int):
     def creating_player(self):
         # return Player who is in 'first position' for this game, ie. the game creator in Polytopia
         # will not always be Game.host if it was a staff member who removed themselves from lineup
-        first_side = self.ordered_side_list().limit(1).get()
-        side_players = first_side.ordered_player_list()
+        sides = self.ordered_side_list()
+        if not sides:
+            return None
+        side_players = sides[0].ordered_player_list()
         if side_players:
-            return first_side.ordered_player_list()[0].player
+            return side_players[0].player
         return None
 
     def draft_order(self):
@@ -1488,15 +1493,23 @@ def draft_order(self):
         return picks
 
     def ordered_side_list(self):
-
-        # tried to improve this May 2024 by pre-fetching related tables but couldn't crack it
-        # test games somehow used even more queries or ran into errors with objects not existing
-        return GameSide.select().where(GameSide.game == self).order_by(GameSide.position)
+        # The game's sides by position, as a list however the game was loaded
+        if '_ordered_sides' in self.__dict__:
+            # game loaded by Game.load_game_list(), Game.load_view() or Game.load_sides()
+            return list(self._ordered_sides)
+        return list(GameSide.select().where(GameSide.game == self).order_by(GameSide.position))
 
     def platform_emoji(self):
         return '' if self.is_mobile else '🖥'
 
     def embed(self, prefix, guild=None):
+        if '_ordered_sides' not in self.__dict__:
+            # Render from a copy of this game with its sides, lineups, players and teams loaded in a fixed number of queries.
+            # Not reloaded by id, so changes to this game that aren't saved yet still show
+            view = Game(**self.__data__)
+            view.__rel__.update(self.__rel__)
+            Game.load_sides([view])
+            return view.embed(prefix, guild=guild)
         if self.is_pending:
             return self.embed_pending_game(prefix)
         ranked_str = '' if self.is_ranked else 'Unranked — '
@@ -1749,6 +1762,59 @@ def load_full_game(game_id: int):
             raise DoesNotExist()
         return res[0]
 
+    def load_game_list(games_query):
+        # Returns the Games of games_query, in order, with everything that displaying them reads already loaded: host, sides
+        # with their teams and squads, lineups with their tribes, players, discord members and player teams, and the winning
+        # side. Three queries for any number of games. The loaded objects are for display - each game's sides, lineups and
+        # winner are wired to one another, so later changes in the DB are not seen by them.
+
+        host = Player.alias()
+        games = list(games_query.select_extend(host).join_from(Game, host, JOIN.LEFT_OUTER, on=(Game.host == host.id), attr='host'))
+        Game.load_sides(games)
+        return games
+
+    def load_sides(games):
+        # Loads everything load_game_list() does but the host onto games that are already in memory, in two queries.
+        # The games' own fields are left alone, including changes that haven't been saved yet
+
+        games_by_id = {game.id: game for game in games}
+        sides = GameSide.select(GameSide, Team, Squad).join(Team, JOIN.LEFT_OUTER).join_from(GameSide, Squad, JOIN.LEFT_OUTER).where(
+            GameSide.game.in_(list(games_by_id)))
+        lineups = Lineup.select(Lineup, Tribe, Player, DiscordMember, Team).join(Tribe, JOIN.LEFT_OUTER).join_from(
+            Lineup, Player).join_from(Player, DiscordMember).join_from(Player, Team, JOIN.LEFT_OUTER).where(Lineup.game.in_(list(games_by_id)))
+
+        for game in games:
+            game.gamesides, game.lineup = [], []
+        sides_by_id = {}
+        for side in sides:
+            side.game = games_by_id[side.game_id]
+            side.lineup = []
+            side._dirty.clear()
+            side.game.gamesides.append(side)
+            sides_by_id[side.id] = side
+        for lineup in lineups:
+            lineup.game, lineup.gameside = games_by_id[lineup.game_id], sides_by_id[lineup.gameside_id]
+            lineup._dirty.clear()
+            lineup.game.lineup.append(lineup)
+            lineup.gameside.lineup.append(lineup)
+
+        for game in games:
+            for side in game.gamesides:
+                side._ordered_lineup = sorted(side.lineup, key=lambda lineup: lineup.id)
+            if game.winner_id in sides_by_id:
+                winner_dirty = 'winner' in game._dirty
+                game.winner = sides_by_id[game.winner_id]
+                if not winner_dirty:
+                    game._dirty.discard('winner')
+            game._ordered_sides = sorted(game.gamesides, key=lambda side: side.position)
+
+    def load_view(game_id: int):
+        # One Game loaded as by Game.load_game_list(), for rendering its embed. Raises DoesNotExist
+        games = Game.load_game_list(Game.select().where(Game.id == game_id))
+        if not games:
+            raise DoesNotExist()
+        return games[0]
+
     def pregame_check(discord_groups, guild_id, require_teams: bool = False):
         # discord_groups = list of lists [[d1, d2, d3], [d4, d5, d6]]. each item being a discord.Member object
         # returns (ListOfLists1, List2)
@@ -1905,16 +1971,23 @@ def create_game(
                 # Create Lineup records
                 for player in player_group:
                     Lineup.create(game=newgame, gameside=gameside, player=player)
+                PlayerStats.invalidate([player.id for player in player_group])
 
         return newgame, warnings
 
     def reverse_elo_changes(self):
         logger.debug(f'reverse_elo_changes for game {self.id}')
+        counted = self.is_confirmed and self.is_ranked  # declare_winner() only counts confirmed ranked games
+        if counted and self.completed_ts:
+            EloCheckpoint.invalidate(self.completed_ts)
+        write_buffer = WriteBuffer()
         for lineup in self.lineup:
+            if counted:
+                lineup.adjust_completed_games(game=self, step=-1, write_buffer=write_buffer)
             lineup.player.elo += lineup.elo_change_player * -1
             lineup.player.elo_alltime += lineup.elo_change_player_alltime * -1
             lineup.player.elo_moonrise += lineup.elo_change_player_moonrise * -1
-            lineup.player.save()
+            write_buffer.save(lineup.player, 'elo', 'elo_alltime', 'elo_moonrise')
             lineup.elo_change_player = 0
             lineup.elo_change_player_alltime = 0
             lineup.elo_change_player_moonrise = 0
@@ -1929,31 +2002,43 @@ def reverse_elo_changes(self):
                 lineup.player.discord_member.elo += lineup.elo_change_discordmember * -1
                 lineup.player.discord_member.elo_alltime += lineup.elo_change_discordmember_alltime * -1
                 lineup.player.discord_member.elo_moonrise += lineup.elo_change_discordmember_moonrise * -1
-                lineup.player.discord_member.save()
+                write_buffer.save(lineup.player.discord_member, 'elo', 'elo_alltime', 'elo_moonrise')
                 lineup.elo_change_discordmember = 0
                 lineup.elo_change_discordmember_alltime = 0
                 lineup.elo_change_discordmember_moonrise = 0
-            lineup.save()
+            write_buffer.save(lineup, *(field for flavour_fields in EloLedger.lineup_fields for field in flavour_fields[1:]))
 
+        teams = {}  # sides of the same team share one instance so both reversals land, as they did with a save() per side
         for gameside in self.gamesides:
             if gameside.elo_change_squad and gameside.squad:
                 gameside.squad.elo += (gameside.elo_change_squad * -1)
-                gameside.squad.save()
+                write_buffer.save(gameside.squad, 'elo')
                 gameside.elo_change_squad = 0
 
-            if gameside.elo_change_team and gameside.team:
-                gameside.team.elo += (gameside.elo_change_team * -1)
-                gameside.team.save()
+            team = teams.setdefault(gameside.team_id, gameside.team) if gameside.team_id else None
+            if gameside.elo_change_team and team:
+                team.elo += (gameside.elo_change_team * -1)
+                write_buffer.save(team, 'elo')
                 gameside.elo_change_team = 0
 
-            if gameside.elo_change_team_alltime and gameside.team:
-                gameside.team.elo_alltime += (gameside.elo_change_team_alltime * -1)
-                gameside.team.save()
+            if gameside.elo_change_team_alltime and team:
+                team.elo_alltime += (gameside.elo_change_team_alltime * -1)
+                write_buffer.save(team, 'elo_alltime')
                 gameside.elo_change_team_alltime = 0
 
             gameside.team_elo_after_game = None
             gameside.team_elo_after_game_alltime = None
-            gameside.save()
+            write_buffer.save(gameside, *GameSide.elo_fields)
+
+        write_buffer.flush()
+        if counted:
+            # Callers mark the game incomplete after this, so leave it out of the records now
+            Leaderboard.refresh(players=[l.player for l in self.lineup], excluding_game=self)
+        EloLedger.delete().where(EloLedger.game == self).execute()
+        DiscordMemberStats.invalidate([l.player.discord_member_id for l in self.lineup])
+        PlayerStats.invalidate([l.player_id for l in self.lineup])
+        SeasonStandings.invalidate([self.league_season])
+        leaderboard_cache.invalidate(guild_id=self.guild_id)
 
     def delete_game(self):
         # resets any relevant ELO changes to players and teams, deletes related lineup records, and deletes the game entry itself
@@ -1968,7 +2053,7 @@ def delete_game(self):
                     recalculate = True
                     since = self.completed_ts
 
-                    self.reverse_elo_changes()
+                    self.reverse_elo_changes()  # also takes the game off the players' completed_games counters
 
                 self.save()
 
@@ -1982,6 +2067,8 @@ def delete_game(self):
 
             if recalculate:
                 Game.recalculate_elo_since(timestamp=since)
+            SeasonStandings.invalidate([self.league_season])
+        leaderboard_cache.invalidate(guild_id=self.guild_id)
 
     def get_side_win_chances(largest_team: int, gameside_list, gameside_elo_list, calc_version: int = 1):
         n = len(gameside_list)
@@ -2042,6 +2129,7 @@ def declare_winner(self, winning_side: 'GameSide', confirm: bool):
                 self.is_confirmed = True
                 if self.is_ranked:
                     # run elo calculations for player, discordmember, team, squad
+                    EloCheckpoint.invalidate(self.completed_ts)
 
                     largest_side = self.largest_team()
                     # gamesides = list(self.gamesides)
@@ -2097,24 +2185,30 @@ def declare_winner(self, winning_side: 'GameSide', confirm: bool):
                         team_win_chances = None
                         logger.info(f'Game date {self.date} is before reset date of {team_elo_reset_date}. Will not count towards team ELO.')
 
+                    from modules import elo_replay  # imported here since elo_replay imports this module
+                    pending_games = elo_replay.pending_game_counts(self)
+
+                    ledger_rows, write_buffer = [], WriteBuffer()
                     for i in range(len(gamesides)):
                         side = gamesides[i]
                         is_winner = True if side == winning_side else False
                         for p in side.lineup:
-                            p.change_elo_after_game(side_win_chances_alltime[i], is_winner, alltime=True, moonrise=False)
-                            p.change_elo_after_game(side_win_chances_discord_alltime[i], is_winner, by_discord_member=True, alltime=True, moonrise=False)
+                            p.change_elo_after_game(side_win_chances_alltime[i], is_winner, alltime=True, moonrise=False, write_buffer=write_buffer, pending_games=pending_games)
+                            p.change_elo_after_game(side_win_chances_discord_alltime[i], is_winner, by_discord_member=True, alltime=True, moonrise=False, write_buffer=write_buffer, pending_games=pending_games)
                             if self.is_post_moonrise():
                                 # if smallest_side == 1 and self.guild_id in [settings.server_ids['polychampions']]:
                                 #     logger.info('Skipping local ELO for non-team game (polychampions-specific rule') (reverted March 2022)
                                 # else:
                                 #     p.change_elo_after_game(side_win_chances[i], is_winner, alltime=False, moonrise=True)
-                                p.change_elo_after_game(side_win_chances[i], is_winner, alltime=False, moonrise=True)
-                                p.change_elo_after_game(side_win_chances_discord[i], is_winner, by_discord_member=True, alltime=False, moonrise=True)
+                                p.change_elo_after_game(side_win_chances[i], is_winner, alltime=False, moonrise=True, write_buffer=write_buffer, pending_games=pending_games)
+                                p.change_elo_after_game(side_win_chances_discord[i], is_winner, by_discord_member=True, alltime=False, moonrise=True, write_buffer=write_buffer, pending_games=pending_games)
                                 logger.info(f'Game date {self.date} is after ELO reset date of {settings.moonrise_reset_date}. Counts towards POST-Moonrise ELO')
                             else:
-                                p.change_elo_after_game(side_win_chances[i], is_winner, alltime=False, moonrise=False)
-                                p.change_elo_after_game(side_win_chances_discord[i], is_winner, by_discord_member=True, alltime=False, moonrise=False)
+                                p.change_elo_after_game(side_win_chances[i], is_winner, alltime=False, moonrise=False, write_buffer=write_buffer, pending_games=pending_games)
+                                p.change_elo_after_game(side_win_chances_discord[i], is_winner, by_discord_member=True, alltime=False, moonrise=False, write_buffer=write_buffer, pending_games=pending_games)
                                 logger.info(f'Game date {self.date} is before ELO reset date of {settings.moonrise_reset_date}. Counts towards pre-Moonrise ELO')
+                            p.adjust_completed_games(game=self, step=1, write_buffer=write_buffer)
+                            ledger_rows.extend(EloLedger.lineup_rows(p))
 
                         if team_win_chances:
                             team_elo_delta = side.team.change_elo_after_game(team_win_chances[i], is_winner)
@@ -2122,23 +2216,40 @@ def declare_winner(self, winning_side: 'GameSide', confirm: bool):
                             side.elo_change_team = team_elo_delta
                             side.team.elo = int(side.team.elo + team_elo_delta)
                             side.team_elo_after_game = side.team.elo
-                            side.team.save()
+                            write_buffer.save(side.team, 'elo', 'elo_alltime')
+                            ledger_rows.append(('team', side.team.id, 'elo', side.team.elo - team_elo_delta, side.team.elo, team_elo_delta))
                         if team_win_chances_alltime:
                             team_elo_delta = side.team.change_elo_after_game(team_win_chances_alltime[i], is_winner)
                             elo_logger.debug(f'Team.change_elo_after_game team.id: {side.team.id} Alltime ELO {side.team.elo_alltime} adding delta {team_elo_delta}')
                             side.elo_change_team_alltime = team_elo_delta
                             side.team.elo_alltime = int(side.team.elo_alltime + team_elo_delta)
                             side.team_elo_after_game_alltime = side.team.elo_alltime
-                            side.team.save()
+                            write_buffer.save(side.team, 'elo', 'elo_alltime')
+                            ledger_rows.append(('team', side.team.id, 'elo_alltime', side.team.elo_alltime - team_elo_delta, side.team.elo_alltime, team_elo_delta))
                         if squad_win_chances:
-                            side.elo_change_squad = side.squad.change_elo_after_game(squad_win_chances[i], is_winner)
+                            side.elo_change_squad = side.squad.change_elo_after_game(squad_win_chances[i], is_winner, write_buffer=write_buffer)
+                            ledger_rows.append(('squad', side.squad.id, 'elo', side.squad.elo - side.elo_change_squad, side.squad.elo, side.elo_change_squad))
 
-                        side.save()
+                        write_buffer.save(side, *GameSide.elo_fields)
+
+                    write_buffer.flush()
+                    EloLedger.record(game=self, rows=ledger_rows)
 
             self.winner = winning_side
             self.is_completed = True
             self.save()
 
+            if confirm is True and self.is_ranked:
+                DiscordMemberStats.record_game(self)
+            if confirm is True:
+                PlayerStats.record_game(self)
+                SeasonStandings.record_game(self)
+
+        if confirm is True and self.is_ranked:
+            # Once the result is committed, rather than holding the game's transaction open while the boards update
+            Leaderboard.refresh(players=[l.player for l in self.lineup])
+        leaderboard_cache.invalidate(guild_id=self.guild_id)
+
     def has_player(self, player: Player = None, discord_id: int = None):
         # if player (or discord_id) was a participant in this game: return True, GameSide
         # else, return False, None
@@ -2367,135 +2478,131 @@ def search(player_filter=None, team_filter=None, title_filter=None, status_filte
         # 0 = desktop (is_mobile == False)
         # 1 = mobile (is_mobile == True)
         # 2 = any
-        # title_filter should be a [list, of, words] to search for in game notes or title. using iregexp (case insensitive). ordering doesn't matter
+        # title_filter should be a [list, of, words] to search for in game notes or title, case insensitive. ordering doesn't matter.
+        # each word matches anywhere in the text, eg "cup" matches "PolyCup". games where the words begin words are listed first
         # season_filter:
         # -1 (default) = disabled
         # 0 = include any season game
         # positive int = include games from that season
 
-        # league_season = SmallIntegerField(default=None, null=True)
+        filters = Game.search_filters(player_filter=player_filter, team_filter=team_filter, title_filter=title_filter,
+                                      status_filter=status_filter, guild_id=guild_id, size_filter=size_filter,
+                                      platform_filter=platform_filter, season_filter=season_filter)
+        query = Game.select()
+        if filters:
+            query = query.where(*filters)
+        return query.order_by(*[key.desc() for key in Game.search_ordering(title_filter)])
+
+    def search_ordering(title_filter=None):
+        # Sort keys of Game.search() results, which are listed with the largest keys first: best title match if there is a
+        # title_filter, then games not yet completed, then newest. None of the keys are null and the last is the game ID, so
+        # a page of results can carry on from the keys of the previous page's last game (see modules/game_pages.py)
+        keys = [fn.COALESCE(Game.completed_ts, datetime.datetime.max), Game.date, Game.id]
+        clean_search_terms = Game.title_terms(title_filter) if title_filter else []
+        if clean_search_terms:
+            # Full-text rank where every term begins a word, with name words weighted above notes words. Games that only
+            # contain the terms inside words rank 0 and keep the usual order. Rounded to numeric so a rank reads back
+            # exactly as it compares
+            document, query = Game.search_document(), Game.title_query(clean_search_terms)
+            rank = Case(None, [(Expression(document, TS_MATCH, query), fn.ts_rank(document, query))], 0)
+            keys.insert(0, rank.cast('numeric'))
+        return keys
+
+    def search_document():
+        # Words of the game name (weight A) and notes (weight B) as a tsvector, for ranking title matches
+        return EnclosedNodeList([
+            fn.setweight(fn.to_tsvector(SQL("'simple'"), fn.COALESCE(Game.name, SQL("''"))), SQL("'A'")).concat(
+                fn.setweight(fn.to_tsvector(SQL("'simple'"), fn.COALESCE(Game.notes, SQL("''"))), SQL("'B'")))
+        ])
+
+    def title_terms(title_filter):
+        # title_filter words with everything except alphanumerics stripped out
+        strip_regexp = re.compile('[^0-9a-zA-Z ]')
+        return strip_regexp.sub('', ' '.join(title_filter)).split()
+
+    def title_query(clean_search_terms):
+        # tsquery matching documents with every term as a word prefix
+        return fn.to_tsquery('simple', ' & '.join(f'{term}:*' for term in clean_search_terms))
+
+    def search_filters(player_filter=None, team_filter=None, title_filter=None, status_filter: int = 0, guild_id: int = None, size_filter=None, platform_filter: int = 2, season_filter: int = -1):
+        # The WHERE expressions for Game.search(), which takes the same arguments. Only the filters that are in use add
+        # anything, so a search by server and status is a plain scan of the (guild_id, is_completed, is_confirmed, completed_ts)
+        # index. Player and team filters are semi-joins served by the Lineup (player, game) and GameSide (team, game) indexes.
+        filters = []
 
-        confirmed_filter, completed_filter, pending_filter = [0, 1], [0, 1], [0, 1]
-        platform_filter = [0, 1] if platform_filter == 2 else [platform_filter]
+        if guild_id:
+            filters.append(Game.guild_id == guild_id)
 
         if status_filter == 1:
             # completed games
-            completed_filter, pending_filter = [1], [0]
+            filters += [Game.is_completed == 1, Game.is_pending == 0]
         elif status_filter == 2:
             # incomplete games
-            confirmed_filter = [0]
+            filters.append(Game.is_confirmed == 0)
         elif status_filter == 3 or status_filter == 4:
             # wins/losses
-            completed_filter, confirmed_filter, pending_filter = [1], [1], [0]
+            filters += [Game.is_completed == 1, Game.is_confirmed == 1, Game.is_pending == 0]
         elif status_filter == 5:
             # Unconfirmed completed games
-            completed_filter, confirmed_filter, pending_filter = [1], [0], [0]
+            filters += [Game.is_completed == 1, Game.is_confirmed == 0, Game.is_pending == 0]
 
-        if season_filter == -1:
-            # no filter applied
-            season_query = Game.select(Game.id)
-        elif season_filter == 0:
-            # any season game
-            season_query = Game.select(Game.id).where(Game.league_season > 0)
-        else:
-            season_query = Game.select(Game.id).where(Game.league_season == season_filter)
+        if platform_filter != 2:
+            filters.append(Game.is_mobile == bool(platform_filter))
 
-        if guild_id:
-            guild_filter = Game.select(Game.id).where(Game.guild_id == guild_id)
-        else:
-            guild_filter = Game.select(Game.id)
+        if season_filter == 0:
+            # any season game
+            filters.append(Game.league_season > 0)
+        elif season_filter != -1:
+            filters.append(Game.league_season == season_filter)
 
         if size_filter:
-            size_query = Game.select(Game.id).where(Game.size == size_filter)
-        else:
-            size_query = Game.select(Game.id)
+            filters.append(Game.size == size_filter)
 
         if team_filter:
-            team_subq = GameSide.select(GameSide.game).join(Game).where(
-                (GameSide.team.in_(team_filter)) & (GameSide.size > 1)
-            ).group_by(GameSide.game).having(
-                (fn.COUNT(GameSide.team) == len(team_filter))
-            )
-        else:
-            team_subq = Game.select(Game.id)
+            filters.append(Game.id.in_(
+                GameSide.select(GameSide.game).where(
+                    (GameSide.team.in_(team_filter)) & (GameSide.size > 1)
+                ).group_by(GameSide.game).having(fn.COUNT(GameSide.team) == len(team_filter))
+            ))
 
         if player_filter:
-            player_subq = Lineup.select(Lineup.game).join(Game).where(
-                (Lineup.player.in_(player_filter))
-            ).group_by(Lineup.game).having(
-                fn.COUNT(Lineup.player) == len(player_filter)
-            )
-        else:
-            player_subq = Game.select(Game.id)
+            filters.append(Game.id.in_(
+                Lineup.select(Lineup.game).where(
+                    Lineup.player.in_(player_filter)
+                ).group_by(Lineup.game).having(fn.COUNT(Lineup.player) == len(player_filter))
+            ))
 
         if title_filter:
+            clean_search_terms = Game.title_terms(title_filter)
+            if clean_search_terms:
+                # Every word has to appear in the name, or every word in the notes. ILIKE '%word%' can use the game_name_trgm
+                # and game_notes_trgm indexes that migrator.py adds where pg_trgm is available
+                name_matches, notes_matches = Game.name.contains(clean_search_terms[0]), Game.notes.contains(clean_search_terms[0])
+                for term in clean_search_terms[1:]:
+                    name_matches &= Game.name.contains(term)
+                    notes_matches &= Game.notes.contains(term)
+                filters.append(name_matches | notes_matches)
+            else:
+                # nothing searchable left - any game with a name or notes
+                filters.append((fn.LENGTH(Game.notes) > 0) | (fn.LENGTH(Game.name) > 0))
 
-            strip_regexp = re.compile('[^0-9a-zA-Z ]')  # strip out everything except alphanumerics and spaces
-            clean_search_terms = strip_regexp.sub('', ' '.join(title_filter)).split()
-            search_regexp = '^' + ''.join([f'(?=.*{arg})' for arg in clean_search_terms]) + '.+'
-            # https://stackoverflow.com/questions/24656131/regex-for-existence-of-some-words-whose-order-doesnt-matter
-
-            title_subq = Game.select(Game.id).where(
-                (Game.notes.iregexp(search_regexp)) | (Game.name.iregexp(search_regexp))
-            )
-        else:
-            title_subq = Game.select(Game.id)
-
-        if (not player_filter and not team_filter) or status_filter not in [3, 4]:
-            # No filtering on wins/losses
-            victory_subq = Game.select(Game.id)
-        else:
+        if status_filter in [3, 4] and (player_filter or team_filter):
+            is_win = status_filter == 3
             if player_filter:
                 # Filter wins/losses on first entry in player_filter
-                if status_filter == 3:
-                    # Games that player has won
-                    victory_subq = Lineup.select(Lineup.game).join(Game).join_from(Lineup, GameSide).where(
-                        (Lineup.game.is_completed == 1) & (Lineup.player == player_filter[0]) & (Game.winner == Lineup.gameside.id)
-                    )
-                elif status_filter == 4:
-                    # Games that player has lost
-                    victory_subq = Lineup.select(Lineup.game).join(Game).join_from(Lineup, GameSide).where(
-                        (Lineup.game.is_completed == 1) & (Lineup.player == player_filter[0]) & (Game.winner != Lineup.gameside.id)
-                    )
+                side_played = Lineup.select(Lineup.id).where(
+                    (Lineup.game == Game.id) & (Lineup.player == player_filter[0]) &
+                    ((Lineup.gameside == Game.winner) if is_win else (Lineup.gameside != Game.winner))
+                )
             else:
                 # Filter wins/losses on first entry in team_filter
-                if status_filter == 3:
-                    # Games that team has won
-                    victory_subq = GameSide.select(GameSide.game).join(Game).where(
-                        (GameSide.team == team_filter[0]) & (GameSide.id == Game.winner)
-                    )
-                elif status_filter == 4:
-                    # Games that team has lost
-                    victory_subq = GameSide.select(GameSide.game).join(Game).where(
-                        (GameSide.team == team_filter[0]) & (GameSide.id != Game.winner)
-                    )
+                side_played = GameSide.select(GameSide.id).where(
+                    (GameSide.game == Game.id) & (GameSide.team == team_filter[0]) &
+                    ((GameSide.id == Game.winner) if is_win else (GameSide.id != Game.winner))
+                )
+            filters.append(fn.EXISTS(side_played))
 
-        game = Game.select().where(
-            (
-                Game.id.in_(team_subq)
-            ) & (
-                Game.id.in_(player_subq)
-            ) & (
-                Game.id.in_(title_subq)
-            ) & (
-                Game.is_completed.in_(completed_filter)
-            ) & (
-                Game.is_confirmed.in_(confirmed_filter)
-            ) & (
-                Game.id.in_(victory_subq)
-            ) & (
-                Game.id.in_(guild_filter)
-            ) & (
-                Game.id.in_(size_query)
-            ) & (
-                Game.is_mobile.in_(platform_filter)
-            ) & (
-                Game.id.in_(season_query)
-            ) & (
-                Game.is_pending.in_(pending_filter))
-        ).order_by(-Game.completed_ts, -Game.date)
-
-        return game
+        return filters
 
     def series_record(self):
 
@@ -2509,17 +2616,18 @@ def series_record(self):
 
         games_with_same_teams = Game.by_opponents(player_lists)
 
+        # players on the winning side of each confirmed ranked game in the series, in one query
+        winning_lineups = Lineup.select(fn.ARRAY_AGG(Lineup.player)).join(Game, on=(Game.winner == Lineup.gameside)).where(
+            (Game.id.in_(games_with_same_teams.select(Game.id))) & (Game.is_ranked == 1) & (Game.is_confirmed == 1)
+        ).group_by(Game.id)
+        first_side_players = sorted(lineup.player_id for lineup in gamesides[0].lineup)
+
         s1_wins, s2_wins = 0, 0
-        for game in games_with_same_teams:
-            if not game.is_ranked:
-                continue
-            if game.is_confirmed:
-                if game.winner.has_same_players_as(gamesides[0]):
-                    s1_wins += 1
-                    logger.debug(f'series_record(): s1_wins incremented for game {game.id}')
-                else:
-                    s2_wins += 1
-                    logger.debug(f'series_record(): s2_wins incremented for game {game.id}')
+        for (winning_players,) in winning_lineups.tuples():
+            if sorted(winning_players) == first_side_players:
+                s1_wins += 1
+            else:
+                s2_wins += 1
 
         logger.debug(f'series_record(): game {self.id}, side 0, id {gamesides[0].id}, wins {s1_wins}. side 1, id {gamesides[1].id}, wins {s2_wins}')
         if s2_wins > s1_wins:
@@ -2624,8 +2732,15 @@ def by_opponents(player_lists):
 
         # return games_with_same_number_of_sides
 
-    def recalculate_elo_since(timestamp):
+    def recalculate_elo_since(timestamp, in_memory: bool = True):
+        # in_memory=True rebuilds ratings from the elo_after_game snapshots and replays later games with modules.elo_replay,
+        # writing only rows that change. Returns the number of rows updated.
+        # in_memory=False reverses and re-declares every later game one by one
         db.connect(reuse_if_open=True)
+        if in_memory:
+            from modules import elo_replay  # imported here since elo_replay imports this module
+            return elo_replay.recalculate_since(timestamp)
+
         games = Game.select().where(
             (Game.is_completed == 1) & (Game.is_confirmed == 1) & (Game.completed_ts >= timestamp) & (Game.winner.is_null(False)) & (Game.is_ranked == 1)
         ).order_by(Game.completed_ts).prefetch(GameSide, Lineup)
@@ -2642,18 +2757,38 @@ def recalculate_elo_since(timestamp):
             full_game.declare_winner(winning_side=full_game.winner, confirm=True)
         elo_logger.debug('recalculate_elo_since complete')
 
-    def recalculate_all_elo():
+    def recalculate_all_elo(in_memory: bool = True, resume: bool = False, processes: int = 1):
         # Reset all ELOs to 1000, reset completed game counts, and re-run Game.declare_winner() on all qualifying games
+        # in_memory=True replays the history with modules.elo_replay, which writes the same values using a few bulk queries
+        # in_memory=False runs the original load_full_game() + declare_winner() loop
+        # resume=True starts the in-memory replay from the latest EloCheckpoint, such as one left by an interrupted run
+        # processes > 1 replays the independent rating chains of the in-memory replay in parallel worker processes
 
         logger.warning('Resetting and recalculating all ELO')
         elo_logger.info('recalculate_all_elo')
         settings.recalculation_mode = True
 
+        if in_memory:
+            from modules import elo_replay  # imported here since elo_replay imports this module
+            try:
+                elo_replay.recalculate_all(resume=resume, processes=processes)
+            finally:
+                settings.recalculation_mode = False
+            return elo_logger.info('recalculate_all_elo complete')
+
         with db.atomic():
             Player.update(elo=1000, elo_max=1000, elo_alltime=1000, elo_max_alltime=1000, elo_moonrise=1000, elo_max_moonrise=1000).execute()
             Team.update(elo=1000, elo_alltime=1000).execute()
             DiscordMember.update(elo=1000, elo_max=1000, elo_alltime=1000, elo_max_alltime=1000, elo_moonrise=1000, elo_max_moonrise=1000).execute()
             Squad.update(elo=1000).execute()
+            EloLedger.delete().execute()
+            EloCheckpoint.delete().execute()
+            Leaderboard.invalidate()
+            leaderboard_cache.invalidate()
+            # Every game is declared again below, so the rollups are dropped rather than counting each result twice
+            DiscordMemberStats.invalidate()
+            PlayerStats.invalidate()
+            SeasonStandings.invalidate()
 
             bot_members = DiscordMember.select().where(
                 DiscordMember.discord_id.in_([settings.bot_id, settings.bot_id_beta])
@@ -2665,6 +2800,8 @@ def recalculate_all_elo():
             Game.update(is_completed=0, is_confirmed=0).where(
                 (Game.is_confirmed == 1) & (Game.winner.is_null(False)) & (Game.is_ranked == 1) & (Game.completed_ts.is_null(False))
             ).execute()  # Resets completed game counts for players/squads/team ELO bonuses
+            from modules import elo_replay
+            elo_replay.check_completed_games(fix=True)
 
             games = Game.select().where(
                 (Game.is_completed == 0) & (Game.completed_ts.is_null(False)) & (Game.winner.is_null(False)) & (Game.is_ranked == 1)
@@ -2831,6 +2968,7 @@ async def join(self, member, side_arg=None, author_member=None, log_note=''):
             lineup = Lineup.create(player=player, game=self, gameside=side)
             player.team = player_team  # update player record with detected team in case its changed since last game.
             player.save()
+            PlayerStats.invalidate([player.id])
         message_list.append(f'Joining {member.mention} to side {side.position} of game {self.id}')
         GameLog.write(game_id=self, guild_id=member.guild.id, message=f'Side {side.position} joined by {GameLog.member_string(player.discord_member)} {log_by_str} {log_note}')
 
@@ -3012,6 +3150,8 @@ def update_league_fields(self) -> bool:
         self.league_tier = new_fields[1]
         self.league_playoff = new_fields[2]
         self.save()
+        PlayerStats.invalidate(Lineup.select(Lineup.player).where(Lineup.game == self))
+        SeasonStandings.invalidate([original_fields[0], self.league_season])
         logger.info(f'Changing league fields of game {self.id} {self.name} from {original_fields} to {new_fields}')
         return True
 
@@ -3103,23 +3243,33 @@ def parse_name_for_season_fields(self) -> tuple:
         return (game_season, game_tier, game_playoffs)
 
 
+
+
 class Squad(BaseModel):
     elo = SmallIntegerField(default=1000)
     guild_id = BitField(unique=False, null=False)
     name = TextField(null=False, default='')
+    member_ids = ArrayField(IntegerField, null=True)  # sorted player ids, see Squad.signature(). GIN index for partial-membership lookups
+
+    def signature(player_list):
+        # Canonical member_ids value for [List, of, Player, Records] or player ids
+        return sorted({p.id if isinstance(p, Player) else int(p) for p in player_list})
 
     def upsert(player_list, guild_id: int):
 
-        squads = Squad.get_matching_squad(player_list)
+        signature = Squad.signature(player_list)
+        squad = Squad.get_or_none(Squad.member_ids == signature)
+        if squad:
+            return squad
 
-        if len(squads) == 0:
-            # Insert new squad based on this combination of players
-            sq = Squad.create(guild_id=guild_id)
-            for p in player_list:
-                SquadMember.create(player=p, squad=sq)
-            return sq
+        with db.atomic():
+            # Insert new squad based on this combination of players. A concurrent insert of the same players wins the unique index.
+            squad_id = Squad.insert(guild_id=guild_id, member_ids=signature).on_conflict_ignore().execute()
+            if squad_id is None:
+                return Squad.get(Squad.member_ids == signature)
+            SquadMember.insert_many([{'player': player_id, 'squad': squad_id} for player_id in signature]).execute()
 
-        return squads[0]
+        return Squad(id=squad_id, guild_id=guild_id, member_ids=signature)
 
     def completed_game_count(self):
 
@@ -3129,7 +3279,7 @@ def completed_game_count(self):
 
         return num_games
 
-    def change_elo_after_game(self, chance_of_winning: float, is_winner: bool):
+    def change_elo_after_game(self, chance_of_winning: float, is_winner: bool, write_buffer: WriteBuffer = None):
         if self.completed_game_count() < 6:
             max_elo_delta = 50
         else:
@@ -3142,22 +3292,22 @@ def change_elo_after_game(self, chance_of_winning: float, is_winner: bool):
 
         elo_logger.debug(f'Squad.change_elo_after_game squad.id: {self.id} ELO {self.elo} adding delta {elo_delta}')
         self.elo = int(self.elo + elo_delta)
-        self.save()
+        if write_buffer is not None:
+            write_buffer.save(self, 'elo')
+        else:
+            self.save()
 
         return elo_delta
 
     def subq_squads_by_size(min_size: int = 2, exact=False):
 
+        size = fn.cardinality(Squad.member_ids)
         if exact:
             # Squads with exactly min_size number of members
-            return SquadMember.select(SquadMember.squad).group_by(
-                SquadMember.squad
-            ).having(fn.COUNT('*') == min_size)
+            return Squad.select(Squad.id).where(size == min_size)
 
         # Squads with at least min_size number of members
-        return SquadMember.select(SquadMember.squad).group_by(
-            SquadMember.squad
-        ).having(fn.COUNT('*') >= min_size)
+        return Squad.select(Squad.id).where(size >= min_size)
 
     def subq_squads_with_completed_games(min_games: int = 1):
         # Defaults to squads who have completed more than 0 games
@@ -3185,52 +3335,46 @@ def leaderboard_rank(self, date_cutoff):
         rank = counter + 1 if squad_found else None
         return (rank, query.count())
 
-    def leaderboard(date_cutoff, guild_id: int):
-
+    def min_games_for_leaderboard(guild_id: int):
+        # Smaller servers list squads with fewer completed games
         num_squads = Squad.select().where(Squad.guild_id == guild_id).count()
         if num_squads < 15:
-            min_games = 0
+            return 0
         elif num_squads < 25:
-            min_games = 1
-        else:
-            min_games = 2
+            return 1
+        return 2
+
+    def leaderboard(date_cutoff, guild_id: int):
+        # Squads with min_games completed games and a game completed after date_cutoff, from one pass over their game sides
+
+        min_games = Squad.min_games_for_leaderboard(guild_id)
+        completed_games = fn.SUM(Case(None, [(Game.is_completed == 1, 1)], 0))
 
         q = Squad.select().join(GameSide).join(Game).where(
-            (
-                Squad.id.in_(Squad.subq_squads_with_completed_games(min_games=min_games))
-            ) & (Squad.guild_id == guild_id) & (Game.completed_ts > date_cutoff)
-        ).order_by(-Squad.elo).group_by(Squad)
+            (Squad.guild_id == guild_id) & (Game.is_pending == 0)
+        ).group_by(Squad).having(
+            (completed_games >= min_games) & (fn.MAX(Game.completed_ts) > date_cutoff)
+        ).order_by(-Squad.elo)
 
         return q
 
     def get_matching_squad(player_list):
         # Takes [List, of, Player, Records] (not names)
-        # Returns squad with exactly the same participating players. See https://stackoverflow.com/q/52010522/1281743
-        query = Squad.select().join(SquadMember).group_by(Squad.id).having(
-            (fn.SUM(SquadMember.player.in_(player_list).cast('integer')) == len(player_list)) & (fn.SUM(SquadMember.player.not_in(player_list).cast('integer')) == 0)
-        )
-
-        return query
+        # Returns squad with exactly the same participating players, using the unique index on member_ids
+        return Squad.select().where(Squad.member_ids == Squad.signature(player_list))
 
     def get_all_matching_squads(player_list, guild_id: int):
         # Takes [List, of, Player, Records] (not names)
         # Returns all squads containing players in player list. Used to look up a squad by partial or complete membership
 
         # Limited to squads with at least 2 members and at least min_games completed game
-        num_squads = Squad.select().where(Squad.guild_id == guild_id).count()
-        if num_squads < 15:
-            min_games = 0
-        elif num_squads < 25:
-            min_games = 1
-        else:
-            min_games = 2
+        min_games = Squad.min_games_for_leaderboard(guild_id)
 
-        squad_with_matching_members = Squad.select().join(SquadMember).group_by(Squad.id).having(
-            (fn.SUM(SquadMember.player.in_(player_list).cast('integer')) == len(player_list))
+        squad_with_matching_members = Squad.select(Squad.id).where(
+            (Squad.member_ids.contains(*Squad.signature(player_list))) & (fn.cardinality(Squad.member_ids) >= 2)
         )
 
         query = GameSide.select(GameSide.squad, fn.COUNT('*').alias('games_played')).where(
-            (GameSide.squad.in_(Squad.subq_squads_by_size(min_size=2))) &
             (GameSide.squad.in_(Squad.subq_squads_with_completed_games(min_games=min_games))) &
             (GameSide.squad.in_(squad_with_matching_members))
         ).group_by(GameSide.squad).order_by(-SQL('games_played'))
@@ -3273,6 +3417,9 @@ def has_player(self, player: Player = None, discord_id: int = None):
         return False
 
 
+Squad.add_index(Squad.index(Squad.member_ids, unique=True, using='btree', name='squad_member_ids_unique'))  # one squad per exact set of players
+
+
 class SquadMember(BaseModel):
     player = ForeignKeyField(Player, null=False, on_delete='CASCADE')
     squad = ForeignKeyField(Squad, null=False, backref='squadmembers', on_delete='CASCADE')
@@ -3295,6 +3442,11 @@ class GameSide(BaseModel):
     win_confirmed = BooleanField(default=False)
     team_chan_external_server = BitField(unique=False, null=True, default=None)
 
+    class Meta:
+        indexes = ((('team', 'game'), False),)  # a team's games, for Game.search(team_filter)
+
+    elo_fields = ('elo_change_squad', 'elo_change_team', 'elo_change_team_alltime', 'team_elo_after_game', 'team_elo_after_game_alltime')
+
     def as_json(self) -> tuple[list[Player], Dict[str, Any]]:
         """Get the game side as a dict for returning from the API.
 
@@ -3429,7 +3581,7 @@ def roster(self):
 
         is_confirmed = self.game.is_confirmed
         # for l in self.lineup:
-        for l in Lineup.select(Lineup, Player).join(Player).where(Lineup.gameside == self).order_by(Lineup.id):
+        for l in self.ordered_player_list():
 
             if is_confirmed and (l.elo_after_game_moonrise or l.elo_after_game):
                 # build elo string showing change in elo from this game
@@ -3452,6 +3604,9 @@ def capacity(self):
         return (len(self.lineup), self.size)
 
     def ordered_player_list(self):
+        if '_ordered_lineup' in self.__dict__:
+            # side of a game loaded by Game.load_game_list(), Game.load_view() or Game.load_sides()
+            return list(self._ordered_lineup)
         player_list = []
         q = Lineup.select(Lineup, Player).join(Player).where(Lineup.gameside == self).order_by(Lineup.id)
         for l in q:
@@ -3469,8 +3624,16 @@ class GameLog(BaseModel):
     message_ts = DateTimeField(default=datetime.datetime.now)
     guild_id = BitField(unique=False, null=False, default=0)
     is_protected = BooleanField(default=False)
+    game_id = IntegerField(null=True, default=None)  # not a foreign key - logs are kept after their game is deleted
 
     # Entries will have guild_id of 0 for things like $setcode and $setname that arent guild-specific
+    # Game entries also keep the __game_id__ prefix on their message, which is what the log commands display
+
+    class Meta:
+        indexes = (
+            (('guild_id', 'message_ts'), False),  # a server's log, newest first
+            (('game_id', 'message_ts'), False),  # one game's log
+        )
 
     def member_string(member):
 
@@ -3485,14 +3648,16 @@ def member_string(member):
         return f'**{discord.utils.escape_markdown(name)}** (`{d_id}`)'
 
     def write(message, guild_id, game_id=0, is_protected=False):
+        game_id = getattr(game_id, 'id', game_id)  # Game or game ID
         if game_id:
             message = f'__{str(game_id)}__ - {message}'
 
         logger.debug(f'Writing gamelog for game_id {game_id} and guild_id {guild_id}\n{message}')
-        return GameLog.create(guild_id=guild_id, message=message, is_protected=is_protected)
+        return GameLog.create(guild_id=guild_id, message=message, is_protected=is_protected, game_id=game_id or None)
 
-    def search(keywords=None, negative_keyword=None, guild_id=None, limit=500):
-        logger.debug(f'GameLog.search() keywords: {keywords}, neg: {negative_keyword}, guild_id: {guild_id}')
+    def search(keywords=None, negative_keyword=None, guild_id=None, limit=500, game_id=None):
+        # game_id limits the search to one game's entries, which is an index lookup rather than a scan of every message
+        logger.debug(f'GameLog.search() keywords: {keywords}, neg: {negative_keyword}, guild_id: {guild_id}, game_id: {game_id}')
 
         if not keywords:
             keywords = '%'  # Wildcard/return all matches
@@ -3504,17 +3669,13 @@ def search(keywords=None, negative_keyword=None, guild_id=None, limit=500):
         else:
             negative_keyword = '%' + negative_keyword + '%'
 
+        filters = [GameLog.message ** (keywords), ~(GameLog.message ** (negative_keyword)), GameLog.is_protected == 0]
         if guild_id:
-            subq_by_guild = GameLog.select(GameLog.id).where((GameLog.guild_id == guild_id) | (GameLog.guild_id == 0))
-        else:
-            subq_by_guild = GameLog.select(GameLog.id)
+            filters.append(GameLog.guild_id.in_([guild_id, 0]))
+        if game_id:
+            filters.append(GameLog.game_id == game_id)
 
-        return GameLog.select().where(
-            GameLog.id.in_(subq_by_guild) &
-            GameLog.message ** (keywords) &
-            ~(GameLog.message ** (negative_keyword)) &
-            (GameLog.is_protected == 0)
-        ).order_by(-GameLog.message_ts).limit(limit)
+        return GameLog.select().where(*filters).order_by(-GameLog.message_ts).limit(limit)
 
 
 class Lineup(BaseModel):
@@ -3536,6 +3697,9 @@ class Lineup(BaseModel):
     elo_after_game_moonrise = SmallIntegerField(default=None, null=True)
     elo_after_game_global_moonrise = SmallIntegerField(default=None, null=True)
 
+    class Meta:
+        indexes = ((('player', 'game'), False),)  # a player's games, for Game.search(player_filter)
+
     def as_json(self) -> Dict[str, Any]:
         """Get the game member as a dict for returning from the API."""
         return {
@@ -3543,7 +3707,11 @@ def as_json(self) -> Dict[str, Any]:
             'discord_id': self.player.discord_member.discord_id
         }
 
-    def change_elo_after_game(self, chance_of_winning: float, is_winner: bool, by_discord_member: bool = False, alltime: bool = False, moonrise: bool = True):
+    def delete_instance(self, *args, **kwargs):
+        PlayerStats.invalidate([self.player_id])
+        return super().delete_instance(*args, **kwargs)
+
+    def change_elo_after_game(self, chance_of_winning: float, is_winner: bool, by_discord_member: bool = False, alltime: bool = False, moonrise: bool = True, write_buffer: WriteBuffer = None, pending_games: dict = None):
         # Average(Away Side Elo) is compared to Average(Home_Side_Elo) for calculation - ie all members on a side will have the same elo_delta
         # Team A: p1 900 elo, p2 1000 elo = 950 average
         # Team B: p1 1000 elo, p2 1200 elo = 1100 average
@@ -3576,7 +3744,10 @@ def change_elo_after_game(self, chance_of_winning: float, is_winner: bool, by_di
             aftergame_field = 'elo_after_game_global' if by_discord_member else 'elo_after_game'
 
         elo = getattr(record, elo_field)
-        num_games = record.completed_game_count(moonrise=moonrise)
+        num_games = record.completed_games_moonrise if moonrise else record.completed_games
+        if pending_games:
+            # completed games still awaiting confirmation count too, see elo_replay.pending_game_counts()
+            num_games += pending_games[type(record)].get(record.id, [0, 0])[1 if moonrise else 0]
 
         max_elo_delta = 32
 
@@ -3602,14 +3773,33 @@ def change_elo_after_game(self, chance_of_winning: float, is_winner: bool, by_di
         elo_logger.debug(f'Lineup.change_elo_after_game: Global: {by_discord_member} is_winner: {is_winner} alltime: {alltime} moonrise: {moonrise} Game.id {self.game.id} Lineup.id: {self.id} Player/DM.id: {record.id} Original ELO: {elo} Delta: {elo_delta} Original max ELO: {getattr(record, max_field)}')
 
         new_elo = int(elo + elo_delta)
-        with db.atomic():
-            setattr(record, elo_field, new_elo)
-            if new_elo > getattr(record, max_field):
-                setattr(record, max_field, new_elo)
-            setattr(self, change_field, elo_delta)
-            setattr(self, aftergame_field, new_elo)
-            record.save()
-            self.save()
+        setattr(record, elo_field, new_elo)
+        if new_elo > getattr(record, max_field):
+            setattr(record, max_field, new_elo)
+        setattr(self, change_field, elo_delta)
+        setattr(self, aftergame_field, new_elo)
+        if write_buffer is not None:
+            write_buffer.save(record, elo_field, max_field)
+            write_buffer.save(self, change_field, aftergame_field)
+        else:
+            with db.atomic():
+                record.save()
+                self.save()
+
+    def adjust_completed_games(self, game: 'Game', step: int, write_buffer: WriteBuffer = None):
+        # Keeps Player/DiscordMember.completed_games in step with confirmed ranked games. step is 1 or -1
+        moonrise_step = step if game.is_post_moonrise() else 0
+        records = [self.player]
+        if game.guild_id in settings.servers_included_in_global_lb():
+            records.append(self.player.discord_member)
+
+        for record in records:
+            record.completed_games += step
+            record.completed_games_moonrise += moonrise_step
+            if write_buffer is not None:
+                write_buffer.save(record, 'completed_games', 'completed_games_moonrise')
+            else:
+                record.save()
 
     def emoji_str(self):
 
@@ -3619,6 +3809,763 @@ def emoji_str(self):
             return ''
 
 
+class EloLedger(BaseModel):
+    # Append-only history of rating changes: one row per entity, ELO flavour and game, written by declare_winner().
+    # A game's rows are removed when its ELO changes are reversed.
+    entity_type = CharField(max_length=16)  # 'player', 'discordmember', 'team' or 'squad'
+    entity_id = IntegerField()
+    flavour = CharField(max_length=16)  # rating field that changed: 'elo', 'elo_alltime' or 'elo_moonrise'
+    game = ForeignKeyField(Game, null=False, backref='elo_ledger', on_delete='CASCADE', index=False)
+    completed_ts = DateTimeField()
+    elo_before = SmallIntegerField()
+    elo_after = SmallIntegerField()
+    elo_delta = SmallIntegerField()
+
+    class Meta:
+        table_name = 'elo_ledger'
+        indexes = (
+            (('game', 'entity_type', 'entity_id', 'flavour'), True),
+            # covers rating-at-time lookups and history graphs without touching the table
+            (('entity_type', 'entity_id', 'flavour', 'completed_ts', 'game', 'elo_after'), False),
+        )
+
+    # (flavour, player change field, player after-game field, discord member change field, discord member after-game field)
+    lineup_fields = (
+        ('elo', 'elo_change_player', 'elo_after_game', 'elo_change_discordmember', 'elo_after_game_global'),
+        ('elo_alltime', 'elo_change_player_alltime', 'elo_after_game_alltime', 'elo_change_discordmember_alltime', 'elo_after_game_global_alltime'),
+        ('elo_moonrise', 'elo_change_player_moonrise', 'elo_after_game_moonrise', 'elo_change_discordmember_moonrise', 'elo_after_game_global_moonrise'),
+    )
+
+    def lineup_rows(lineup: 'Lineup'):
+        # (entity_type, entity_id, flavour, elo_before, elo_after, elo_delta) for each change Lineup.change_elo_after_game() recorded
+        rows = []
+        for flavour, player_change, player_after, member_change, member_after in EloLedger.lineup_fields:
+            if getattr(lineup, player_after) is not None:
+                after, delta = getattr(lineup, player_after), getattr(lineup, player_change)
+                rows.append(('player', lineup.player_id, flavour, after - delta, after, delta))
+            if getattr(lineup, member_after) is not None:
+                after, delta = getattr(lineup, member_after), getattr(lineup, member_change)
+                rows.append(('discordmember', lineup.player.discord_member_id, flavour, after - delta, after, delta))
+        return rows
+
+    def record(game: 'Game', rows):
+        # Insert a game's rows in one statement. If a team fills more than one side, its last side wins as it does in Team.save()
+        rows = {(entity_type, entity_id, flavour): values for entity_type, entity_id, flavour, *values in rows}
+        if not rows:
+            return 0
+        fields = [EloLedger.entity_type, EloLedger.entity_id, EloLedger.flavour, EloLedger.game, EloLedger.completed_ts,
+                  EloLedger.elo_before, EloLedger.elo_after, EloLedger.elo_delta]
+        return EloLedger.insert_many(
+            [(*key, game.id, game.completed_ts, *values) for key, values in rows.items()], fields=fields
+        ).as_rowcount().execute()
+
+    def history(entity_type: str, entity_id: int, flavours):
+        # (completed_ts, elo) rows in the order the games were completed
+        return EloLedger.select(EloLedger.completed_ts, EloLedger.elo_after.alias('elo')).where(
+            (EloLedger.entity_type == entity_type) & (EloLedger.entity_id == entity_id) & (EloLedger.flavour.in_(flavours))
+        ).order_by(EloLedger.completed_ts, EloLedger.game)
+
+    def histories(entity_type: str, entity_ids, flavours):
+        # (entity_id, completed_ts, elo) rows for many entities at once, each entity's rows in the order history() returns them
+        return EloLedger.select(EloLedger.entity_id, EloLedger.completed_ts, EloLedger.elo_after.alias('elo')).where(
+            (EloLedger.entity_type == entity_type) & (EloLedger.entity_id.in_(list(entity_ids))) & (EloLedger.flavour.in_(flavours))
+        ).order_by(EloLedger.entity_id, EloLedger.completed_ts, EloLedger.game)
+
+    def ratings_at(entity_type: str, flavour: str, timestamp: datetime.datetime, max_flag: bool = False):
+        # Subquery of (entity_id, elo, last_completed_ts) for every entity rated before timestamp: its rating after the last
+        # game completed before then, or with max_flag the highest rating it had reached (never below the starting 1000).
+        # DISTINCT ON reads each entity's rows in the order of the (entity_type, entity_id, flavour, completed_ts) index.
+        rated_before = (EloLedger.entity_type == entity_type) & (EloLedger.flavour == flavour) & (EloLedger.completed_ts < timestamp)
+        if max_flag:
+            return EloLedger.select(
+                EloLedger.entity_id, fn.GREATEST(fn.MAX(EloLedger.elo_after), 1000).alias('elo'),
+                fn.MAX(EloLedger.completed_ts).alias('last_completed_ts'),
+            ).where(rated_before).group_by(EloLedger.entity_id).alias('ratings')
+
+        return EloLedger.select(
+            EloLedger.entity_id, EloLedger.elo_after.alias('elo'), EloLedger.completed_ts.alias('last_completed_ts'),
+        ).where(rated_before).order_by(
+            EloLedger.entity_id, EloLedger.completed_ts.desc(), EloLedger.game.desc()
+        ).distinct(EloLedger.entity_id).alias('ratings')
+
+    def rating_at(entity_type: str, entity_id: int, flavour: str, timestamp: datetime.datetime):
+        # Rating after the last game completed before timestamp, or None if there was no earlier game
+        return EloLedger.select(EloLedger.elo_after).where(
+            (EloLedger.entity_type == entity_type) & (EloLedger.entity_id == entity_id) &
+            (EloLedger.flavour == flavour) & (EloLedger.completed_ts < timestamp)
+        ).order_by(EloLedger.completed_ts.desc(), EloLedger.game.desc()).limit(1).scalar()
+
+
+class EloCheckpoint(BaseModel):
+    # Replay state saved by modules.elo_replay after the game ordered (completed_ts, game_id), so a full recalculation can
+    # start from here instead of from the first game. Removed when a game at or before it is declared or reversed again.
+    completed_ts = DateTimeField()
+    game_id = IntegerField()
+    game_count = IntegerField()  # replayable games up to and including this one
+    created_ts = DateTimeField(default=datetime.datetime.now)
+    state = BinaryJSONField()
+    is_complete = BooleanField(default=False)  # set once the run that saved it has written its ratings
+
+    class Meta:
+        table_name = 'elo_checkpoint'
+        indexes = ((('completed_ts', 'game_id'), True),)
+
+    def invalidate(timestamp: datetime.datetime):
+        return EloCheckpoint.delete().where(EloCheckpoint.completed_ts >= timestamp).execute()
+
+    def interrupted_run():
+        # The last checkpoint of a full recalculation that stopped before writing its ratings, or None. Game results up to
+        # it are committed but player, team and squad ratings are not, so they disagree until the run is resumed or redone
+        return EloCheckpoint.select().where(EloCheckpoint.is_complete == 0).order_by(
+            EloCheckpoint.completed_ts.desc(), EloCheckpoint.game_id.desc()).first()
+
+
+class LeaderboardStanding(NamedTuple):
+    rank: Optional[int]  # None if the player isn't on the board
+    total: int
+    percentile: Optional[float]  # share of the board ranked at or below this player
+    elo: Optional[int]
+    above: List[tuple]  # (rank, entity_id, elo) of the nearest players ranked above, best first
+    below: List[tuple]  # and of those just below
+
+
+class Leaderboard(BaseModel):
+    # A materialized Player.leaderboard() (guild_id set) or DiscordMember.leaderboard() (guild_id 0) with ranks and W/L
+    # records. Built the first time it is read and kept current by Leaderboard.refresh() as ratings and bans change.
+    guild_id = BitField(null=False)
+    version = CharField(max_length=8)
+    max_flag = BooleanField(default=False)
+    activity_cutoff = DateTimeField()  # players need a ranked game completed after this. datetime.min lists everyone
+    is_fallback = BooleanField(default=False)  # under 10 active players, so every registered player is listed
+    size = IntegerField(default=0)
+    refreshed_ts = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        table_name = 'leaderboard'
+        indexes = ((('guild_id', 'version', 'max_flag', 'activity_cutoff'), True),)
+
+    def elo_field(model, version: str, max_flag: bool):
+        fields = {'AIR': ('elo', 'elo_max'), 'MOONRISE': ('elo_moonrise', 'elo_max_moonrise'), 'ALLTIME': ('elo_alltime', 'elo_max_alltime')}
+        return getattr(model, fields[version][1 if max_flag else 0])
+
+    def get_board(date_cutoff, guild_id: int = None, max_flag: bool = False, version: str = None):
+        # Same arguments as Player.leaderboard(). Callers pass settings.date_cutoff or date.min, so one board per cutoff is
+        # shared until the next restart moves settings.date_cutoff on.
+        if not version:
+            version = 'MOONRISE' if is_post_moonrise() else 'AIR'
+        version = version.upper()
+        if version not in ['AIR', 'MOONRISE', 'ALLTIME']:
+            raise ValueError('Valid arguments are "air", "moonrise", or "alltime". Leave as None to use the current verson based on today\'s date.')
+
+        guild_id = guild_id or 0
+        if isinstance(date_cutoff, datetime.datetime):
+            activity_cutoff = date_cutoff
+        else:
+            activity_cutoff = datetime.datetime.combine(date_cutoff, datetime.time.min)  # as Postgres compares a date
+        key = (Leaderboard.guild_id == guild_id) & (Leaderboard.version == version) & (Leaderboard.max_flag == max_flag)
+
+        board = Leaderboard.get_or_none(key & (Leaderboard.activity_cutoff == activity_cutoff))
+        if board:
+            return board
+
+        with db.atomic():
+            # Boards for earlier cutoffs would only be refreshed for nothing from now on
+            Leaderboard.delete().where(
+                key & (Leaderboard.activity_cutoff < activity_cutoff) & (Leaderboard.activity_cutoff != datetime.datetime.min)
+            ).execute()
+            board, created = Leaderboard.get_or_create(guild_id=guild_id, version=version, max_flag=max_flag, activity_cutoff=activity_cutoff)
+            if created:
+                board.build()
+        return board
+
+    def model(self):
+        return Player if self.guild_id else DiscordMember
+
+    def source_rows(self, entity_ids=None, fallback: bool = False, excluding_game: 'Game' = None):
+        # (entity id, elo, wins, losses) for the players this board lists, optionally only for entity_ids.
+        # Follows Player/DiscordMember.leaderboard() for who is listed and get_record() for the W/L counts.
+        # excluding_game is left out of both, for a game whose result is being reversed but is still marked completed.
+        model = self.model()
+        elo_field = Leaderboard.elo_field(model, self.version, self.max_flag)
+        date_min, date_max = moonrise_or_air_date_range(version=self.version)
+        is_global = model is DiscordMember
+        entity_field = Player.discord_member if is_global else Lineup.player
+        counted_game = (Game.id != excluding_game.id) if excluding_game else SQL('TRUE')
+
+        # One pass over the entities' ranked games for both the W/L record and the latest game played
+        recorded = (Game.is_confirmed == 1) & (Game.date >= date_min) & (Game.date <= date_max)
+        if is_global:
+            recorded &= Game.guild_id.in_(settings.servers_included_in_global_lb())
+        records = Lineup.select(
+            entity_field.alias('entity_id'),
+            fn.SUM(Case(None, [(recorded & (Game.winner == Lineup.gameside), 1)], 0)).alias('wins'),
+            fn.SUM(Case(None, [(recorded & (Game.winner != Lineup.gameside), 1)], 0)).alias('losses'),
+            fn.MAX(Game.completed_ts).alias('last_completed_ts'),
+        ).join(Game).join_from(Lineup, Player).where(
+            (Game.is_completed == 1) & (Game.is_ranked == 1) & counted_game
+        ).group_by(entity_field)
+
+        if fallback:
+            listed = (model.guild_id == self.guild_id) if not is_global else SQL('TRUE')
+        elif is_global:
+            listed = (records.c.last_completed_ts > self.activity_cutoff) & (DiscordMember.is_banned == 0)
+        else:
+            listed = ((Player.guild_id == self.guild_id) & (records.c.last_completed_ts > self.activity_cutoff) &
+                      (Player.is_banned == 0) & (DiscordMember.is_banned == 0))
+        if not is_global:
+            records = records.where(Player.guild_id == self.guild_id)
+
+        if entity_ids is not None:
+            listed &= model.id.in_(list(entity_ids))
+            records = records.where(entity_field.in_(list(entity_ids)))
+
+        query = model.select(
+            Value(self.id), model.id, elo_field, fn.COALESCE(records.c.wins, 0), fn.COALESCE(records.c.losses, 0), Value(0)
+        ).join(records, JOIN.LEFT_OUTER, on=(records.c.entity_id == model.id))
+        if not is_global:
+            query = query.join_from(Player, DiscordMember)
+        return query.where(listed)
+
+    def insert_entries(self, entity_ids=None, fallback: bool = False, excluding_game: 'Game' = None):
+        fields = [LeaderboardEntry.leaderboard, LeaderboardEntry.entity_id, LeaderboardEntry.elo,
+                  LeaderboardEntry.wins, LeaderboardEntry.losses, LeaderboardEntry.rank]
+        query = self.source_rows(entity_ids, fallback=fallback, excluding_game=excluding_game)
+        return LeaderboardEntry.insert_from(query, fields).as_rowcount().execute()
+
+    def build(self, excluding_game: 'Game' = None):
+        LeaderboardEntry.delete().where(LeaderboardEntry.leaderboard == self).execute()
+        self.is_fallback = False
+        if self.insert_entries(excluding_game=excluding_game) < 10:
+            # Include all registered players on leaderboard if not many games played
+            LeaderboardEntry.delete().where(LeaderboardEntry.leaderboard == self).execute()
+            self.is_fallback = True
+            self.insert_entries(fallback=True, excluding_game=excluding_game)
+        Leaderboard.rerank([self.id])
+        self.size = LeaderboardEntry.select().where(LeaderboardEntry.leaderboard == self).count()
+        self.refreshed_ts = datetime.datetime.now()
+        self.save()
+
+    def rerank(board_ids):
+        # Ranks follow the leaderboard() ordering: ELO descending, ties going to the lower id
+        ranked = LeaderboardEntry.select(
+            LeaderboardEntry.id,
+            fn.ROW_NUMBER().over(
+                partition_by=[LeaderboardEntry.leaderboard],
+                order_by=[LeaderboardEntry.elo.desc(), LeaderboardEntry.entity_id],
+            ).alias('new_rank'),
+        ).where(LeaderboardEntry.leaderboard.in_(board_ids)).alias('ranked')
+
+        return LeaderboardEntry.update(rank=ranked.c.new_rank).from_(ranked).where(
+            (LeaderboardEntry.id == ranked.c.id) & (LeaderboardEntry.rank != ranked.c.new_rank)
+        ).execute()
+
+    def refresh(players=(), discord_members=(), excluding_game: 'Game' = None):
+        # Re-reads the rows of the given players (and their DiscordMembers) on every board they could appear on.
+        # Call after their ELO, W/L record or ban status changes. Boards listing every registered player are rebuilt.
+        players = list(players)
+        player_ids = {p.id for p in players}
+        member_ids = {p.discord_member_id for p in players} | {m.id for m in discord_members}
+        guild_ids = {p.guild_id for p in players}
+        if not player_ids and not member_ids:
+            return
+
+        boards = list(Leaderboard.select().where(
+            (Leaderboard.guild_id.in_(list(guild_ids)) if guild_ids else SQL('FALSE')) |
+            ((Leaderboard.guild_id == 0) if member_ids else SQL('FALSE'))
+        ))
+        if not boards:
+            return
+
+        with db.atomic():
+            incremental = []
+            for board in boards:
+                if board.is_fallback:
+                    board.build(excluding_game=excluding_game)
+                    continue
+                entity_ids = member_ids if board.guild_id == 0 else {p.id for p in players if p.guild_id == board.guild_id}
+                LeaderboardEntry.delete().where(
+                    (LeaderboardEntry.leaderboard == board) & (LeaderboardEntry.entity_id.in_(list(entity_ids)))
+                ).execute()
+                board.insert_entries(entity_ids, excluding_game=excluding_game)
+                incremental.append(board)
+
+            if not incremental:
+                return
+            Leaderboard.rerank([b.id for b in incremental])
+            sizes = dict(LeaderboardEntry.select(LeaderboardEntry.leaderboard, fn.COUNT(LeaderboardEntry.id)).where(
+                LeaderboardEntry.leaderboard.in_([b.id for b in incremental])
+            ).group_by(LeaderboardEntry.leaderboard).tuples())
+            for board in incremental:
+                board.size = sizes.get(board.id, 0)
+                if board.size < 10:
+                    board.build(excluding_game=excluding_game)
+                else:
+                    board.refreshed_ts = datetime.datetime.now()
+                    board.save(only=[Leaderboard.size, Leaderboard.refreshed_ts])
+
+    def invalidate():
+        # Drop every board, to be rebuilt when next read. Used after ratings are recalculated wholesale.
+        return Leaderboard.delete().execute()
+
+    def entries(self, limit: int = None):
+        # LeaderboardEntry rows in rank order, with .player (and its .team) or .discord_member loaded
+        model = self.model()
+        query = LeaderboardEntry.select(LeaderboardEntry, model).join(
+            model, on=(LeaderboardEntry.entity_id == model.id), attr='player' if model is Player else 'discord_member'
+        ).where(LeaderboardEntry.leaderboard == self).order_by(LeaderboardEntry.rank)
+        if model is Player:
+            query = query.select_extend(Team).join_from(Player, Team, JOIN.LEFT_OUTER)
+        return query.limit(limit) if limit else query
+
+    def ranked(self):
+        # Subquery of the board's (entity_id, elo, rank, total). RANK() uses the leaderboard() ordering, ELO descending
+        # with ties going to the lower id, so it numbers players exactly as the listing does.
+        return LeaderboardEntry.select(
+            LeaderboardEntry.entity_id,
+            LeaderboardEntry.elo,
+            fn.RANK().over(order_by=[LeaderboardEntry.elo.desc(), LeaderboardEntry.entity_id]).alias('rank'),
+            fn.COUNT(LeaderboardEntry.id).over().alias('total'),
+        ).where(LeaderboardEntry.leaderboard == self).alias('ranked')
+
+    def standing(self, entity_id: int, neighbours: int = 1) -> LeaderboardStanding:
+        # Rank, board size, percentile and the players ranked just above and below, from one query
+        ranked = self.ranked()
+        around = Select([ranked], [
+            ranked.c.rank, ranked.c.entity_id, ranked.c.elo, ranked.c.total,
+            fn.MAX(Case(None, [(ranked.c.entity_id == entity_id, ranked.c.rank)])).over().alias('target_rank'),
+        ]).alias('around')
+        rows = list(Select([around], [around.c.rank, around.c.entity_id, around.c.elo, around.c.total]).where(
+            fn.ABS(around.c.rank - around.c.target_rank) <= neighbours
+        ).order_by(around.c.rank).bind(db).tuples())
+
+        target = next((row for row in rows if row[1] == entity_id), None)
+        if not target:
+            return LeaderboardStanding(rank=None, total=self.size, percentile=None, elo=None, above=[], below=[])
+        rank, _, elo, total = target
+        return LeaderboardStanding(
+            rank=rank,
+            total=total,
+            percentile=round(100 * (total - rank + 1) / total, 1),
+            elo=elo,
+            above=[row[:3] for row in rows if row[0] < rank],
+            below=[row[:3] for row in rows if row[0] > rank],
+        )
+
+    def ranks(self, entity_ids) -> Dict[int, int]:
+        # {entity_id: rank} for those of entity_ids on the board
+        ranked = self.ranked()
+        return dict(Select([ranked], [ranked.c.entity_id, ranked.c.rank]).where(
+            ranked.c.entity_id.in_(list(entity_ids))
+        ).bind(db).tuples())
+
+    def as_of(timestamp: datetime.datetime, guild_id: int = None, max_flag: bool = False, version: str = None,
+              active_days: int = 365):
+        # The leaderboard as it stood at timestamp, from one query over EloLedger: the Player (or, with no guild_id,
+        # DiscordMember) records in rank order, with .rank, .board_elo, .total and .team_emoji set. Players are listed if
+        # they completed a ranked game in the active_days before timestamp (any time before it if active_days is None).
+        # The version defaults to the one that was current at timestamp. Bans are applied as they are now.
+        if not version:
+            version = 'MOONRISE' if timestamp.date() >= settings.moonrise_reset_date else 'AIR'
+        model = Player if guild_id else DiscordMember
+        flavour = Leaderboard.elo_field(model, version.upper(), False).name
+        ratings = EloLedger.ratings_at(model.__name__.lower(), flavour, timestamp, max_flag=max_flag)
+
+        listed = (ratings.c.last_completed_ts > timestamp - datetime.timedelta(days=active_days)) if active_days else SQL('TRUE')
+        if model is Player:
+            listed &= (Player.guild_id == guild_id) & (Player.is_banned == 0) & (DiscordMember.is_banned == 0)
+        else:
+            listed &= (DiscordMember.is_banned == 0)
+
+        ordering = [ratings.c.elo.desc(), model.id]
+        team_emoji = Team.emoji if model is Player else Value('')
+        query = model.select(
+            model, ratings.c.elo.alias('board_elo'), fn.RANK().over(order_by=ordering).alias('rank'),
+            fn.COUNT(model.id).over().alias('total'), team_emoji.alias('team_emoji'),
+        ).join(ratings, on=(ratings.c.entity_id == model.id))
+        if model is Player:
+            query = query.join_from(Player, DiscordMember).join_from(Player, Team, JOIN.LEFT_OUTER)
+        return query.where(listed).order_by(*ordering).objects()
+
+    def top(self, count: int = 1):
+        # The Player or DiscordMember records ranked count or better, best first, with .rank and .board_elo set
+        model = self.model()
+        ranked = self.ranked()
+        return list(model.select(model, ranked.c.rank.alias('rank'), ranked.c.elo.alias('board_elo')).join(
+            ranked, on=(ranked.c.entity_id == model.id)
+        ).where(ranked.c.rank <= count).order_by(ranked.c.rank).objects())
+
+
+class LeaderboardEntry(BaseModel):
+    leaderboard = ForeignKeyField(Leaderboard, null=False, backref='+', on_delete='CASCADE', index=False)
+    entity_id = IntegerField()  # Player.id, or DiscordMember.id on the global board
+    rank = IntegerField(default=0)
+    elo = SmallIntegerField()
+    wins = IntegerField(default=0)
+    losses = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'leaderboard_entry'
+        indexes = (
+            (('leaderboard', 'entity_id'), True),
+            (('leaderboard', 'rank'), False),
+        )
+
+
+class DiscordMemberStats(BaseModel):
+    # DiscordMember.advanced_stats() kept for the player card. Built by for_member() the first time it is read and advanced
+    # by record_game() as confirmed results arrive. A result older than the member's latest game, or a reversed one,
+    # deletes the row instead so the next read rebuilds it.
+    discord_member = ForeignKeyField(DiscordMember, null=False, unique=True, backref='+', on_delete='CASCADE')
+    longest_winning_streak = IntegerField(default=0)
+    longest_losing_streak = IntegerField(default=0)
+    v2_count = IntegerField(default=0)
+    v3_count = IntegerField(default=0)
+    duel_wins = IntegerField(default=0)
+    duel_losses = IntegerField(default=0)
+    wins_as_host = IntegerField(default=0)
+    ranked_games_played = IntegerField(default=0)
+    current_streak = IntegerField(default=0)  # positive for a run of wins, negative for a run of losses
+    last_completed_ts = DateTimeField(null=True)
+
+    stat_fields = ('longest_winning_streak', 'longest_losing_streak', 'v2_count', 'v3_count',
+                   'duel_wins', 'duel_losses', 'wins_as_host', 'ranked_games_played')
+
+    class Meta:
+        table_name = 'discord_member_stats'
+
+    def as_tuple(self):
+        return tuple(getattr(self, f) for f in DiscordMemberStats.stat_fields)
+
+    def for_member(discord_member: DiscordMember):
+        try:
+            return DiscordMemberStats.get(DiscordMemberStats.discord_member == discord_member)
+        except DoesNotExist:
+            row = discord_member.advanced_stats_row()
+            DiscordMemberStats.insert(discord_member=discord_member, **row).on_conflict(
+                conflict_target=[DiscordMemberStats.discord_member], update=row
+            ).execute()
+            return DiscordMemberStats(discord_member=discord_member, **row)
+
+    def invalidate(discord_member_ids=None):
+        query = DiscordMemberStats.delete()
+        if discord_member_ids is not None:
+            query = query.where(DiscordMemberStats.discord_member.in_(discord_member_ids))
+        return query.execute()
+
+    def record_game(game: 'Game'):
+        # Called once a ranked result is confirmed, to extend the stats rows of the game's players
+        if game.guild_id not in settings.servers_included_in_global_lb():
+            return
+        lineups = list(game.lineup.select(Lineup, Player, GameSide).join_from(Lineup, Player).join_from(Lineup, GameSide).order_by(Lineup.id))
+        if not lineups:
+            return
+        host_player_id = lineups[0].player_id
+        rows = {row.discord_member_id: row for row in DiscordMemberStats.select().where(
+            DiscordMemberStats.discord_member.in_([lineup.player.discord_member_id for lineup in lineups])
+        )}
+
+        stale = [member_id for member_id, row in rows.items() if row.last_completed_ts and game.completed_ts <= row.last_completed_ts]
+        write_buffer = WriteBuffer()
+        for lineup in lineups:
+            row = rows.get(lineup.player.discord_member_id)
+            if not row or row.discord_member_id in stale:
+                continue
+
+            if lineup.gameside_id == game.winner_id:
+                row.current_streak = row.current_streak + 1 if row.current_streak > 0 else 1
+                if row.current_streak > 1:
+                    row.longest_winning_streak = max(row.longest_winning_streak, row.current_streak)
+                if game.size == [1, 1]:
+                    row.duel_wins += 1
+                if lineup.gameside.size == 1 and game.size in ([1, 2], [2, 1]):
+                    row.v2_count += 1
+                elif lineup.gameside.size == 1 and game.size in ([1, 3], [3, 1]):
+                    row.v3_count += 1
+                if lineup.player_id == host_player_id:
+                    row.wins_as_host += 1
+            else:
+                row.current_streak = row.current_streak - 1 if row.current_streak < 0 else -1
+                if row.current_streak < -1:
+                    row.longest_losing_streak = max(row.longest_losing_streak, -row.current_streak)
+                if game.size == [1, 1]:
+                    row.duel_losses += 1
+            row.ranked_games_played += 1
+            row.last_completed_ts = game.completed_ts
+            write_buffer.save(row, *DiscordMemberStats.stat_fields, 'current_streak', 'last_completed_ts')
+
+        write_buffer.flush()
+        if stale:
+            DiscordMemberStats.invalidate(stale)
+
+
+class PlayerStats(BaseModel):
+    # Counters for the player card, one row per Player - that is, per DiscordMember and guild. Built by for_players() the
+    # first time they are read and advanced by record_game() when a result is confirmed. Anything that would need a
+    # counter taken back - a reversed or deleted game, lineup or tribe changes, a started or renamed game - deletes the row
+    # instead so the next read rebuilds it.
+    player = ForeignKeyField(Player, null=False, unique=True, backref='+', on_delete='CASCADE')
+    wins_air = IntegerField(default=0)  # ranked W/L split at the moonrise reset, as in moonrise_or_air_date_range()
+    losses_air = IntegerField(default=0)
+    wins_moonrise = IntegerField(default=0)
+    losses_moonrise = IntegerField(default=0)
+    games_total = IntegerField(default=0)  # every game the player is in, pending and incomplete included
+    recent_games = BinaryJSONField(default=dict)  # {game_id: latest of date and completed_ts} within the last RECENT_DAYS
+    tribe_counts = BinaryJSONField(default=dict)  # {tribe_id: lineups played as that tribe}
+    league_records = BinaryJSONField(default=dict)  # {league_tier: [wins, losses]} of confirmed league games
+
+    RECENT_DAYS = 30
+
+    class Meta:
+        table_name = 'player_stats'
+
+    def record(self, version: str = None):
+        # (wins, losses) as Player.get_record(version) would count them
+        if version and version.upper() == 'ALLTIME':
+            return (self.wins_air + self.wins_moonrise, self.losses_air + self.losses_moonrise)
+        if moonrise_or_air_date_range(version=version)[0] == settings.moonrise_reset_date:
+            return (self.wins_moonrise, self.losses_moonrise)
+        return (self.wins_air, self.losses_air)
+
+    def recent_game_count(self, in_days: int = RECENT_DAYS):
+        # Player.games_played(in_days).count(), for in_days up to RECENT_DAYS
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=in_days)
+        return sum(datetime.datetime.fromisoformat(ts) > cutoff for ts in self.recent_games.values())
+
+    def tier_records(self):
+        # Player.get_polychamps_record() from this row: {'full_record': (w, l), tier: (w, l), ...}
+        records = {'full_record': tuple(map(sum, zip((0, 0), *self.league_records.values())))}
+        for tier_number, _ in settings.league_tiers:
+            wins, losses = self.league_records.get(str(tier_number), (0, 0))
+            if wins or losses:
+                records[tier_number] = (wins, losses)
+        return records
+
+    def combined(rows):
+        # A PlayerStats summing rows, e.g. a member's rows on every server in the global leaderboard
+        total = PlayerStats()
+        for row in rows:
+            for field in ('wins_air', 'losses_air', 'wins_moonrise', 'losses_moonrise', 'games_total'):
+                setattr(total, field, getattr(total, field) + getattr(row, field))
+            total.recent_games.update(row.recent_games)
+            for tribe_id, count in row.tribe_counts.items():
+                total.tribe_counts[tribe_id] = total.tribe_counts.get(tribe_id, 0) + count
+        return total
+
+    def favorite_tribes(self, limit: int = 3):
+        # The same dicts as DiscordMember.favorite_tribes()
+        counts = sorted(((count, int(tribe_id)) for tribe_id, count in self.tribe_counts.items()), reverse=True)[:limit]
+        if not counts:
+            return []
+        tribes = {t.id: t for t in Tribe.select().where(Tribe.id.in_([tribe_id for _, tribe_id in counts]))}
+        return [{'tribe': tribe_id, 'emoji': tribes[tribe_id].emoji, 'name': tribes[tribe_id].name, 'tribe_count': count}
+                for count, tribe_id in counts]
+
+    def for_players(player_ids) -> Dict[int, 'PlayerStats']:
+        # {player_id: PlayerStats}, building and storing any missing rows with four grouped queries
+        player_ids = list(player_ids)
+        rows = {row.player_id: row for row in PlayerStats.select().where(PlayerStats.player.in_(player_ids))}
+        missing = [player_id for player_id in player_ids if player_id not in rows]
+        if missing:
+            built = PlayerStats.build(missing)
+            PlayerStats.insert_many([row.__data__ for row in built.values()]).on_conflict_ignore().execute()
+            rows.update(built)
+        return rows
+
+    def for_member(discord_member: DiscordMember) -> Dict[int, 'PlayerStats']:
+        # {guild_id: PlayerStats} for each server the member is registered on
+        players = list(Player.select(Player.id, Player.guild_id).where(Player.discord_member == discord_member))
+        rows = PlayerStats.for_players([p.id for p in players])
+        return {p.guild_id: rows[p.id] for p in players}
+
+    def build(player_ids) -> Dict[int, 'PlayerStats']:
+        rows = {player_id: PlayerStats(player=player_id) for player_id in player_ids}
+        air_min, air_max = moonrise_or_air_date_range(version='AIR')
+        counted = (Game.is_completed == 1) & (Game.is_confirmed == 1)
+        ranked_win = counted & (Game.is_ranked == 1) & (Game.winner == Lineup.gameside)
+        ranked_loss = counted & (Game.is_ranked == 1) & (Game.winner != Lineup.gameside)
+        is_air = (Game.date >= air_min) & (Game.date <= air_max)
+
+        def count(condition):
+            return fn.SUM(Case(None, [(condition, 1)], 0))
+
+        records = Lineup.select(
+            Lineup.player, count(ranked_win & is_air), count(ranked_loss & is_air),
+            count(ranked_win & ~is_air), count(ranked_loss & ~is_air), fn.COUNT(Lineup.id),
+        ).join(Game).where(Lineup.player.in_(player_ids)).group_by(Lineup.player)
+        for player_id, *counts in records.tuples():
+            row = rows[player_id]
+            row.wins_air, row.losses_air, row.wins_moonrise, row.losses_moonrise, row.games_total = counts
+
+        active_ts = fn.GREATEST(Game.date, Game.completed_ts)
+        recent = Lineup.select(Lineup.player, Game.id, active_ts).join(Game).where(
+            Lineup.player.in_(player_ids) & (active_ts > datetime.datetime.now() - datetime.timedelta(days=PlayerStats.RECENT_DAYS))
+        )
+        for player_id, game_id, ts in recent.tuples():
+            rows[player_id].recent_games[str(game_id)] = ts.isoformat()
+
+        tribes = Lineup.select(Lineup.player, Lineup.tribe, fn.COUNT(Lineup.id)).where(
+            Lineup.player.in_(player_ids) & Lineup.tribe.is_null(False)
+        ).group_by(Lineup.player, Lineup.tribe)
+        for player_id, tribe_id, tribe_count in tribes.tuples():
+            rows[player_id].tribe_counts[str(tribe_id)] = tribe_count
+
+        league = Lineup.select(
+            Lineup.player, Game.league_tier, count(Game.winner == Lineup.gameside), count(Game.winner != Lineup.gameside)
+        ).join(Game).where(
+            Lineup.player.in_(player_ids) & counted & Game.league_tier.is_null(False)
+        ).group_by(Lineup.player, Game.league_tier)
+        for player_id, tier, wins, losses in league.tuples():
+            rows[player_id].league_records[str(tier)] = [wins, losses]
+
+        return rows
+
+    def invalidate(player_ids=None):
+        query = PlayerStats.delete()
+        if player_ids is not None:
+            query = query.where(PlayerStats.player.in_(player_ids))
+        return query.execute()
+
+    def record_game(game: 'Game'):
+        # Called once a result is confirmed, to count it on the stats rows of the game's players
+        lineups = list(game.lineup)
+        rows = PlayerStats.select().where(PlayerStats.player.in_([lineup.player_id for lineup in lineups]))
+        lineups_by_player = {lineup.player_id: lineup for lineup in lineups}
+        game_date = game.date.date() if isinstance(game.date, datetime.datetime) else game.date
+        is_air = game_date < settings.moonrise_reset_date
+        active_ts = max(datetime.datetime.combine(game_date, datetime.time.min), game.completed_ts)
+        recent_cutoff = datetime.datetime.now() - datetime.timedelta(days=PlayerStats.RECENT_DAYS)
+
+        write_buffer = WriteBuffer()
+        for row in rows:
+            is_win = lineups_by_player[row.player_id].gameside_id == game.winner_id
+            if game.is_ranked:
+                field = f'{"wins" if is_win else "losses"}_{"air" if is_air else "moonrise"}'
+                setattr(row, field, getattr(row, field) + 1)
+            if game.league_tier:
+                wins, losses = row.league_records.get(str(game.league_tier), (0, 0))
+                row.league_records[str(game.league_tier)] = [wins + is_win, losses + (not is_win)]
+            row.recent_games = {game_id: ts for game_id, ts in row.recent_games.items()
+                                if datetime.datetime.fromisoformat(ts) > recent_cutoff}
+            row.recent_games[str(game.id)] = active_ts.isoformat()
+            write_buffer.save(row, 'wins_air', 'losses_air', 'wins_moonrise', 'losses_moonrise', 'recent_games', 'league_records')
+        write_buffer.flush()
+
+
+class TeamSeasonRecord(NamedTuple):
+    # One team's line in the league standings, with the fields Team.polychamps_tier_records() selects
+    team_id: int
+    name: str
+    emoji: str
+    regular_season_wins: int
+    regular_season_losses: int
+    regular_season_incomplete: int
+    post_season_wins: int
+    post_season_losses: int
+    post_season_incomplete: int
+
+
+class SeasonStandings(BaseModel):
+    # Team records of one PolyChampions season, counted as Team.polychamps_tier_records() counts them. Built for every
+    # missing season in one grouped query the first time it is read, then kept: a finished season never changes, and
+    # record_game() moves a confirmed game of the current season from incomplete to a win and a loss. Anything else that
+    # changes a season's games - a game started, renamed, unconfirmed or deleted - deletes the row so it is rebuilt.
+    league_season = SmallIntegerField(unique=True)
+    records = BinaryJSONField(default=dict)  # {league_tier: {team_id: [regular W, L, incomplete, post-season W, L, incomplete]}}
+    created_ts = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        table_name = 'season_standings'
+
+    def build(seasons=None) -> Dict[int, dict]:
+        # {league_season: records} for the given seasons (all seasons if None) from one grouped query
+        def count(condition):
+            return fn.SUM(Case(None, [(condition, 1)], 0))
+
+        is_win, is_post = (GameSide.id == Game.winner), Game.league_playoff
+        season_filter = Game.league_season.in_(list(seasons)) if seasons is not None else Game.league_season.is_null(False)
+        query = GameSide.select(
+            Game.league_season, Game.league_tier, GameSide.team,
+            count(is_win & ~is_post & Game.is_confirmed), count(~is_win & ~is_post & Game.is_confirmed), count(~Game.is_confirmed & ~is_post),
+            count(is_win & is_post & Game.is_confirmed), count(~is_win & is_post & Game.is_confirmed), count(~Game.is_confirmed & is_post),
+        ).join(Game).where(
+            (Game.guild_id == settings.server_ids['polychampions']) & (Game.is_pending == False) &
+            season_filter & Game.league_tier.is_null(False) & GameSide.team.is_null(False)
+        ).group_by(Game.league_season, Game.league_tier, GameSide.team)
+
+        standings = {season: {} for season in seasons} if seasons is not None else {}
+        for season, tier, team_id, *counts in query.tuples():
+            standings.setdefault(season, {}).setdefault(str(tier), {})[str(team_id)] = counts
+        return standings
+
+    def for_seasons(seasons) -> Dict[int, dict]:
+        # {league_season: records}, building and storing any seasons that are not stored yet
+        seasons = set(seasons)
+        stored = {row.league_season: row.records for row in SeasonStandings.select().where(SeasonStandings.league_season.in_(list(seasons)))}
+        missing = seasons - set(stored)
+        if missing:
+            built = SeasonStandings.build(missing)
+            SeasonStandings.insert_many(
+                [{'league_season': season, 'records': records} for season, records in built.items()]
+            ).on_conflict_ignore().execute()
+            stored.update(built)
+        return stored
+
+    def standings(season: int = None) -> List[tuple]:
+        # [(league_tier, [TeamSeasonRecord, ...]), ...] for one season, or summed over all seasons if season is None.
+        # Teams are in the order of Team.polychamps_tier_records()
+        if season is None:
+            seasons = [s for s, in Game.select(Game.league_season).distinct().where(
+                (Game.league_season.is_null(False)) & (Game.guild_id == settings.server_ids['polychampions'])).tuples()]
+        else:
+            seasons = [season]
+
+        totals = {}
+        for records in SeasonStandings.for_seasons(seasons).values():
+            for tier, team_records in records.items():
+                for team_id, counts in team_records.items():
+                    tier_totals = totals.setdefault(int(tier), {})
+                    tier_totals[int(team_id)] = [a + b for a, b in zip(tier_totals.get(int(team_id), [0] * 6), counts)]
+
+        team_ids = {team_id for tier_totals in totals.values() for team_id in tier_totals}
+        teams = {team.id: team for team in Team.select(Team.id, Team.name, Team.emoji).where(Team.id.in_(list(team_ids)))} if team_ids else {}
+        result = []
+        for tier in sorted(totals):
+            tier_records = [TeamSeasonRecord(team_id, teams[team_id].name, teams[team_id].emoji, *counts) for team_id, counts in totals[tier].items()]
+            tier_records.sort(key=lambda r: (r.post_season_wins, r.regular_season_wins, r.regular_season_incomplete), reverse=True)
+            result.append((tier, tier_records))
+        return result
+
+    def invalidate(seasons=None):
+        query = SeasonStandings.delete()
+        if seasons is not None:
+            seasons = [season for season in seasons if season]
+            if not seasons:
+                return 0
+            query = query.where(SeasonStandings.league_season.in_(seasons))
+        return query.execute()
+
+    def record_game(game: 'Game'):
+        # Called once a league game's result is confirmed, while it still counted as incomplete on the stored row
+        if not game.league_season or not game.league_tier:
+            return
+        row = SeasonStandings.select().where(SeasonStandings.league_season == game.league_season).for_update().first()
+        if not row:
+            return
+
+        offset = 3 if game.league_playoff else 0
+        tier_records = row.records.get(str(game.league_tier), {})
+        for side in game.gamesides:
+            if not side.team_id:
+                continue
+            counts = tier_records.get(str(side.team_id))
+            if not counts or not counts[offset + 2]:
+                # The row does not have this game as incomplete, so it cannot be moved across. Rebuild the season instead.
+                return SeasonStandings.invalidate([game.league_season])
+            counts[offset + 2] -= 1
+            counts[offset + (0 if side.id == game.winner_id else 1)] += 1
+        row.save()
+
+
 class TeamServerBroadcastMessage(BaseModel):
     class Meta:
         table_name = 'team_server_broadcast_message'
@@ -3740,7 +4687,8 @@ def player_prefers_house(cls, player_id: int, house_id: int):
     db.create_tables([
         Configuration, House, Team, DiscordMember, Game, Player, Tribe, Squad,
         GameSide, SquadMember, Lineup, GameLog, TeamServerBroadcastMessage,
-        ApiApplication, Auction, Bid, PlayerHousePreference
+        ApiApplication, Auction, Bid, PlayerHousePreference, EloLedger, EloCheckpoint,
+        Leaderboard, LeaderboardEntry, DiscordMemberStats, PlayerStats, SeasonStandings
     ])
     # Only creates missing tables so should be safe to run each time
 
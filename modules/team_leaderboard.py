@@ -0,0 +1,110 @@
+"""Data for the ``lbteam`` leaderboard.
+
+``build()`` loads the listed teams, their records and their ELO history with
+three queries no matter how many teams are shown. ``smooth_histories()``
+resamples every team's history onto one daily frame and smooths it with a
+Savitzky-Golay filter, and ``member_counts()`` counts role members in one
+pass over the guild. The rendered page is cached by ``lbteam`` through
+``modules.leaderboard_cache``.
+"""
+
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.signal as signal
+
+from modules.models import EloLedger, Team
+
+MAX_TEAMS = 25
+
+
+class TeamHistory(NamedTuple):
+    completed_ts: pd.Series   # one point per completed game
+    elo: pd.Series
+    days: pd.DatetimeIndex    # daily resample of the same history
+    smoothed: np.ndarray
+
+
+class TeamStanding(NamedTuple):
+    team: Team
+    elo: int
+    wins: int
+    losses: int
+    history: TeamHistory      # None if the team has no rated games
+
+
+def filter_shape(length: int) -> Tuple[int, int]:
+    # Savitzky-Golay (window_length, polyorder) for a daily series of this length: an odd window a third as long
+    filter_length = max(int(length / 3), 1)
+    filter_length = filter_length if filter_length % 2 != 0 else filter_length - 1
+    poly_order = 2 if filter_length > 2 else 0
+    return filter_length, poly_order
+
+
+def smooth_histories(history: pd.DataFrame) -> Dict[int, TeamHistory]:
+    # history has entity_id, completed_ts and elo columns. Each team is resampled to one mean value per day and
+    # interpolated between its own first and last game, then series of equal length are smoothed together.
+    if history.empty:
+        return {}
+
+    daily = history.assign(day=history['completed_ts'].dt.floor('D')).pivot_table(
+        index='day', columns='entity_id', values='elo', aggfunc='mean'
+    ).asfreq('D').interpolate(limit_area='inside')
+
+    spans = {team_id: daily[team_id].dropna() for team_id in daily.columns}
+    smoothed = {}
+    by_length = {}
+    for team_id, span in spans.items():
+        by_length.setdefault(len(span), []).append(team_id)
+    for length, team_ids in by_length.items():
+        filter_length, poly_order = filter_shape(length)
+        block = np.column_stack([spans[team_id].values for team_id in team_ids])
+        for team_id, column in zip(team_ids, signal.savgol_filter(block, filter_length, poly_order, axis=0).T):
+            smoothed[team_id] = column
+
+    points = {team_id: rows for team_id, rows in history.groupby('entity_id')}
+    return {
+        team_id: TeamHistory(points[team_id]['completed_ts'], points[team_id]['elo'], spans[team_id].index, smoothed[team_id])
+        for team_id in spans
+    }
+
+
+def build(guild_id: int, league_tier: int = None, include_archived: bool = False, alltime: bool = False,
+          limit: int = MAX_TEAMS) -> Tuple[List[TeamStanding], int]:
+    # ([TeamStanding] for the first limit teams by ELO, number of teams on the leaderboard)
+    archived_arg = (True) if include_archived else (Team.is_archived == 0)
+    tier_arg = (Team.league_tier == league_tier) if league_tier else (Team.league_tier.is_null(False))
+    teams = list(Team.select().where(
+        (Team.is_hidden == 0) & (archived_arg) & (Team.guild_id == guild_id) & (tier_arg)
+    ).order_by(-Team.elo))
+    shown = teams[:limit]
+    if not shown:
+        return [], len(teams)
+
+    team_ids = [team.id for team in shown]
+    records = Team.get_records(team_ids, alltime=alltime)
+    history = pd.DataFrame(
+        list(EloLedger.histories('team', team_ids, ['elo_alltime' if alltime else 'elo']).dicts()),
+        columns=['entity_id', 'completed_ts', 'elo']
+    )
+    history['completed_ts'] = pd.to_datetime(history['completed_ts'])
+    histories = smooth_histories(history)
+
+    standings = [
+        TeamStanding(team, team.elo_alltime if alltime else team.elo, *records[team.id], histories.get(team.id))
+        for team in shown
+    ]
+    return standings, len(teams)
+
+
+def member_counts(guild, inactive_role_name: str = None) -> Dict[int, int]:
+    # {role_id: members holding the role}, skipping members who hold the inactive (MIA) role
+    mia_role = next((role for role in guild.roles if role.name == inactive_role_name), None) if inactive_role_name else None
+    counts = {}
+    for member in guild.members:
+        if mia_role and mia_role in member.roles:
+            continue
+        for role in member.roles:
+            counts[role.id] = counts.get(role.id, 0) + 1
+    return counts
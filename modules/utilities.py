@@ -393,7 +393,7 @@ def export_game_data_brief(query, export_logs=False):
     return filename
 
 
-def export_player_data(player_list, member_list):
+def export_player_data(player_list, member_list, memo: dict = None):
     import csv
     # only supports two-sided games, one winner and one loser
 
@@ -406,11 +406,15 @@ def export_player_data(player_list, member_list):
         header = ['name', 'discord_id', 'team', 'elo', 'elo_max', 'global_elo', 'global_elo_max', 'local_record', 'global_record', 'games_in_last_14d', 'poly_id', 'poly_name', 'profile_image']
         game_writer.writerow(header)
 
+        memo = {} if memo is None else memo
+        p_records = models.Player.get_records([p.id for p in player_list], memo=memo)
+        dm_records = models.DiscordMember.get_records([p.discord_member_id for p in player_list], memo=memo)
+
         for player, member in zip(player_list, member_list):
 
             dm = player.discord_member
-            p_record = player.get_record()
-            dm_record = dm.get_record()
+            p_record = p_records[player.id]
+            dm_record = dm_records[dm.id]
 
             recent_games = dm.games_played(in_days=14).count()
 
@@ -426,6 +430,7 @@ def export_player_data(player_list, member_list):
 async def paginate(bot, ctx, title, message_list, page_start=0, page_end=10, page_size=10):
     # Allows user to page through a long list of messages with reactions
     # message_list should be a [(List of, two-item tuples)]. Each tuple will be split into an embed field name/value
+    # or a list that loads its entries a page at a time (with a fetch(start, end) method), like game_pages.GamePages
 
     page_end = page_end if len(message_list) > page_end else len(message_list)
 
@@ -433,6 +438,8 @@ async def paginate(bot, ctx, title, message_list, page_start=0, page_end=10, pag
     reaction, user = None, None
 
     while True:
+        if hasattr(message_list, 'fetch'):
+            await asyncio.get_running_loop().run_in_executor(None, message_list.fetch, page_start, page_end)
         embed = discord.Embed(title=title)
         for entry in range(page_start, page_end):
             embed.add_field(name=message_list[entry][0][:256], value=message_list[entry][1][:1024], inline=False)
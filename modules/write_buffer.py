@@ -0,0 +1,70 @@
+"""Batched write-back for model updates.
+
+The ELO code paths used to call ``.save()`` on every Player, DiscordMember,
+Lineup, GameSide, Team and Squad they touched, often several times per row
+for one game. A ``WriteBuffer`` stands in for those saves: ``save()`` records
+the row as it stands, and ``flush()`` writes every buffered row of a model
+with one ``UPDATE ... FROM (VALUES ...)`` statement per model.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable
+
+from peewee import ValuesList, chunked
+
+BATCH_SIZE = 500
+
+
+def update_rows(model, rows: Dict[int, dict], fields: Iterable[str], batch_size: int = BATCH_SIZE) -> int:
+    """Write ``rows`` ({primary key: {field name: value}}) with UPDATE ... FROM (VALUES ...).
+
+    Each column is cast to the field's type, since postgres reads a VALUES
+    column that only holds NULLs as text. Returns the number of rows updated.
+    """
+    model_fields = [model._meta.fields[f] for f in fields]
+    pk = model._meta.primary_key
+    column_types = model._meta.database.field_types  # e.g. DATETIME is TIMESTAMP in postgres
+    updated = 0
+    for batch in chunked(list(rows.items()), batch_size):
+        values = ValuesList(
+            [(record_id, *(f.db_value(row[f.name]) for f in model_fields)) for record_id, row in batch],
+            columns=['id', *(f.column_name for f in model_fields)],
+            alias='v',
+        )
+        update = {f: getattr(values.c, f.column_name).cast(column_types.get(f.field_type, f.field_type)) for f in model_fields}
+        updated += model.update(update).from_(values).where(pk == values.c.id).execute()
+    return updated
+
+
+class WriteBuffer:
+    """Collects dirty fields per row and writes them in one statement per model.
+
+    ``save(instance, *fields)`` behaves like ``instance.save(only=fields)``
+    deferred until ``flush()``: the values are captured when ``save()`` is
+    called, so a later save of the same row - even through another instance -
+    wins, as it would with ``.save()``.
+    """
+
+    def __init__(self):
+        self._rows = defaultdict(dict)  # {model: {primary key: {field name: value}}}
+
+    def save(self, instance, *fields: str):
+        row = self._rows[type(instance)].setdefault(instance.get_id(), {})
+        for field_name in fields:
+            row[field_name] = getattr(instance, field_name)
+
+    def __len__(self):
+        return sum(len(rows) for rows in self._rows.values())
+
+    def flush(self) -> int:
+        """Write all buffered rows and empty the buffer. Returns the number of rows updated."""
+        updated = 0
+        for model, rows in self._rows.items():
+            # Rows that share a set of dirty fields go in the same statement
+            by_fields = defaultdict(dict)
+            for record_id, row in rows.items():
+                by_fields[tuple(sorted(row))][record_id] = row
+            for fields, field_rows in by_fields.items():
+                updated += update_rows(model, field_rows, fields)
+        self._rows.clear()
+        return updated
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""Benchmark the ELO engine against a synthetic game history.
+
+Generates guilds' worth of players, teams, squads and completed games in the
+development PostgreSQL database, then times a full recalculation,
+recalculate_elo_since() from several depths and single-game declare_winner()
+calls. Wall time and the number of SQL statements of each step are written
+to a JSON file so runs from different commits can be compared.
+
+Everything runs inside one transaction that is rolled back at the end unless
+--keep is given. Worker processes only see committed rows, so --processes
+above 1 requires --keep.
+
+    POLYBOT_ENV=development python scripts/benchmark_elo.py --games 5000
+    POLYBOT_ENV=development python scripts/benchmark_elo.py --compare before.json
+"""
+
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+import datetime
+import json
+from pathlib import Path
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from unittest import mock
+import uuid
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from runtime_config import RuntimeConfigurationError, get_runtime_profile
+
+# (side sizes, weight): mostly 1v1, then team games and free-for-alls
+GAME_SHAPES = (
+    ((1, 1), 50),
+    ((2, 2), 15),
+    ((3, 3), 10),
+    ((1, 1, 1), 8),
+    ((1, 1, 1, 1), 5),
+    ((2, 2, 2), 4),
+    ((1, 2), 3),
+    ((4, 4), 2),
+    ((1, 1, 1, 1, 1, 1), 3),
+)
+HISTORY_START = datetime.datetime(2019, 6, 1, 12, 0)
+HISTORY_END = datetime.datetime(2023, 6, 1, 12, 0)
+
+
+class QueryCounter:
+    """Counts the statements sent through db.execute_sql(), keyed by their first keyword."""
+
+    def __init__(self, db):
+        self.db = db
+        self.counts = Counter()
+
+    @contextmanager
+    def counting(self):
+        execute_sql = self.db.execute_sql
+
+        def counted(sql, *args, **kwargs):
+            self.counts[sql.lstrip().split(None, 1)[0].upper()] += 1
+            return execute_sql(sql, *args, **kwargs)
+
+        with mock.patch.object(self.db, 'execute_sql', side_effect=counted):
+            yield self.counts
+
+
+def measure(db, name, function, **details):
+    """Run function() once and return its timing, statement counts and any details."""
+    counter = QueryCounter(db)
+    with counter.counting() as counts:
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+    row = {
+        'name': name,
+        'wall_time': round(elapsed, 4),
+        'queries': sum(counts.values()),
+        'queries_by_type': dict(sorted(counts.items())),
+        **details,
+    }
+    if isinstance(result, int) and not isinstance(result, bool):
+        row['result'] = result
+    print(f"{name:<40} {row['wall_time']:>9.3f}s {row['queries']:>8} queries", file=sys.stderr)
+    return row
+
+
+def insert_returning_ids(model, rows):
+    # insert_many() on postgres returns the new primary keys in insert order
+    ids = []
+    for start in range(0, len(rows), 1000):
+        cursor = model.insert_many(rows[start:start + 1000]).returning(model._meta.primary_key).tuples().execute()
+        ids.extend(row[0] for row in cursor)
+    return ids
+
+
+def generate_history(models, guild_ids, players=200, teams=6, games=5000, seed=0,
+                     unranked_share=0.05, start=HISTORY_START, end=HISTORY_END):
+    """Insert a synthetic completed, confirmed game history and return the new game ids in completed order.
+
+    Each member plays in every guild with a hidden skill that decides most
+    results. Team games draw half of their sides from a pool of regular
+    squads, so squads build up histories the way real ones do. Ratings are
+    left at their defaults; a full recalculation fills them in.
+    """
+    rng = random.Random(seed)
+    suffix = uuid.uuid4().hex[:8]
+    base_discord_id = 8_700_000_000_000_000 + uuid.uuid4().int % 1_000_000_000
+    shapes, weights = zip(*GAME_SHAPES)
+
+    member_ids = insert_returning_ids(models.DiscordMember, [
+        {'discord_id': base_discord_id + i, 'name': f'Bench {i} {suffix}'} for i in range(players)
+    ])
+    skill = {member_id: rng.gauss(0, 1) for member_id in member_ids}
+
+    guild_players, guild_teams, regular_squads = {}, {}, {}
+    for guild_id in guild_ids:
+        guild_teams[guild_id] = insert_returning_ids(models.Team, [
+            {'name': f'Bench Team {i} {suffix}', 'guild_id': guild_id} for i in range(teams)
+        ])
+        player_ids = insert_returning_ids(models.Player, [
+            {'discord_member': member_id, 'guild_id': guild_id, 'name': f'Bench {i} {suffix}',
+             'team': rng.choice(guild_teams[guild_id])}
+            for i, member_id in enumerate(member_ids)
+        ])
+        guild_players[guild_id] = dict(zip(player_ids, member_ids))
+        regular_squads[guild_id] = {size: [tuple(rng.sample(player_ids, size)) for _ in range(max(1, players // (size * 2)))]
+                                    for size in (2, 3, 4)}
+
+    squad_ids = {}  # frozenset of player ids -> squad id
+
+    def squad_for(guild_id, side_players):
+        key = frozenset(side_players)
+        if key not in squad_ids:
+            squad_ids[key] = models.Squad.insert(guild_id=guild_id, member_ids=models.Squad.signature(side_players)).execute()
+            models.SquadMember.insert_many([{'player': p, 'squad': squad_ids[key]} for p in side_players]).execute()
+        return squad_ids[key]
+
+    step = (end - start) / games
+    game_rows, side_plans = [], []
+    for index in range(games):
+        guild_id = guild_ids[min(int(rng.paretovariate(1.5)) - 1, len(guild_ids) - 1)]
+        shape = rng.choices(shapes, weights)[0]
+        completed_ts = start + step * index + datetime.timedelta(seconds=rng.randint(0, 600))
+        game_rows.append({
+            'guild_id': guild_id,
+            'name': f'Bench {index} {suffix}',
+            'date': (completed_ts - datetime.timedelta(days=rng.randint(1, 14))).date(),
+            'completed_ts': completed_ts,
+            'size': list(shape),
+            'is_completed': True,
+            'is_confirmed': True,
+            'is_ranked': rng.random() >= unranked_share,
+            'is_pending': False,
+        })
+
+        available = list(guild_players[guild_id])
+        rng.shuffle(available)
+        sides = []
+        for side_size in shape:
+            regulars = regular_squads[guild_id].get(side_size, [])
+            candidates = [s for s in regulars if not set(s) - set(available)]
+            if candidates and rng.random() < 0.5:
+                side_players = list(rng.choice(candidates))
+            else:
+                side_players = available[:side_size]
+            available = [p for p in available if p not in side_players]
+            sides.append(side_players)
+        side_teams = rng.sample(guild_teams[guild_id], len(shape)) if len(shape) <= teams else [None] * len(shape)
+        strength = [sum(skill[guild_players[guild_id][p]] for p in s) / len(s) + rng.gauss(0, 0.8) for s in sides]
+        side_plans.append((guild_id, sides, side_teams, strength.index(max(strength))))
+
+    game_ids = insert_returning_ids(models.Game, game_rows)
+
+    side_rows = []
+    for game_id, (guild_id, sides, side_teams, _) in zip(game_ids, side_plans):
+        for position, (side_players, team_id) in enumerate(zip(sides, side_teams), start=1):
+            side_rows.append({
+                'game': game_id, 'team': team_id, 'size': len(side_players), 'position': position,
+                'squad': squad_for(guild_id, side_players) if len(side_players) > 1 else None,
+            })
+    side_ids = iter(insert_returning_ids(models.GameSide, side_rows))
+
+    lineup_rows, winners = [], {}
+    for game_id, (_, sides, _, winner_index) in zip(game_ids, side_plans):
+        for position, side_players in enumerate(sides):
+            side_id = next(side_ids)
+            if position == winner_index:
+                winners[game_id] = {'winner': side_id}
+            lineup_rows.extend({'game': game_id, 'gameside': side_id, 'player': p} for p in side_players)
+    for start_row in range(0, len(lineup_rows), 1000):
+        models.Lineup.insert_many(lineup_rows[start_row:start_row + 1000]).execute()
+
+    from modules.write_buffer import update_rows
+    update_rows(models.Game, winners, ('winner',))
+
+    # Fresh statistics, so query plans match a database that already held this history. ANALYZE also
+    # samples rows this transaction inserted but has not committed.
+    models.db.execute_sql('ANALYZE')
+    return game_ids
+
+
+def benchmark_declares(models, db, game_ids, count, rng):
+    """Reverse and redeclare the most recent games, timing only declare_winner()."""
+    timings = []
+    recent = models.Game.select().where(
+        models.Game.id.in_(game_ids) & (models.Game.is_ranked == True)  # noqa: E712
+    ).order_by(models.Game.completed_ts.desc()).limit(count * 3)
+    for game in rng.sample(list(recent), min(count, len(recent))):
+        game.reverse_elo_changes()
+        game.is_confirmed = False
+        game.save()
+        full_game = models.Game.load_full_game(game_id=game.id)
+        winner = full_game.winner
+        shape = 'v'.join(str(s) for s in full_game.size)
+        timings.append(measure(
+            db, f'declare_winner {shape} game {game.id}',
+            lambda: full_game.declare_winner(winning_side=winner, confirm=True),
+            shape=shape,
+        ))
+
+    summary = {}
+    for shape in sorted({t['shape'] for t in timings}):
+        rows = [t for t in timings if t['shape'] == shape]
+        summary[shape] = {
+            'count': len(rows),
+            'median_wall_time': round(statistics.median(t['wall_time'] for t in rows), 4),
+            'median_queries': statistics.median(t['queries'] for t in rows),
+        }
+    return timings, summary
+
+
+def run(models, guild_ids, players=200, teams=6, games=5000, depths=(10, 100, 1000),
+        declares=20, processes=1, legacy=False, seed=0, keep=False):
+    """Generate a history, run every benchmark and return the results as a dict."""
+    db = models.db
+    rng = random.Random(seed)
+    results = []
+    with db.atomic() as transaction:
+        started = time.perf_counter()
+        game_ids = generate_history(models, guild_ids, players=players, teams=teams, games=games, seed=seed)
+        setup = {
+            'generate_seconds': round(time.perf_counter() - started, 3),
+            'synthetic_games': len(game_ids),
+            'total_completed_games': models.Game.select().where(models.Game.is_completed == True).count(),  # noqa: E712
+            'total_lineups': models.Lineup.select().count(),
+        }
+        if keep:
+            transaction.commit()
+
+        results.append(measure(
+            db, 'recalculate_all_elo', lambda: models.Game.recalculate_all_elo(processes=processes),
+            processes=processes,
+        ))
+        if legacy:
+            with db.atomic() as legacy_transaction:
+                results.append(measure(db, 'recalculate_all_elo legacy', lambda: models.Game.recalculate_all_elo(in_memory=False)))
+                legacy_transaction.rollback()
+
+        completed = models.Game.select(models.Game.completed_ts).where(
+            models.Game.id.in_(game_ids)
+        ).order_by(models.Game.completed_ts.desc()).tuples()
+        timestamps = [row[0] for row in completed]
+        for depth in depths:
+            if depth > len(timestamps):
+                continue
+            since = timestamps[depth - 1]
+            results.append(measure(
+                db, f'recalculate_elo_since depth {depth}',
+                lambda: models.Game.recalculate_elo_since(timestamp=since), depth=depth,
+            ))
+
+        declare_timings, declare_summary = benchmark_declares(models, db, game_ids, declares, rng)
+        results.extend(declare_timings)
+
+        if not keep:
+            transaction.rollback()
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'parameters': {
+                'guilds': len(guild_ids), 'players': players, 'teams': teams, 'games': games,
+                'depths': list(depths), 'declares': declares, 'processes': processes, 'seed': seed,
+            },
+        },
+        'setup': setup,
+        'results': results,
+        'declare_winner': declare_summary,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Return printable lines comparing the wall time and queries of steps present in both runs."""
+    def keyed(report):
+        rows = {r['name']: r for r in report['results'] if not r['name'].startswith('declare_winner ')}
+        for shape, row in report.get('declare_winner', {}).items():
+            rows[f'declare_winner {shape} (median)'] = {'wall_time': row['median_wall_time'], 'queries': row['median_queries']}
+        return rows
+
+    before, after = keyed(previous), keyed(current)
+    lines = []
+    if previous['meta']['parameters'] != current['meta']['parameters']:
+        lines.append('Note: the runs used different parameters, so timings are not directly comparable')
+    lines.append(f"{'step':<40} {'before':>9} {'after':>9} {'change':>8} {'queries':>17}")
+    for name in after:
+        if name not in before:
+            continue
+        old, new = before[name], after[name]
+        change = (new['wall_time'] / old['wall_time'] - 1) * 100 if old['wall_time'] else 0
+        lines.append(
+            f"{name:<40} {old['wall_time']:>8.3f}s {new['wall_time']:>8.3f}s {change:>+7.1f}% "
+            f"{old['queries']:>8} -> {new['queries']:<6}"
+        )
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--guilds', type=int, default=None, help='configured guilds to spread games over (default: all)')
+    parser.add_argument('--players', type=int, default=200, help='Discord members, each playing in every guild')
+    parser.add_argument('--teams', type=int, default=6, help='teams per guild')
+    parser.add_argument('--games', type=int, default=5000)
+    parser.add_argument('--depths', default='10,100,1000', help='comma separated game counts for recalculate_elo_since')
+    parser.add_argument('--declares', type=int, default=20, help='recent games to redeclare')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--legacy', action='store_true', help='also time the save()-per-row recalculation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='commit the synthetic history instead of rolling it back')
+    parser.add_argument('--output', default='elo_benchmark.json')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to compare against')
+    args = parser.parse_args(argv)
+
+    try:
+        profile = get_runtime_profile()
+    except RuntimeConfigurationError as exc:
+        print(f'Runtime configuration error: {exc}', file=sys.stderr)
+        return 2
+    if profile.environment != 'development':
+        print('The ELO benchmark writes to the database and only runs with POLYBOT_ENV=development.', file=sys.stderr)
+        return 2
+    if args.processes > 1 and not args.keep:
+        print('--processes above 1 needs --keep: worker processes cannot see rolled back rows.', file=sys.stderr)
+        return 2
+
+    guild_ids = list(profile.allowed_guild_ids)
+    if args.guilds:
+        if args.guilds > len(guild_ids):
+            print(f'Only {len(guild_ids)} guilds are configured for development.', file=sys.stderr)
+            return 2
+        guild_ids = guild_ids[:args.guilds]
+
+    from modules import models
+
+    report = run(
+        models, guild_ids, players=args.players, teams=args.teams, games=args.games,
+        depths=[int(d) for d in args.depths.split(',') if d], declares=args.declares,
+        processes=args.processes, legacy=args.legacy, seed=args.seed, keep=args.keep,
+    )
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(json.load(f), report)))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -30,8 +30,8 @@
     RUN_DATABASE_INTEGRATION,
     f'set {INTEGRATION_FLAG}=1 to run development-database integration tests',
 )
-class DevelopmentDatabaseIntegrationTests(unittest.TestCase):
-    """Exercise production-shaped code only after a strict database preflight."""
+class DevelopmentDatabaseTestCase(unittest.TestCase):
+    """Strict database preflight shared by the development-database suites."""
 
     @classmethod
     def setUpClass(cls):
@@ -111,6 +111,14 @@ def rollback_scope(self):
             finally:
                 transaction.rollback()
 
+
+@unittest.skipUnless(
+    RUN_DATABASE_INTEGRATION,
+    f'set {INTEGRATION_FLAG}=1 to run development-database integration tests',
+)
+class DevelopmentDatabaseIntegrationTests(DevelopmentDatabaseTestCase):
+    """Exercise production-shaped code only after a strict database preflight."""
+
     def test_model_import_initialized_expected_schema(self):
         expected_tables = {
             'apiapplication',
@@ -0,0 +1,1076 @@
+"""Development-database tests for the ELO recalculation paths."""
+
+import csv
+import datetime
+import functools
+import gzip
+import itertools
+import json
+import os
+import tempfile
+import random
+from types import SimpleNamespace
+import unittest
+from unittest import mock
+import uuid
+
+from tests.test_database_integration import (
+    INTEGRATION_FLAG,
+    RUN_DATABASE_INTEGRATION,
+    DevelopmentDatabaseTestCase,
+)
+
+
+GAME_SHAPES = ([1, 1], [1, 1], [2, 2], [3, 3], [1, 2], [1, 1, 1], [2, 2, 2])
+
+
+def rating_snapshot(models):
+    snapshot = {}
+    for model in (models.Player, models.DiscordMember, models.Team, models.Squad, models.GameSide, models.Lineup):
+        rows = model.select().order_by(model.id).dicts()
+        snapshot[model.__name__] = {row['id']: row for row in rows}
+    snapshot['Game'] = {
+        row['id']: row for row in models.Game.select(
+            models.Game.id, models.Game.is_completed, models.Game.is_confirmed, models.Game.winner
+        ).order_by(models.Game.id).dicts()
+    }
+    # Ledger rows are rewritten rather than updated, so key them by what they describe instead of by id
+    ledger = models.EloLedger
+    snapshot['EloLedger'] = {
+        tuple(row[:4]): tuple(row[4:]) for row in ledger.select(
+            ledger.entity_type, ledger.entity_id, ledger.flavour, ledger.game,
+            ledger.completed_ts, ledger.elo_before, ledger.elo_after, ledger.elo_delta,
+        ).tuples()
+    }
+    return snapshot
+
+
+class RankedHistoryTestCase(DevelopmentDatabaseTestCase):
+    """Fixtures for suites that need games with ELO history behind them."""
+
+    def setUp(self):
+        super().setUp()
+        self.suffix = uuid.uuid4().hex[:8]
+        self.base_discord_id = 8_600_000_000_000_000 + uuid.uuid4().int % 1_000_000
+
+    def create_members(self, count):
+        return [
+            self.models.DiscordMember.create(
+                discord_id=self.base_discord_id + i,
+                name=f'Elo Seed {i} {self.suffix}',
+            )
+            for i in range(count)
+        ]
+
+    def create_players(self, guild_id, members):
+        return [
+            self.models.Player.create(
+                discord_member=member,
+                guild_id=guild_id,
+                name=member.name,
+            )
+            for member in members
+        ]
+
+    def create_bot_player(self, guild_id):
+        bot_member = self.models.DiscordMember.get_or_create(
+            discord_id=self.settings.bot_id,
+            defaults={'name': 'Elo Bot'},
+        )[0]
+        return self.models.Player.get_or_create(
+            discord_member=bot_member,
+            guild_id=guild_id,
+            defaults={'name': 'Elo Bot'},
+        )[0]
+
+    def create_teams(self, guild_id, count):
+        return [
+            self.models.Team.create(
+                name=f'Elo Team {guild_id % 1000}-{i} {self.suffix}',
+                guild_id=guild_id,
+            )
+            for i in range(count)
+        ]
+
+    def create_completed_game(self, guild_id, rosters, teams, completed_ts, winner, name, date=None):
+        """Create a game completed at completed_ts, with one side per roster.
+
+        Sides of more than one player get their squad. winner is the index of
+        the winning side. The game is confirmed but its ELO is not declared.
+        """
+        game = self.models.Game.create(
+            guild_id=guild_id,
+            name=name,
+            date=date or completed_ts.date(),
+            completed_ts=completed_ts,
+            size=[len(roster) for roster in rosters],
+            is_completed=True,
+            is_confirmed=True,
+        )
+        sides = []
+        for position, (roster, team) in enumerate(zip(rosters, teams), start=1):
+            squad = None
+            if len(roster) > 1:
+                squad = self.models.Squad.upsert(player_list=roster, guild_id=guild_id)
+            side = self.models.GameSide.create(
+                game=game,
+                team=team,
+                squad=squad,
+                size=len(roster),
+                position=position,
+            )
+            for player in roster:
+                self.models.Lineup.create(game=game, gameside=side, player=player)
+            sides.append(side)
+        game.winner = sides[winner]
+        game.save()
+        return game
+
+    def create_ranked_history(self):
+        """Create a fixed ranked history of 60 games spanning every ELO rule change.
+
+        Games run from mid 2019 to mid 2021 so they cross the team ELO reset,
+        the v2 calculation date and the moonrise reset. A bot player, a guild
+        excluded from the global leaderboard, completed-but-unconfirmed games,
+        repeated squads and a team filling more than one side are all included.
+        """
+        guild_ids = list(self.profile.allowed_guild_ids)
+        rng = random.Random(0)
+        members = self.create_members(14)
+        players = {guild_id: self.create_players(guild_id, members) + [self.create_bot_player(guild_id)] for guild_id in guild_ids}
+        teams = {guild_id: self.create_teams(guild_id, 3) for guild_id in guild_ids}
+
+        start = datetime.datetime(2019, 6, 1, 12, 0)
+        step = (datetime.datetime(2021, 6, 1) - start) / 60
+        games = []
+        for index in range(60):
+            guild_id = guild_ids[0] if rng.random() < 0.75 else guild_ids[-1]
+            shape = rng.choice(GAME_SHAPES)
+            # Draw from a small pool so players and squads meet repeatedly
+            roster = rng.sample(players[guild_id][:8] + players[guild_id][-1:], sum(shape))
+            completed_ts = start + step * index
+            date = completed_ts.date() - datetime.timedelta(days=rng.randint(0, 3))
+            rosters = [roster[sum(shape[:i]):sum(shape[:i + 1])] for i in range(len(shape))]
+            side_teams = [rng.choice(teams[guild_id]) for _ in shape]
+            game = self.create_completed_game(
+                guild_id, rosters, side_teams, completed_ts, winner=rng.randrange(len(shape)), name=f'Elo Seed {index} {self.suffix}', date=date,
+            )
+            if index % 17 == 5:
+                # Completed but awaiting confirmation: counts towards game totals but is never replayed
+                game.is_confirmed = False
+                game.save()
+            games.append(game)
+        return games
+
+
+@unittest.skipUnless(
+    RUN_DATABASE_INTEGRATION,
+    f'set {INTEGRATION_FLAG}=1 to run development-database integration tests',
+)
+class EloRecalculationIntegrationTests(RankedHistoryTestCase):
+
+    def assertReplayMatchesLegacy(self, run_replay, legacy=None):
+        # Runs legacy (by default the declare_winner() recalculation) and rolls it back, then run_replay, and checks that
+        # both left the same ratings. Returns the ratings
+        db = self.models.db
+        with db.atomic() as transaction:
+            if legacy:
+                legacy()
+            else:
+                self.models.Game.recalculate_all_elo(in_memory=False)
+            expected = rating_snapshot(self.models)
+            transaction.rollback()
+
+        run_replay()
+        self.assertSnapshotsEqual(expected, rating_snapshot(self.models))
+        return expected
+
+    def assertSnapshotsEqual(self, expected, actual):
+        for table, rows in expected.items():
+            self.assertEqual(rows.keys(), actual[table].keys(), table)
+            for row_id, row in rows.items():
+                self.assertEqual(row, actual[table][row_id], f'{table} {row_id}')
+
+    def test_in_memory_recalculation_matches_declare_winner(self):
+        with self.rollback_scope():
+            self.create_ranked_history()
+            self.assertReplayMatchesLegacy(lambda: self.models.Game.recalculate_all_elo(in_memory=True))
+            self.assertFalse(self.settings.recalculation_mode)
+
+    def test_incremental_recalculation_matches_reverse_and_redeclare(self):
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            self.models.Game.recalculate_all_elo()
+            since = games[35].completed_ts
+            self.assertTrue(any(len({side.team_id for side in game.gamesides}) < len(game.size) for game in games[35:]))
+
+            # Unwind a game the way $unwin does, so later games have something to change
+            unwound = self.models.Game.get_by_id(games[36].id)
+            unwound.reverse_elo_changes()
+            unwound.completed_ts, unwound.is_confirmed, unwound.is_completed, unwound.winner = None, False, False, None
+            unwound.save()
+
+            # Run twice: where one team filled several sides, reversing takes back more team ELO than declaring added,
+            # so neither path leaves team ratings unchanged on a rerun - but both must still agree
+            for _ in range(2):
+                touched = []
+                self.assertReplayMatchesLegacy(
+                    lambda: touched.append(self.models.Game.recalculate_elo_since(timestamp=since)),
+                    legacy=lambda: self.models.Game.recalculate_elo_since(timestamp=since, in_memory=False),
+                )
+                self.assertGreater(touched[0], 0)
+
+    def test_completed_games_counters_follow_declare_reverse_and_delete(self):
+        from modules import elo_replay
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            self.models.Game.recalculate_all_elo()
+            self.assertEqual(elo_replay.check_completed_games(), 0)
+
+            # With the completed games still awaiting confirmation, the counters give what completed_game_count() counts
+            self.assertTrue(any(not game.is_confirmed for game in games))
+            for game in games:
+                pending = elo_replay.pending_game_counts(game)
+                for lineup in game.lineup:
+                    for record in (lineup.player, lineup.player.discord_member):
+                        games_count, moonrise_count = pending[type(record)].get(record.id, [0, 0])
+                        self.assertEqual(record.completed_games + games_count, record.completed_game_count())
+                        self.assertEqual(record.completed_games_moonrise + moonrise_count, record.completed_game_count(moonrise=True))
+
+            latest = self.models.Game.get_by_id(games[-1].id)
+            player = latest.lineup[0].player
+            before = player.completed_games
+            self.assertGreater(before, 0)
+
+            latest.reverse_elo_changes()
+            latest.is_completed, latest.is_confirmed = False, False
+            latest.save()
+            self.assertEqual(self.models.Player.get_by_id(player.id).completed_games, before - 1)
+            self.assertEqual(elo_replay.check_completed_games(), 0)
+
+            full_game = self.models.Game.load_full_game(game_id=latest.id)
+            full_game.declare_winner(winning_side=full_game.winner, confirm=True)
+            self.assertEqual(self.models.Player.get_by_id(player.id).completed_games, before)
+            self.assertEqual(elo_replay.check_completed_games(), 0)
+
+            self.models.Game.get_by_id(games[40].id).delete_game()
+            self.assertEqual(elo_replay.check_completed_games(), 0)
+
+            expected = self.models.Player.get_by_id(player.id).completed_games
+            self.models.Player.update(completed_games=99).where(self.models.Player.id == player.id).execute()
+            self.assertEqual(elo_replay.check_completed_games(fix=True), 1)
+            self.assertEqual(self.models.Player.get_by_id(player.id).completed_games, expected)
+
+    def test_declare_and_reverse_batch_rating_writes(self):
+        db = self.models.db
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            # Where one team fills several sides, declare_winner() keeps only one side's team change, which reversal can't
+            # round trip - so every side plays for its own team here
+            Team, GameSide = self.models.Team, self.models.GameSide
+            for game in games:
+                teams = Team.select().where((Team.guild_id == game.guild_id) & Team.name.endswith(self.suffix)).order_by(Team.id)
+                for side, team in zip(game.gamesides.order_by(GameSide.position), teams):
+                    GameSide.update(team=team).where(GameSide.id == side.id).execute()
+            self.models.Game.recalculate_all_elo()
+            latest = max(
+                (g for g in games if g.size == [3, 3]), key=lambda g: (g.completed_ts, g.id)
+            )
+            # Unwind everything after it so that redeclaring it should restore the same ratings
+            for later in sorted(games, key=lambda g: (g.completed_ts, g.id), reverse=True):
+                if (later.completed_ts, later.id) <= (latest.completed_ts, latest.id):
+                    break
+                later = self.models.Game.get_by_id(later.id)
+                later.reverse_elo_changes()
+                later.is_completed, later.is_confirmed, later.winner = False, False, None
+                later.save()
+            before = rating_snapshot(self.models)
+
+            statements = []
+            execute_sql = db.execute_sql
+
+            def counting_execute_sql(sql, *args, **kwargs):
+                statements.append(sql)
+                return execute_sql(sql, *args, **kwargs)
+
+            game = self.models.Game.get_by_id(latest.id)
+            with mock.patch.object(db, 'execute_sql', side_effect=counting_execute_sql):
+                game.reverse_elo_changes()
+            reverse_updates = [sql for sql in statements if sql.startswith('UPDATE')]
+            game.is_completed, game.is_confirmed = False, False
+            game.save()
+
+            statements.clear()
+            full_game = self.models.Game.load_full_game(game_id=latest.id)
+            with mock.patch.object(db, 'execute_sql', side_effect=counting_execute_sql):
+                full_game.declare_winner(winning_side=full_game.winner, confirm=True)
+            declare_updates = [sql for sql in statements if sql.startswith('UPDATE')]
+
+            # One statement per model (Player, DiscordMember, Lineup, Team, Squad, GameSide), plus the game itself
+            self.assertLessEqual(len(reverse_updates), 6)
+            self.assertLessEqual(len(declare_updates), 7)
+            self.assertSnapshotsEqual(before, rating_snapshot(self.models))
+
+    def test_dry_run_reports_changes_without_writing(self):
+        from modules import elo_replay
+
+        with self.rollback_scope(), tempfile.TemporaryDirectory() as report_dir:
+            games = self.create_ranked_history()
+            self.models.Game.recalculate_all_elo()
+            player = self.models.Game.get_by_id(games[-1].id).lineup[0].player
+            squad = self.models.Squad.select().order_by(self.models.Squad.id.desc()).get()
+            self.models.Player.update(elo_moonrise=player.elo_moonrise + 7).where(self.models.Player.id == player.id).execute()
+            self.models.Squad.update(elo=squad.elo - 3).where(self.models.Squad.id == squad.id).execute()
+            before = rating_snapshot(self.models)
+
+            csv_report = os.path.join(report_dir, 'diff.csv.gz')
+            self.assertEqual(elo_replay.dry_run_all(filename=csv_report), 2)
+            with gzip.open(csv_report, mode='rt') as report_file:
+                rows = list(csv.reader(report_file))
+            self.assertEqual(rows[0], list(elo_replay.REPORT_HEADER))
+            self.assertCountEqual(rows[1:], [
+                ['player', str(player.id), 'elo_moonrise', str(player.elo_moonrise + 7), str(player.elo_moonrise)],
+                ['squad', str(squad.id), 'elo', str(squad.elo - 3), str(squad.elo)],
+            ])
+            self.assertSnapshotsEqual(before, rating_snapshot(self.models))
+
+            # Lineup deltas are reported when an earlier result changes
+            unwound = self.models.Game.get_by_id(games[36].id)
+            unwound.reverse_elo_changes()
+            unwound.completed_ts, unwound.is_confirmed, unwound.is_completed, unwound.winner = None, False, False, None
+            unwound.save()
+            before = rating_snapshot(self.models)
+
+            json_report = os.path.join(report_dir, 'diff.json')
+            changes = elo_replay.dry_run_since(games[35].completed_ts, filename=json_report)
+            with open(json_report) as report_file:
+                report = json.load(report_file)['changes']
+            self.assertEqual(len(report), changes)
+            self.assertTrue(any(change['table'] == 'lineup' for change in report))
+            self.assertSnapshotsEqual(before, rating_snapshot(self.models))
+
+            # The incremental dry run agrees with what recalculate_elo_since() then writes
+            self.models.Game.recalculate_elo_since(timestamp=games[35].completed_ts)
+            after = rating_snapshot(self.models)
+            models_by_table = {'player': 'Player', 'discordmember': 'DiscordMember', 'team': 'Team', 'squad': 'Squad', 'lineup': 'Lineup'}
+            for change in report:
+                row_before = before[models_by_table[change['table']]][change['id']]
+                row_after = after[models_by_table[change['table']]][change['id']]
+                self.assertEqual(row_before[change['field']], change['before'])
+                self.assertEqual(row_after[change['field']], change['after'])
+
+    def test_ledger_matches_lineup_history_and_backfill(self):
+        from modules import elo_replay
+
+        models = self.models
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            models.Game.recalculate_all_elo(in_memory=False)
+            ledger = rating_snapshot(models)['EloLedger']
+            self.assertTrue(ledger)
+            self.assertTrue({key[0] for key in ledger} >= {'player', 'discordmember', 'team', 'squad'})
+
+            # Every snapshot column has a matching ledger row
+            for lineup in models.Lineup.select().join(models.Game).where(models.Game.id.in_([g.id for g in games])):
+                for flavour, _, player_after, _, member_after in models.EloLedger.lineup_fields:
+                    after = getattr(lineup, player_after)
+                    row = ledger.get(('player', lineup.player_id, flavour, lineup.game_id))
+                    self.assertEqual(after, row[2] if row else None)
+                    after = getattr(lineup, member_after)
+                    row = ledger.get(('discordmember', lineup.player.discord_member_id, flavour, lineup.game_id))
+                    self.assertEqual(after, row[2] if row else None)
+
+            moonrise_players = [key[1] for key in ledger if key[0] == 'player' and key[2] == 'elo_moonrise']
+            player = models.Player.get_by_id(max(set(moonrise_players), key=moonrise_players.count))
+            history = list(models.EloLedger.history('player', player.id, ['elo_moonrise']).tuples())
+            self.assertEqual(history[-1][1], player.elo_moonrise)
+            self.assertEqual(models.EloLedger.rating_at('player', player.id, 'elo_moonrise', history[-1][0]), history[-2][1])
+            self.assertIsNone(models.EloLedger.rating_at('player', player.id, 'elo_moonrise', history[0][0]))
+
+            # Rebuilding from the Lineup/GameSide columns gives the same rows
+            elo_replay.backfill_ledger()
+            self.assertEqual(rating_snapshot(models)['EloLedger'], ledger)
+
+            # Reversing a game drops its rows
+            latest = models.Game.get_by_id(games[-1].id)
+            latest.reverse_elo_changes()
+            self.assertFalse(models.EloLedger.select().where(models.EloLedger.game == latest.id).exists())
+
+    def test_recalculation_resumes_from_checkpoints(self):
+        from modules import elo_replay
+
+        models = self.models
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            models.Game.recalculate_all_elo()
+            expected = rating_snapshot(models)
+            self.assertGreater(models.EloCheckpoint.select().count(), 12)
+            self.assertIsNone(models.EloCheckpoint.interrupted_run())
+
+            # Nothing has changed since the last checkpoint
+            self.assertEqual(elo_replay.recalculate_all(resume=True), 0)
+            self.assertSnapshotsEqual(expected, rating_snapshot(models))
+
+            replayed = elo_replay.recalculate_all(resume=True, before=games[40].completed_ts)
+            self.assertTrue(0 < replayed < len(games) - 30)
+            self.assertSnapshotsEqual(expected, rating_snapshot(models))
+
+            # An interrupted run keeps the months it finished
+            models.Player.update(elo_moonrise=1).execute()
+            replay_game, calls = elo_replay.replay_game, []
+
+            def interrupted_replay_game(*args):
+                calls.append(args[0].id)
+                if len(calls) > 30:
+                    raise RuntimeError('interrupted')
+                return replay_game(*args)
+
+            with mock.patch.object(elo_replay, 'replay_game', interrupted_replay_game):
+                with self.assertRaises(RuntimeError):
+                    elo_replay.recalculate_all()
+            # The months it finished are committed without their ratings, which the bot refuses to start with
+            interrupted = models.EloCheckpoint.interrupted_run()
+            self.assertIsNotNone(interrupted)
+            self.assertEqual(interrupted.id, models.EloCheckpoint.select().order_by(models.EloCheckpoint.completed_ts.desc()).first().id)
+            replayed = elo_replay.recalculate_all(resume=True)
+            self.assertIsNone(models.EloCheckpoint.interrupted_run())
+            self.assertTrue(0 < replayed < len(games) - 25)
+            self.assertSnapshotsEqual(expected, rating_snapshot(models))
+
+            # Changing an earlier result drops the checkpoints taken after it
+            unwound = models.Game.get_by_id(games[40].id)
+            unwound.reverse_elo_changes()
+            self.assertTrue(models.EloCheckpoint.select().where(models.EloCheckpoint.completed_ts < unwound.completed_ts).exists())
+            self.assertFalse(models.EloCheckpoint.select().where(models.EloCheckpoint.completed_ts >= unwound.completed_ts).exists())
+
+    def test_parallel_recalculation_matches_sequential(self):
+        models = self.models
+
+        def checkpoint_states():
+            return {
+                checkpoint.game_id: {table: sorted(map(str, rows)) for table, rows in checkpoint.state.items()}
+                for checkpoint in models.EloCheckpoint.select()
+            }
+
+        with self.rollback_scope():
+            self.create_ranked_history()
+            expected = self.assertReplayMatchesLegacy(lambda: models.Game.recalculate_all_elo(processes=3))
+            parallel_checkpoints = checkpoint_states()
+
+            models.Game.recalculate_all_elo(processes=1)
+            self.assertSnapshotsEqual(expected, rating_snapshot(models))
+            self.assertEqual(parallel_checkpoints, checkpoint_states())
+
+            # Workers that would be spawned rather than forked aren't started at all
+            from modules import elo_replay
+            with mock.patch.object(elo_replay.multiprocessing, 'get_start_method', return_value='spawn'), \
+                    mock.patch.object(elo_replay, 'replay_parallel', side_effect=AssertionError('replay_parallel called')):
+                models.Game.recalculate_all_elo(processes=3)
+            self.assertSnapshotsEqual(expected, rating_snapshot(models))
+
+    def test_materialized_leaderboards_follow_leaderboard_queries(self):
+        from modules import leaderboard_cache
+        from scripts import benchmark_elo
+
+        models = self.models
+        guild_id = self.profile.allowed_guild_ids[0]
+        cutoff = datetime.datetime(2022, 1, 1)
+
+        def expected(model, date_cutoff, max_flag, version):
+            query = model.leaderboard(date_cutoff=date_cutoff, guild_id=guild_id, max_flag=max_flag, version=version)
+            return [(rank, p.id, p.elo_field, *p.get_record(version=version)) for rank, p in enumerate(query, start=1)]
+
+        def materialized(model, date_cutoff, max_flag, version):
+            board = models.Leaderboard.get_board(
+                date_cutoff=date_cutoff, guild_id=guild_id if model is models.Player else None, max_flag=max_flag, version=version
+            )
+            rows = [(e.rank, e.entity_id, e.elo, e.wins, e.losses) for e in board.entries()]
+            self.assertEqual(board.size, len(rows))
+            return rows
+
+        def assertBoardsMatch():
+            for model, version, max_flag, date_cutoff in itertools.product(
+                (models.Player, models.DiscordMember), (None, 'ALLTIME', 'AIR'), (False, True), (cutoff, datetime.date.min)
+            ):
+                self.assertEqual(
+                    materialized(model, date_cutoff, max_flag, version), expected(model, date_cutoff, max_flag, version),
+                    (model.__name__, version, max_flag, date_cutoff),
+                )
+
+        with self.rollback_scope():
+            game_ids = benchmark_elo.generate_history(
+                models, [guild_id], players=30, teams=3, games=200,
+                start=datetime.datetime(2020, 6, 1), end=datetime.datetime(2022, 6, 1),
+            )
+            models.Game.recalculate_all_elo()
+            assertBoardsMatch()
+            self.assertFalse(models.Leaderboard.get_board(date_cutoff=cutoff, guild_id=guild_id).is_fallback)
+
+            # Each change below refreshes the existing boards rather than rebuilding them
+            board_ids = set(models.Leaderboard.select(models.Leaderboard.id).tuples())
+            latest = models.Game.get_by_id(game_ids[-1])
+            leaderboard_cache.cache.put(('lb', guild_id), 'page')
+            latest.reverse_elo_changes()
+            self.assertIsNone(leaderboard_cache.cache.get(('lb', guild_id)))
+            latest.is_completed, latest.is_confirmed = False, False
+            latest.save()
+            assertBoardsMatch()
+
+            player = latest.lineup[0].player
+            player.is_banned = True
+            player.save()
+            models.Leaderboard.refresh(players=[player])
+            assertBoardsMatch()
+
+            full_game = models.Game.load_full_game(game_id=latest.id)
+            leaderboard_cache.cache.put(('lb', None), 'page')
+            full_game.declare_winner(winning_side=full_game.winner, confirm=True)
+            self.assertIsNone(leaderboard_cache.cache.get(('lb', None)))
+            assertBoardsMatch()
+
+            leaderboard_cache.cache.put(('lbsquad', guild_id), 'page')
+            models.Game.get_by_id(game_ids[-20]).delete_game()
+            self.assertIsNone(leaderboard_cache.cache.get(('lbsquad', guild_id)))
+            assertBoardsMatch()
+            self.assertEqual(set(models.Leaderboard.select(models.Leaderboard.id).tuples()), board_ids)
+
+            self.assertEqual(player.leaderboard_rank(cutoff), (None, len(expected(models.Player, cutoff, False, None))))
+            self.assertIsNotNone(player.discord_member.leaderboard_rank(cutoff)[0])
+
+            # The cutoff is compared to the second: a player whose last game completed at the cutoff is left off
+            last_completed = models.Lineup.select(models.Lineup.player, models.fn.MAX(models.Game.completed_ts).alias('last')).join(
+                models.Game).where(models.Game.is_completed & models.Game.is_ranked & (models.Lineup.player != player)).group_by(models.Lineup.player)
+            earliest = min(last_completed, key=lambda row: row.last)
+            for date_cutoff in (earliest.last, earliest.last - datetime.timedelta(seconds=1)):
+                rows = materialized(models.Player, date_cutoff, False, None)
+                self.assertEqual(rows, expected(models.Player, date_cutoff, False, None))
+                self.assertEqual(earliest.player_id in {row[1] for row in rows}, date_cutoff < earliest.last)
+
+    def test_leaderboard_standing_matches_leaderboard_order(self):
+        from scripts import benchmark_elo
+
+        models = self.models
+        guild_id = self.profile.allowed_guild_ids[0]
+        cutoff = datetime.datetime(2022, 1, 1)
+
+        with self.rollback_scope():
+            benchmark_elo.generate_history(
+                models, [guild_id], players=24, teams=3, games=120,
+                start=datetime.datetime(2020, 6, 1), end=datetime.datetime(2022, 6, 1),
+            )
+            models.Game.recalculate_all_elo()
+
+            for model, version in itertools.product((models.Player, models.DiscordMember), (None, 'ALLTIME')):
+                listed = [(rank, p.id, p.elo_field) for rank, p in enumerate(
+                    model.leaderboard(date_cutoff=cutoff, guild_id=guild_id, version=version), start=1)]
+                board = models.Leaderboard.get_board(
+                    date_cutoff=cutoff, guild_id=guild_id if model is models.Player else None, version=version
+                )
+                for index, (rank, entity_id, elo) in enumerate(listed):
+                    standing = board.standing(entity_id, neighbours=2)
+                    self.assertEqual((standing.rank, standing.total, standing.elo), (rank, len(listed), elo))
+                    self.assertEqual(standing.above, listed[max(0, index - 2):index])
+                    self.assertEqual(standing.below, listed[index + 1:index + 3])
+                self.assertEqual(board.standing(listed[0][1]).percentile, 100.0)
+                self.assertEqual(board.ranks([row[1] for row in listed[::3]] + [-1]), {row[1]: row[0] for row in listed[::3]})
+                self.assertEqual([(p.rank, p.id) for p in board.top(2)], [row[:2] for row in listed[:2]])
+
+            member = models.DiscordMember.create(discord_id=8_699_999_999_999_999, name='unlisted')
+            unlisted = models.Player.create(discord_member=member, guild_id=guild_id, name='unlisted')
+            standing = unlisted.leaderboard_standing(cutoff)
+            self.assertEqual((standing.rank, standing.above, standing.below), (None, [], []))
+            self.assertEqual(unlisted.leaderboard_rank(cutoff), (None, standing.total))
+
+    def test_bulk_records_match_win_and_loss_queries(self):
+        from scripts import benchmark_elo
+
+        models = self.models
+        with self.rollback_scope():
+            self.create_ranked_history()
+            players = list(models.Player.select())
+            members = list(models.DiscordMember.select())
+            missing_id = max(p.id for p in players) + 1000
+
+            for version in (None, 'AIR', 'ALLTIME'):
+                records = models.Player.get_records([p.id for p in players] + [missing_id], version=version)
+                self.assertEqual(records, {
+                    **{p.id: (p.wins(version=version).count(), p.losses(version=version).count()) for p in players},
+                    missing_id: (0, 0),
+                })
+                records = models.DiscordMember.get_records([m.id for m in members], version=version)
+                self.assertEqual(records, {
+                    m.id: (m.wins(version=version).count(), m.losses(version=version).count()) for m in members
+                })
+
+            memo = {}
+            counter = benchmark_elo.QueryCounter(models.db)
+            with counter.counting() as counts:
+                expected = models.Player.get_records([p.id for p in players], version='ALLTIME', memo=memo)
+                self.assertEqual(sum(counts.values()), 1)
+                self.assertEqual(players[0].get_record(version='ALLTIME', memo=memo), expected[players[0].id])
+                self.assertEqual(sum(counts.values()), 1)
+                players[0].get_record(version='AIR', memo=memo)
+                self.assertEqual(sum(counts.values()), 2)
+
+    def test_advanced_stats_match_game_by_game_walk(self):
+        models = self.models
+
+        def walked_stats(member):
+            # The per-game loop advanced_stats() used before it moved into SQL
+            lineups = models.Lineup.select(models.Lineup, models.Game, models.GameSide).join(models.Game).join_from(
+                models.Lineup, models.GameSide
+            ).join_from(models.Lineup, models.Player).where(
+                (models.Player.discord_member == member) & (models.Game.is_completed == 1) & (models.Game.is_ranked == 1) &
+                (models.Game.is_confirmed == 1) & (models.Game.guild_id.in_(self.settings.servers_included_in_global_lb()))
+            ).order_by(models.Game.completed_ts, models.Game.id, models.Lineup.id)
+            streaks, duel, v2, v3, host, count = {True: 0, False: 0}, [0, 0], 0, 0, 0, 0
+            longest, current = {True: 0, False: 0}, None
+            for lineup in lineups:
+                game, won = lineup.game, lineup.gameside_id == lineup.game.winner_id
+                streaks[won] = streaks[won] + 1 if current == won else 1
+                if streaks[won] > 1:
+                    longest[won] = max(longest[won], streaks[won])
+                current, count = won, count + 1
+                if game.size == [1, 1]:
+                    duel[not won] += 1
+                if won and lineup.gameside.size == 1:
+                    v2 += sorted(game.size) == [1, 2]
+                    v3 += sorted(game.size) == [1, 3]
+                if won and game.lineup.order_by(models.Lineup.id).first().player_id == lineup.player_id:
+                    host += 1
+            return (longest[True], longest[False], v2, v3, duel[0], duel[1], host, count)
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            members = list(models.DiscordMember.select())
+            for member in members:
+                self.assertEqual(member.advanced_stats(), walked_stats(member), member.name)
+
+            global_servers = self.settings.servers_included_in_global_lb()
+            latest = next(g for g in reversed(games) if g.is_confirmed and g.guild_id in global_servers)
+            latest.reverse_elo_changes()
+            latest.is_completed, latest.is_confirmed = False, False
+            latest.save()
+            for member in members:
+                self.assertEqual(member.advanced_stats(cached=True), walked_stats(member), member.name)
+
+            # Confirming the result extends the cached rows rather than rebuilding them
+            full_game = models.Game.load_full_game(game_id=latest.id)
+            row_ids = set(models.DiscordMemberStats.select(models.DiscordMemberStats.id).tuples())
+            full_game.declare_winner(winning_side=full_game.winner, confirm=True)
+            self.assertEqual(set(models.DiscordMemberStats.select(models.DiscordMemberStats.id).tuples()), row_ids)
+            for member in members:
+                cached = models.DiscordMemberStats.get(models.DiscordMemberStats.discord_member == member)
+                expected = member.advanced_stats_row()
+                self.assertEqual({f: getattr(cached, f) for f in expected}, expected, member.name)
+                self.assertEqual(cached.as_tuple(), walked_stats(member), member.name)
+
+            full_game.reverse_elo_changes()
+            players = [l.player.discord_member_id for l in full_game.lineup]
+            self.assertFalse(models.DiscordMemberStats.select().where(models.DiscordMemberStats.discord_member.in_(players)).exists())
+
+    def test_player_stats_rollup_matches_card_queries(self):
+        models = self.models
+
+        def assertRollupMatches(players):
+            rows = models.PlayerStats.for_players([p.id for p in players])
+            for player in players:
+                row = rows[player.id]
+                for version in (None, 'AIR', 'MOONRISE', 'ALLTIME'):
+                    self.assertEqual(row.record(version=version), player.get_record(version=version), (player.name, version))
+                self.assertEqual(row.games_total, player.games_played().count())
+                self.assertEqual(row.recent_game_count(in_days=30), player.games_played(in_days=30).count())
+                self.assertEqual(row.favorite_tribes(limit=10), sorted(player.favorite_tribes(limit=10), key=lambda t: (-t['tribe_count'], -t['tribe'])))
+                expected_tiers = {tier: player.polychamps_tier_record(league_tier=tier) for tier, _ in self.settings.league_tiers}
+                self.assertEqual(row.tier_records(), {
+                    'full_record': player.polychamps_tier_record(league_tier=None),
+                    **{tier: record for tier, record in expected_tiers.items() if any(record)},
+                })
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            tribes = [models.Tribe.create(name=f'Rollup Tribe {i} {uuid.uuid4().hex[:6]}', emoji=f':t{i}:') for i in range(3)]
+            tiers = [tier for tier, _ in self.settings.league_tiers][:2]
+            rng = random.Random(3)
+            for game in games[::3]:
+                models.Game.update(league_tier=rng.choice(tiers)).where(models.Game.id == game.id).execute()
+            for lineup in models.Lineup.select().where(models.Lineup.game.in_([g.id for g in games[::2]])):
+                lineup.tribe = rng.choice(tribes)
+                lineup.save()
+            players = list(models.Player.select().where(models.Player.id.in_(models.Lineup.select(models.Lineup.player))))
+            assertRollupMatches(players)
+
+            # A reversed result drops the rows; confirming it again today counts it on the rebuilt rows
+            latest = models.Game.get_by_id(games[-1].id)
+            latest.reverse_elo_changes()
+            latest.is_completed, latest.is_confirmed, latest.completed_ts = False, False, None
+            latest.date = datetime.date.today()
+            latest.save()
+            lineup_players = [l.player_id for l in latest.lineup]
+            self.assertFalse(models.PlayerStats.select().where(models.PlayerStats.player.in_(lineup_players)).exists())
+            assertRollupMatches(players)
+
+            row_ids = set(models.PlayerStats.select(models.PlayerStats.id).tuples())
+            full_game = models.Game.load_full_game(game_id=latest.id)
+            full_game.declare_winner(winning_side=full_game.winner, confirm=True)
+            self.assertEqual(set(models.PlayerStats.select(models.PlayerStats.id).tuples()), row_ids)
+            assertRollupMatches(players)
+
+            # A tribe edit drops the row of that lineup's player, as the tribe command does, and the rebuilt row counts it
+            lineup = full_game.lineup[0]
+            lineup.tribe = tribes[0] if lineup.tribe != tribes[0] else tribes[1]
+            lineup.save()
+            models.PlayerStats.invalidate([lineup.player_id])
+            self.assertFalse(models.PlayerStats.select().where(models.PlayerStats.player == lineup.player_id).exists())
+            assertRollupMatches(players)
+
+    def test_legacy_recalculation_leaves_rollups_matching_a_rebuild(self):
+        models = self.models
+
+        def rollups(player_ids, members, seasons):
+            player_rows = models.PlayerStats.for_players(player_ids)
+            return (
+                {player_id: {f: v for f, v in row.__data__.items() if f != 'id'} for player_id, row in player_rows.items()},
+                {member.id: models.DiscordMemberStats.for_member(member).as_tuple() for member in members},
+                models.SeasonStandings.for_seasons(seasons),
+            )
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            tiers = [tier for tier, _ in self.settings.league_tiers][:2]
+            for index, game in enumerate(games[::3]):
+                models.Game.update(league_season=3, league_tier=tiers[index % 2]).where(models.Game.id == game.id).execute()
+            models.Game.recalculate_all_elo()
+            player_ids = list({lineup.player_id for game in games for lineup in game.lineup})
+            members = list(models.DiscordMember.select().join(models.Player).where(models.Player.id.in_(player_ids)).distinct())
+
+            # Stored rows going into the recalculation must not have every result counted on them a second time
+            rollups(player_ids, members, [3])
+            models.Game.recalculate_all_elo(in_memory=False)
+            recalculated = rollups(player_ids, members, [3])
+
+            models.PlayerStats.invalidate()
+            models.DiscordMemberStats.invalidate()
+            models.SeasonStandings.invalidate()
+            self.assertEqual(recalculated, rollups(player_ids, members, [3]))
+
+    def test_team_leaderboard_matches_per_team_queries(self):
+        import pandas as pd
+        import numpy as np
+        import scipy.signal as signal
+        from modules import elo_replay, team_leaderboard
+        from scripts import benchmark_elo
+        models = self.models
+
+        with self.rollback_scope():
+            self.create_ranked_history()
+            elo_replay.recalculate_all()
+            guild_id = list(self.profile.allowed_guild_ids)[0]
+            models.Team.update(league_tier=1).where(models.Team.guild_id == guild_id).execute()
+
+            counter = benchmark_elo.QueryCounter(models.db)
+            with counter.counting() as counts:
+                standings, team_count = team_leaderboard.build(guild_id=guild_id)
+                self.assertEqual(sum(counts.values()), 3)
+
+            teams = list(models.Team.select().where(
+                (models.Team.guild_id == guild_id) & (models.Team.is_hidden == 0) & (models.Team.is_archived == 0)
+            ).order_by(-models.Team.elo))
+            self.assertEqual(team_count, len(teams))
+            self.assertEqual([s.team.id for s in standings], [t.id for t in teams])
+            self.assertTrue(any(s.history for s in standings))
+
+            for standing in standings:
+                team = standing.team
+                self.assertEqual((standing.wins, standing.losses), team.get_record(alltime=False))
+                self.assertEqual(standing.elo, team.elo)
+
+                history_query = models.EloLedger.history('team', team.id, ['elo'])
+                if not history_query.count():
+                    self.assertIsNone(standing.history)
+                    continue
+                history = pd.DataFrame(history_query.dicts())
+                resampled = history.set_index('completed_ts').resample('D').mean().interpolate().reset_index()
+                filter_length, poly_order = team_leaderboard.filter_shape(len(resampled.index))
+                expected = signal.savgol_filter(resampled['elo'].values, filter_length, poly_order)
+
+                self.assertEqual(list(standing.history.elo), list(history['elo']))
+                self.assertEqual(list(standing.history.days), list(resampled['completed_ts']))
+                self.assertTrue(np.allclose(standing.history.smoothed, expected))
+
+    def test_squad_signature_lookups_match_membership_queries(self):
+        from peewee import SQL, fn
+        models = self.models
+        Squad, SquadMember, GameSide, Game = models.Squad, models.SquadMember, models.GameSide, models.Game
+
+        def members_having(player_ids, exact):
+            # The GROUP BY/HAVING match over SquadMember that the signature replaces
+            having = fn.SUM(SquadMember.player.in_(player_ids).cast('integer')) == len(player_ids)
+            if exact:
+                having &= fn.SUM(SquadMember.player.not_in(player_ids).cast('integer')) == 0
+            return Squad.select(Squad.id).join(SquadMember).group_by(Squad.id).having(having)
+
+        with self.rollback_scope():
+            self.create_ranked_history()
+            guild_id = list(self.profile.allowed_guild_ids)[0]
+            squads = list(Squad.select().where(Squad.guild_id == guild_id))
+            self.assertTrue(squads)
+
+            for squad in squads:
+                player_ids = [member.player_id for member in squad.squadmembers]
+                self.assertEqual(squad.member_ids, sorted(player_ids))
+                self.assertEqual(Squad.upsert(player_list=list(reversed(player_ids)), guild_id=guild_id).id, squad.id)
+                self.assertEqual([s.id for s in Squad.get_matching_squad(player_ids)], [r.id for r in members_having(player_ids, exact=True)])
+
+                for partial in (player_ids[:1], player_ids[:2]):
+                    expected = GameSide.select(GameSide.squad, fn.COUNT('*').alias('games_played')).where(
+                        (GameSide.squad.in_(SquadMember.select(SquadMember.squad).group_by(SquadMember.squad).having(fn.COUNT('*') >= 2))) &
+                        (GameSide.squad.in_(Squad.subq_squads_with_completed_games(min_games=Squad.min_games_for_leaderboard(guild_id)))) &
+                        (GameSide.squad.in_(members_having(partial, exact=False)))
+                    ).group_by(GameSide.squad).order_by(-SQL('games_played'))
+                    self.assertCountEqual(list(Squad.get_all_matching_squads(partial, guild_id=guild_id).tuples()), list(expected.tuples()))
+
+            with self.assertRaises(models.IntegrityError), models.db.atomic():
+                Squad.create(guild_id=guild_id, member_ids=squads[0].member_ids)
+            new_players = [models.Player.create(discord_member=models.DiscordMember.create(
+                discord_id=8_700_000_000_000_000 + uuid.uuid4().int % 1_000_000 + i, name=f'Squad Signature {i}'), guild_id=guild_id, name=f'Squad Signature {i}')
+                for i in range(2)]
+            created = Squad.upsert(player_list=new_players, guild_id=guild_id)
+            self.assertEqual(created.member_ids, sorted(p.id for p in new_players))
+            self.assertEqual(sorted(m.player_id for m in created.squadmembers), created.member_ids)
+            self.assertEqual(Squad.upsert(player_list=new_players, guild_id=guild_id).id, created.id)
+
+            for date_cutoff in (datetime.date.min, datetime.date(2020, 6, 1)):
+                min_games = Squad.min_games_for_leaderboard(guild_id)
+                expected = Squad.select().join(GameSide).join(Game).where(
+                    (Squad.id.in_(Squad.subq_squads_with_completed_games(min_games=min_games))) &
+                    (Squad.guild_id == guild_id) & (Game.completed_ts > date_cutoff)
+                ).order_by(-Squad.elo).group_by(Squad)
+                actual = Squad.leaderboard(date_cutoff=date_cutoff, guild_id=guild_id)
+                self.assertEqual(sorted(s.id for s in actual), sorted(s.id for s in expected))
+                self.assertEqual(actual.count(), expected.count())
+
+    def test_season_standings_match_tier_record_queries(self):
+        models = self.models
+        SeasonStandings = models.SeasonStandings
+
+        def assertStandingsMatch(season):
+            standings = SeasonStandings.standings(season=season)
+            tiers = [tier for tier in models.Game.polychamps_tiers_by_season(season=season)]
+            self.assertEqual([tier for tier, _ in standings], tiers)
+            for tier, records in standings:
+                expected = models.Team.polychamps_tier_records(league_tier=tier, league_season=season)
+                self.assertCountEqual([tuple(r) for r in records], [
+                    (t.id, t.name, t.emoji, t.regular_season_wins, t.regular_season_losses, t.regular_season_incomplete,
+                     t.post_season_wins, t.post_season_losses, t.post_season_incomplete) for t in expected
+                ])
+                order = [(r.post_season_wins, r.regular_season_wins, r.regular_season_incomplete) for r in records]
+                self.assertEqual(order, sorted(order, reverse=True))
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            # Earlier seasons, like any other league games, stay out of the results
+            SeasonStandings.invalidate()
+            rng = random.Random(5)
+            for index, game in enumerate(games):
+                if min(game.size) < 2:
+                    continue
+                models.Game.update(
+                    guild_id=self.settings.server_ids['polychampions'], league_season=900 + index % 3,
+                    league_tier=rng.choice([1, 2]), league_playoff=rng.random() < 0.3,
+                ).where(models.Game.id == game.id).execute()
+            models.Game.update(is_pending=True).where(models.Game.id == games[-1].id).execute()
+            seasons = sorted({s for s, in models.Game.select(models.Game.league_season).where(
+                models.Game.id.in_([g.id for g in games]) & models.Game.league_season.is_null(False)).tuples()})
+            self.assertEqual(len(seasons), 3)
+
+            for season in seasons:
+                assertStandingsMatch(season)
+            assertStandingsMatch(None)
+            stored = set(SeasonStandings.select(SeasonStandings.id).tuples())
+
+            # Confirming a league game moves it from incomplete on the stored row
+            unconfirmed = models.Game.select().where(
+                models.Game.id.in_([g.id for g in games]) & (models.Game.is_confirmed == False) &
+                models.Game.league_season.is_null(False) & (models.Game.is_pending == False)
+            ).first()
+            self.assertIsNotNone(unconfirmed)
+            full_game = models.Game.load_full_game(game_id=unconfirmed.id)
+            full_game.declare_winner(winning_side=full_game.winner, confirm=True)
+            self.assertEqual(set(SeasonStandings.select(SeasonStandings.id).tuples()), stored)
+            row = SeasonStandings.get(SeasonStandings.league_season == unconfirmed.league_season)
+            self.assertEqual(row.records, SeasonStandings.build([unconfirmed.league_season])[unconfirmed.league_season])
+            assertStandingsMatch(unconfirmed.league_season)
+
+            team = full_game.winner.team
+            expected_record = [0] * 6
+            for tier in models.Game.polychamps_tiers_by_season(season=unconfirmed.league_season):
+                for t in team.polychamps_tier_records(league_tier=tier, league_season=unconfirmed.league_season):
+                    expected_record = [a + b for a, b in zip(expected_record, (
+                        t.regular_season_wins, t.regular_season_losses, t.regular_season_incomplete,
+                        t.post_season_wins, t.post_season_losses, t.post_season_incomplete))]
+            self.assertEqual(team.get_season_record(season=unconfirmed.league_season), tuple(expected_record))
+
+            # Unconfirming it again drops the season so it is rebuilt
+            full_game.reverse_elo_changes()
+            self.assertFalse(SeasonStandings.select().where(SeasonStandings.league_season == unconfirmed.league_season).exists())
+            self.assertTrue(SeasonStandings.select().where(SeasonStandings.league_season != unconfirmed.league_season).exists())
+
+    def test_leaderboard_as_of_matches_ledger_history(self):
+        from modules import elo_replay
+        from scripts import benchmark_elo
+        models = self.models
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            elo_replay.recalculate_all()
+            guild_id = list(self.profile.allowed_guild_ids)[0]
+
+            for timestamp in (games[25].completed_ts, games[-1].completed_ts + datetime.timedelta(seconds=1)):
+                for model, board_guild in ((models.Player, guild_id), (models.DiscordMember, None)):
+                    entity_type = model.__name__.lower()
+                    version = 'MOONRISE' if timestamp.date() >= self.settings.moonrise_reset_date else 'AIR'
+                    flavour = models.Leaderboard.elo_field(model, version, False).name
+                    candidates = model.select().where(model.guild_id == guild_id) if model is models.Player else model.select()
+
+                    for max_flag in (False, True):
+                        expected = []
+                        for entity in candidates:
+                            history = [(ts, elo) for ts, elo in models.EloLedger.history(entity_type, entity.id, [flavour]).tuples() if ts < timestamp]
+                            if not history or entity.is_banned:
+                                continue
+                            elo = max(1000, max(elo for _, elo in history)) if max_flag else history[-1][1]
+                            expected.append((entity.id, elo))
+                        expected.sort(key=lambda row: (-row[1], row[0]))
+
+                        with benchmark_elo.QueryCounter(models.db).counting() as counts:
+                            rows = list(models.Leaderboard.as_of(timestamp, guild_id=board_guild, max_flag=max_flag, active_days=None))
+                            self.assertEqual(sum(counts.values()), 1)
+                        self.assertTrue(expected)
+                        self.assertEqual([(row.id, row.board_elo) for row in rows], expected)
+                        self.assertEqual([row.rank for row in rows], list(range(1, len(rows) + 1)))
+                        self.assertTrue(all(row.total == len(rows) for row in rows))
+
+                        recent = models.Leaderboard.as_of(timestamp, guild_id=board_guild, max_flag=max_flag, active_days=60)
+                        self.assertLessEqual(len(list(recent)), len(rows))
+
+                    if timestamp > games[-1].completed_ts:
+                        # After the last game the ratings are the current ones
+                        current = models.Leaderboard.elo_field(model, version, False)
+                        for row in models.Leaderboard.as_of(timestamp, guild_id=board_guild, active_days=None):
+                            self.assertEqual(row.board_elo, getattr(row, current.name))
+
+    def test_game_view_renders_six_player_games_in_fixed_queries(self):
+        from modules import elo_replay
+        from scripts import benchmark_elo
+        models = self.models
+
+        def side_snapshot(side):
+            roster = [(player.id, elo_str, emoji) for player, elo_str, emoji in side.roster()]
+            return side.name(), side.elo_strings(), roster, [lineup.player.mention() for lineup in side.ordered_player_list()]
+
+        with self.rollback_scope():
+            games = self.create_ranked_history()
+            elo_replay.recalculate_all()
+
+            for shape in ([3, 3], [2, 2, 2]):
+                game = next(game for game in games if game.size == shape and models.Game.get_by_id(game.id).is_confirmed)
+                expected = [
+                    side_snapshot(side)
+                    for side in models.GameSide.select().where(models.GameSide.game == game.id).order_by(models.GameSide.position)
+                ]
+
+                with benchmark_elo.QueryCounter(models.db).counting() as counts:
+                    view = models.Game.load_view(game.id)
+                self.assertEqual(sum(counts.values()), 3)
+                with benchmark_elo.QueryCounter(models.db).counting() as counts:
+                    self.assertEqual([side_snapshot(side) for side in view.ordered_side_list()], expected)
+                    self.assertEqual(view.winner.id, game.winner_id)
+                    self.assertEqual(view.capacity(), (6, 6))
+                    self.assertEqual(view.creating_player().id, expected[0][2][0][0])
+                self.assertEqual(sum(counts.values()), 0)
+
+                # two queries for the sides and lineups of the view, and three more for the series record of a two-sided game
+                plain = models.Game.get_by_id(game.id)
+                plain.name = 'Unsaved Rename'
+                with benchmark_elo.QueryCounter(models.db).counting() as counts:
+                    embed, content = plain.embed(prefix='$')
+                self.assertEqual(sum(counts.values()), 5 if len(shape) == 2 else 2)
+                self.assertEqual(sum(len(side[2]) for side in expected), 6)
+                for name, *_ in expected:
+                    self.assertIn(name, embed.title)
+
+                # sides come back as a list however the game was loaded
+                self.assertEqual([side.id for side in plain.ordered_side_list()], [side.id for side in view.ordered_side_list()])
+                self.assertIsInstance(plain.ordered_side_list(), list)
+
+                # the embed shows the game as it is in memory, and leaves it as it was
+                self.assertIn('Unsaved Rename', embed.title)
+                self.assertEqual(plain._dirty, {'name'})
+                self.assertNotIn('_ordered_sides', plain.__dict__)
+                if len(shape) == 2:
+                    sides = tuple(models.GameSide.select().where(models.GameSide.game == game.id))
+                    s1_wins = s2_wins = 0
+                    for series_game in models.Game.by_opponents([[l.player for l in side.lineup] for side in sides]):
+                        if series_game.is_ranked and series_game.is_confirmed:
+                            if series_game.winner.has_same_players_as(sides[0]):
+                                s1_wins += 1
+                            else:
+                                s2_wins += 1
+                    (leader, leader_wins), (_, trailer_wins) = view.series_record()
+                    self.assertEqual(sorted([leader_wins, trailer_wins]), sorted([s1_wins, s2_wins]))
+                    self.assertEqual(leader.id, sides[1].id if s2_wins > s1_wins else sides[0].id)
+
+    def test_creating_player_of_a_game_without_sides(self):
+        with self.rollback_scope():
+            game = self.models.Game.create(guild_id=self.profile.allowed_guild_ids[0], name='No Sides', size=[1, 1])
+            self.assertIsNone(game.creating_player())
+            self.assertIsNone(self.models.Game.load_view(game.id).creating_player())
+            self.assertFalse(game.is_created_by(discord_id=self.base_discord_id))
+
+    def test_benchmark_reports_each_step_and_rolls_back(self):
+        from scripts import benchmark_elo
+
+        games_before = self.models.Game.select().count()
+        with self.rollback_scope():
+            report = benchmark_elo.run(
+                self.models, list(self.profile.allowed_guild_ids), players=24, teams=3, games=80,
+                depths=(5, 40, 1000), declares=4,
+            )
+        self.assertEqual(self.models.Game.select().count(), games_before)
+
+        self.assertEqual(report['setup']['synthetic_games'], 80)
+        names = [row['name'] for row in report['results']]
+        self.assertEqual(names[:3], ['recalculate_all_elo', 'recalculate_elo_since depth 5', 'recalculate_elo_since depth 40'])
+        self.assertEqual(sum(name.startswith('declare_winner ') for name in names), 4)
+        for row in report['results']:
+            self.assertGreater(row['queries'], 0, row['name'])
+            self.assertEqual(sum(row['queries_by_type'].values()), row['queries'])
+        self.assertEqual(sum(s['count'] for s in report['declare_winner'].values()), 4)
+        json.dumps(report, default=str)
+        self.assertIn('recalculate_all_elo', '\n'.join(benchmark_elo.compare(report, report)))
+
+    def test_elo_math_matches_model_win_chances(self):
+        from modules import elo_math
+
+        def fake_side(lineup_size):
+            side = SimpleNamespace(lineup=[None] * lineup_size)
+            side.adjusted_elo = functools.partial(self.models.GameSide.adjusted_elo, side)
+            return side
+
+        rng = random.Random(3)
+        for _ in range(2000):
+            size = rng.choice(GAME_SHAPES)
+            lineup_sizes = [max(1, s - (rng.random() < 0.1)) for s in size]
+            elos = [rng.randint(600, 1800) for _ in size]
+            calc_version = rng.choice((1, 2))
+            self.assertEqual(
+                self.models.Game.get_side_win_chances(max(size), [fake_side(n) for n in lineup_sizes], elos, calc_version),
+                elo_math.side_win_chances(max(size), lineup_sizes, elos, calc_version),
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import datetime
+import unittest
+
+from modules import elo_math
+
+
+V2_DATE = datetime.date(2020, 8, 2)
+
+
+def game_win_chances(game_date, declared_size, lineup_sizes, side_elos):
+    # The same steps declare_winner() takes before calling get_side_win_chances()
+    side_elos = list(side_elos)
+    if game_date >= V2_DATE:
+        calc_version = 2
+        if declared_size[0] == 1:
+            side_elos[0] = side_elos[0] + 50
+    else:
+        calc_version = 1
+    return elo_math.side_win_chances(max(declared_size), lineup_sizes, side_elos, calc_version)
+
+
+class EloMathTests(unittest.TestCase):
+    def test_host_bonus_only_applies_to_solo_hosts_from_v2_date(self):
+        self.assertEqual(game_win_chances(V2_DATE - datetime.timedelta(days=1), [1, 1], [1, 1], [1000, 1000]), [0.5, 0.5])
+        chances = game_win_chances(V2_DATE, [1, 1], [1, 1], [1000, 1000])
+        self.assertGreater(chances[0], chances[1])
+        self.assertEqual(game_win_chances(V2_DATE, [2, 2], [2, 2], [1000, 1000]), [0.5, 0.5])
+
+    def test_undersized_side_handicap_depends_on_calc_version(self):
+        v1 = elo_math.side_win_chances(2, [1, 2], [1400, 1100], 1)
+        v2 = elo_math.side_win_chances(2, [1, 2], [1400, 1100], 2)
+        self.assertLess(v1[0], v2[0])
+        self.assertEqual(elo_math.side_win_chances(2, [2, 2], [1400, 1100], 1), elo_math.side_win_chances(2, [2, 2], [1400, 1100], 2))
+
+    def test_max_delta_thresholds(self):
+        self.assertEqual([elo_math.player_max_delta(n) for n in (0, 5, 6, 10, 11)], [75, 75, 50, 50, 32])
+        self.assertEqual([elo_math.squad_max_delta(n) for n in (0, 5, 6)], [50, 50, 32])
+
+    def test_low_elo_players_get_a_boost(self):
+        # Up to 60% more on a win and, since the boost is added to the signed change, up to 60% less on a loss
+        self.assertEqual(elo_math.player_elo_delta(1300, 20, 0.5, True), 16)
+        self.assertEqual(elo_math.player_elo_delta(900, 20, 0.5, True), 25)
+        self.assertEqual(elo_math.player_elo_delta(900, 20, 0.5, False), -7)
+
+    def test_rounding_matches_round_half_even(self):
+        self.assertEqual(elo_math.elo_delta(32, 0.5, True), 16)
+        self.assertEqual(elo_math.elo_delta(25, 0.5, True), 12)
+        self.assertEqual(elo_math.average_elo([1000, 1001]), 1000)
+        self.assertEqual(elo_math.average_elo([1001, 1002]), 1002)
+
+
+if __name__ == '__main__':
+    unittest.main()
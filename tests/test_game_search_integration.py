@@ -0,0 +1,248 @@
+"""Development-database tests for Game.search(), its paged game lists and GameLog.search()."""
+
+import functools
+import re
+import unittest
+
+from tests.test_database_integration import (
+    INTEGRATION_FLAG,
+    RUN_DATABASE_INTEGRATION,
+)
+from scripts import benchmark_elo
+from tests.test_elo_integration import RankedHistoryTestCase
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def title_matches(game, terms):
+    # Every term somewhere in the name, or every term somewhere in the notes, ignoring case
+    return any(all(term.lower() in text.lower() for term in terms) for text in (game.name, game.notes or ''))
+
+
+def seed_name(index):
+    if index % 3 == 0:
+        return f'Spring Cup Round {index}'
+    if index % 7 == 1:
+        return f'PolyCup Round {index}'
+    if index % 7 == 2:
+        return f'Hiccup Round {index}'
+    return f'Weekly Round {index}'
+
+
+@unittest.skipUnless(
+    RUN_DATABASE_INTEGRATION,
+    f'set {INTEGRATION_FLAG}=1 to run development-database integration tests',
+)
+class GameSearchIntegrationTests(RankedHistoryTestCase):
+
+    def seed(self):
+        games = self.create_ranked_history()
+        Game = self.models.Game
+        for index, game in enumerate(games):
+            Game.update(
+                name=seed_name(index),
+                notes='cup final' if index % 5 == 0 else None,
+                is_mobile=index % 4 != 0,
+                league_season=7 if index % 6 == 0 else None,
+            ).where(Game.id == game.id).execute()
+        self.models.db.execute_sql('ANALYZE game, gameside, lineup')
+        return [Game.get_by_id(game.id) for game in games]
+
+    def explain(self, query):
+        sql, params = query.sql()
+        (plan,), = self.models.db.execute_sql(f'EXPLAIN (FORMAT JSON) {sql}', params).fetchone()
+        return list(plan_nodes(plan['Plan']))
+
+    def test_search_matches_game_by_game_filtering(self):
+        models = self.models
+        Game = models.Game
+
+        with self.rollback_scope():
+            games = self.seed()
+            seeded = {game.id for game in games}
+            guild_id = games[0].guild_id
+            sides = {game.id: list(game.gamesides) for game in games}
+            players = {game.id: {lineup.player_id: lineup.gameside_id for lineup in game.lineup} for game in games}
+            player = next(iter(players[games[2].id]))
+            team = next(side.team_id for game in games for side in sides[game.id] if side.size > 1)
+
+            def team_sides(game):
+                return [side for side in sides[game.id] if side.team_id == team and side.size > 1]
+
+            def won(game, player_id):
+                return game.is_confirmed and players[game.id][player_id] == game.winner_id
+
+            cases = [
+                ({'guild_id': guild_id, 'status_filter': 2}, lambda g: g.guild_id == guild_id and not g.is_confirmed),
+                ({'status_filter': 1, 'platform_filter': 0}, lambda g: g.is_completed and not g.is_mobile),
+                ({'status_filter': 5}, lambda g: g.is_completed and not g.is_confirmed),
+                ({'player_filter': [player]}, lambda g: player in players[g.id]),
+                ({'player_filter': [player], 'status_filter': 3}, lambda g: player in players[g.id] and won(g, player)),
+                ({'player_filter': [player], 'status_filter': 4},
+                 lambda g: player in players[g.id] and g.is_confirmed and not won(g, player)),
+                ({'team_filter': [team], 'status_filter': 3},
+                 lambda g: g.is_confirmed and len(team_sides(g)) == 1 and team_sides(g)[0].id == g.winner_id),
+                ({'size_filter': [2, 2], 'season_filter': 7}, lambda g: g.size == [2, 2] and g.league_season == 7),
+                ({'season_filter': 0}, lambda g: bool(g.league_season)),
+                ({'title_filter': ['!!']}, lambda g: True),
+            ]
+            # Title words match anywhere in the name or notes: "cup" finds PolyCup and Hiccup, "ring" finds Spring
+            for terms in (['cup'], ['cup', 'SPRING'], ['final', 'cup'], ['spr', 'ROUND'], ['ring'], ['CUP', 'poly'], ['hic'], ['up', 'round!']):
+                cases.append(({'title_filter': terms}, functools.partial(title_matches, terms=Game.title_terms(terms))))
+            for kwargs, expected in cases:
+                with self.subTest(**{key: str(value) for key, value in kwargs.items()}):
+                    found = [g.id for g in Game.search(**kwargs) if g.id in seeded]
+                    self.assertCountEqual(found, [g.id for g in games if expected(g)])
+                    self.assertTrue(found or kwargs.get('status_filter') == 5)
+
+            found = {g.id for g in Game.search(title_filter=['cup'])}
+            self.assertTrue(any(g.name.lower().startswith('polycup') and g.id in found for g in games))
+            self.assertTrue(any(g.name.lower().startswith('hiccup') and g.id in found for g in games))
+
+    def test_title_search_ranks_word_matches_first(self):
+        Game = self.models.Game
+
+        def starts_word(text):
+            return bool(re.search(r'\bcup', text or '', re.IGNORECASE))
+
+        with self.rollback_scope():
+            games = self.seed()
+            seeded = {game.id for game in games}
+            found = [g.id for g in Game.search(title_filter=['cup']) if g.id in seeded]
+
+            # Name words, then notes words, then games that only have "cup" inside a word, such as PolyCup
+            in_name = [g.id for g in games if starts_word(g.name)]
+            in_notes = [g.id for g in games if starts_word(g.notes) and not starts_word(g.name)]
+            inside_words = [g.id for g in games if title_matches(g, ['cup']) and not starts_word(g.name) and not starts_word(g.notes)]
+            self.assertTrue(in_name and in_notes and inside_words)
+            self.assertCountEqual(found, in_name + in_notes + inside_words)
+            self.assertCountEqual(found[:len(in_name)], in_name)
+            self.assertCountEqual(found[len(in_name):len(in_name) + len(in_notes)], in_notes)
+
+            # Without any whole-word match, results keep the usual order
+            substring_only = [g.id for g in Game.search(title_filter=['icc']) if g.id in seeded]
+            self.assertEqual(substring_only, [g.id for g in Game.search() if g.id in substring_only])
+
+    def test_search_plans_only_the_requested_joins(self):
+        models = self.models
+        Game = models.Game
+
+        with self.rollback_scope():
+            games = self.seed()
+            guild_id = games[0].guild_id
+            player = games[0].lineup[0].player_id
+            team = games[0].gamesides[0].team_id
+            models.db.execute_sql('SET LOCAL enable_seqscan = off')
+
+            def relations(nodes):
+                return sorted(node['Relation Name'] for node in nodes if 'Relation Name' in node)
+
+            def indexes(nodes):
+                return {node['Index Name'] for node in nodes if 'Index Name' in node}
+
+            # Unused filters add nothing to the plan, so server listings read game once through the search index
+            nodes = self.explain(Game.search(guild_id=guild_id, status_filter=2))
+            self.assertEqual(relations(nodes), ['game'])
+            self.assertIn('game_guild_id_is_completed_is_confirmed_completed_ts', indexes(nodes))
+            self.assertFalse(any(node['Node Type'] == 'SubPlan' or node.get('Subplan Name') for node in nodes))
+
+            nodes = self.explain(Game.search())
+            self.assertEqual(relations(nodes), ['game'])
+
+            nodes = self.explain(Game.search(player_filter=[player]))
+            self.assertEqual(relations(nodes), ['game', 'lineup'])
+            self.assertTrue(any(name.startswith('lineup_player_id') for name in indexes(nodes)))
+
+            nodes = self.explain(Game.search(team_filter=[team], status_filter=3))
+            self.assertEqual(relations(nodes), ['game', 'gameside', 'gameside'])
+            self.assertTrue(any(name.startswith('gameside_team_id') for name in indexes(nodes)))
+
+            nodes = self.explain(Game.search(title_filter=['spring', 'cup']))
+            self.assertEqual(relations(nodes), ['game'])
+            trigram_indexes = {name for name, in models.db.execute_sql(
+                "SELECT indexname FROM pg_indexes WHERE indexname IN ('game_name_trgm', 'game_notes_trgm')").fetchall()}
+            if trigram_indexes:
+                # migrator.py only adds these where pg_trgm is available
+                self.assertEqual(indexes(nodes), trigram_indexes)
+
+            nodes = self.explain(Game.search(player_filter=[player], status_filter=4, guild_id=guild_id))
+            self.assertEqual(relations(nodes), ['game', 'lineup', 'lineup'])
+
+    def test_game_pages_match_the_full_game_list(self):
+        models = self.models
+        Game = models.Game
+        from modules import game_pages, utilities
+
+        with self.rollback_scope():
+            games = self.seed()
+            guild_id = games[0].guild_id
+            lineups = [lineup for game in games for lineup in game.lineup]
+            player = max((lineup.player for lineup in lineups), key=lambda p: sum(lineup.player_id == p.id for lineup in lineups))
+
+            searches = [
+                (Game.search(guild_id=guild_id), Game.search_ordering(), True, None),
+                (Game.search(guild_id=guild_id, status_filter=1), Game.search_ordering(), False, None),
+                (Game.search(player_filter=[player]), Game.search_ordering(), True, player.discord_member.discord_id),
+                (Game.search(title_filter=['cup']), Game.search_ordering(['cup']), True, None),
+            ]
+            for query, keys, descending, player_discord_id in searches:
+                expected = utilities.summarize_game_list(query, player_discord_id=player_discord_id)
+                if not descending:
+                    expected.reverse()
+
+                pages = game_pages.GamePages(query, keys, descending=descending, player_discord_id=player_discord_id)
+                self.assertEqual(len(pages), len(expected))
+                self.assertGreaterEqual(len(pages), 12)
+
+                # first, next, last and previous pages as utilities.paginate() walks them, at a fixed query count each
+                last_start = len(pages) - 3
+                for start in (0, 3, last_start, last_start - 3):
+                    with benchmark_elo.QueryCounter(models.db).counting() as counts:
+                        pages.fetch(start, start + 3)
+                    self.assertEqual(sum(counts.values()), 3)
+                    self.assertEqual([pages[index] for index in range(start, start + 3)], expected[start:start + 3])
+
+                self.assertEqual(list(pages), expected)
+
+    def test_game_logs_are_found_by_game_id(self):
+        models = self.models
+        GameLog = models.GameLog
+
+        with self.rollback_scope():
+            games = self.seed()
+            first, second = games[0], games[1]
+            GameLog.write(game_id=first, guild_id=first.guild_id, message='Seed player joined the game.')
+            GameLog.write(game_id=second.id, guild_id=second.guild_id, message='Seed player joined the game.')
+            latest = GameLog.write(game_id=first, guild_id=first.guild_id, message='Another seed player joined the game.')
+            GameLog.write(game_id=first, guild_id=first.guild_id, message='Seed player left the game.')
+            unrelated = GameLog.write(guild_id=first.guild_id, message='Seed setting changed.')
+
+            self.assertIsNone(unrelated.game_id)
+            self.assertEqual(latest.game_id, first.id)
+            self.assertTrue(latest.message.startswith(f'__{first.id}__ - '))
+
+            found = GameLog.search(keywords='joined', game_id=first.id, guild_id=first.guild_id, limit=1).first()
+            self.assertEqual(found.id, latest.id)
+            self.assertEqual(len(GameLog.search(game_id=first.id)), 3)
+            self.assertEqual(len(GameLog.search(keywords='seed joined', game_id=first.id)), 2)
+            self.assertEqual(len(GameLog.search(keywords='seed', negative_keyword='joined', game_id=first.id)), 1)
+
+            exported = (
+                models.Game.select(models.Game, models.fn.ARRAY_AGG(GameLog.message).alias('gamelogs'))
+                .join(GameLog, models.JOIN.LEFT_OUTER, on=(GameLog.game_id == models.Game.id))
+                .where(models.Game.id.in_([first.id, second.id]))
+                .group_by(models.Game.id)
+            )
+            self.assertEqual({game.id: len(game.gamelogs) for game in exported}, {first.id: 3, second.id: 1})
+
+            models.db.execute_sql('SET LOCAL enable_seqscan = off')
+            nodes = self.explain(GameLog.search(keywords='joined', game_id=first.id, guild_id=first.guild_id, limit=1))
+            self.assertIn('gamelog_game_id_message_ts', {node['Index Name'] for node in nodes if 'Index Name' in node})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from modules.leaderboard_cache import LeaderboardCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LeaderboardCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LeaderboardCache(max_entries=3, ttl=60, clock=self.clock)
+
+    def test_builds_once_until_expiry(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return len(builds)
+
+        self.assertEqual(self.cache.get_or_build(('lb', 1), build), 1)
+        self.clock.now = 59
+        self.assertEqual(self.cache.get_or_build(('lb', 1), build), 1)
+        self.clock.now = 60
+        self.assertIsNone(self.cache.get(('lb', 1)))
+        self.assertEqual(self.cache.get_or_build(('lb', 1), build), 2)
+
+    def test_evicts_least_recently_used(self):
+        for guild_id in (1, 2, 3):
+            self.cache.put(('lb', guild_id), guild_id)
+        self.cache.get(('lb', 1))
+        self.cache.put(('lb', 4), 4)
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get(('lb', 2)))
+        self.assertEqual(self.cache.get(('lb', 1)), 1)
+
+    def test_invalidate_drops_guild_and_global_pages(self):
+        self.cache.put(('lb', 1, False), 'local 1')
+        self.cache.put(('lb', None, False), 'global')
+        self.cache.put(('lbsquad', 2), 'squads 2')
+
+        self.cache.invalidate(guild_id=1)
+        self.assertIsNone(self.cache.get(('lb', 1, False)))
+        self.assertIsNone(self.cache.get(('lb', None, False)))
+        self.assertEqual(self.cache.get(('lbsquad', 2)), 'squads 2')
+
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_build_overlapping_an_invalidation_is_not_stored(self):
+        def build():
+            self.cache.invalidate(guild_id=1)
+            return 'stale'
+
+        self.assertEqual(self.cache.get_or_build(('lb', 1), build), 'stale')
+        self.assertIsNone(self.cache.get(('lb', 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()